@@ -1,83 +1,93 @@
 import streamlit as st
-import pandas as pd
 import os
 
-from midi_generator import MidiGenerator
-from audio_renderer import AudioRenderer
-from soundfont_audio_renderer import SoundFontAudioRenderer
+# Renderers, fluidsynth, mido and pandas are imported on first use so a cold start only pays for what it renders
 from markov_melody import MarkovMelodyGenerator
 from motif_melody import MotifMelodyGenerator
-
-import fluidsynth
-from scipy.io.wavfile import write
-
-# ----- Constants -----
-allowed_activities = ["work", "sleep", "free", "play", "family"]
-diurnal_energy = [
-    "Low", "Low", "Lowest", "Lowest", "Lowest", "Low",
-    "Rising", "Rising", "High", "High", "High", "High",
-    "Moderate", "Moderate", "High", "High", "High", "Moderate",
-    "Moderate", "Moderate", "Decreasing", "Decreasing", "Low", "Low"
-]
-bpm_mapping = {
-    "Lowest": 80, "Low": 90, "Rising": 110,
-    "Moderate": 120, "High": 140, "Decreasing": 100
-}
-
-def time_of_day_symbol(hour):
-    return ["🌙", "🌅", "☀️", "🌇"][min(hour // 6, 3)]
-
-def calculate_alignment(activity, energy):
-    rules = {
-        "sleep": ["Low", "Lowest"],
-        "work": ["High"],
-        "play": ["Moderate", "High"],
-        "family": ["Moderate", "Rising", "Decreasing"],
-        "free": ["Moderate", "Decreasing"]
-    }
-    if energy in rules.get(activity, []):
-        return "✅ Enhance"
-    if activity == "work" and energy in ["Low", "Lowest", "Decreasing"]:
-        return "❌ Oppose"
-    if activity == "sleep" and energy in ["High", "Rising"]:
-        return "❌ Oppose"
-    if activity == "play" and energy in ["Low", "Lowest"]:
-        return "❌ Oppose"
-    return "⚪ Neutral"
-
-def alignment_modifier(alignment, energy):
-    if "Enhance" in alignment:
-        return 10 if energy in ["High", "Rising"] else -10
-    if "Oppose" in alignment:
-        return -10 if energy in ["High", "Rising"] else 10
-    return 0
-
-def calculate_bpm(energy, alignment):
-    bpm_value = bpm_mapping[energy] + alignment_modifier(alignment, energy)
-    return max(min(bpm_value, 160), 80)
+from render_cache import RenderCache, make_cache_key
+from instrumentation import DISABLED, Profiler
+from schedule_planner import plan_schedules
+from mood_schedule import (
+    DEFAULT_SCHEDULE, allowed_activities, diurnal_energy, time_of_day_symbol,
+    calculate_alignment, calculate_bpm, song_key, scale_midi_notes
+)
 
 # ----- Streamlit UI -----
 st.title("🎵 Mood Ring Music")
 
-import os
-
 def is_streamlit_cloud():
     return "STREAMLIT_SERVER_URL" in os.environ or "STREMLIT_SHARE_ENV" in os.environ
 
+@st.cache_resource
+def get_render_cache():
+    return RenderCache()
+
+@st.cache_resource
+def get_sample_renderer():
+    # Loads samples/ once per process; reruns and sessions share it along with its pitch and chord caches
+    from audio_renderer import AudioRenderer
+    return AudioRenderer()
+
+@st.cache_resource
+def get_audition_bank():
+    # Pre-rendered clips of every GM program (audition_bank.py); None until the bank has been built
+    from audition_bank import DEFAULT_BANK_PATH, AuditionBank
+    path = os.environ.get("MOODRING_AUDITION_BANK", DEFAULT_BANK_PATH)
+    return AuditionBank(path) if os.path.exists(path) else None
+
+@st.cache_resource
+def get_markov_model(scale_type):
+    # Corpus-trained model from train_markov.py if one exists; None falls back to the built-in step model
+    from train_markov import load_trained_model
+    return load_trained_model(os.environ.get("MOODRING_MODEL_DIR", "models"), scale_type)
+
+renderer_name, instrument_program = "sample", None
 if is_streamlit_cloud():
     st.info("🌐 Running on Streamlit Cloud")
-    audio_renderer = AudioRenderer()
 else:
     st.info("🖥️ Running Locally")
     renderer_choice = st.radio("Select Audio Engine", ["Sample-Based", "SoundFont"])
     if renderer_choice == "SoundFont":
         instrument_program = st.slider("🎹 Instrument Program (0-127)", 0, 127, value=0)
-        audio_renderer = SoundFontAudioRenderer(
+        renderer_name = "soundfont"
+        audition_bank = get_audition_bank()
+        if audition_bank is not None and instrument_program in audition_bank:
+            # Sliced straight from the memory-mapped bank: the timbre is audible before any song render
+            st.audio(audition_bank.wav(instrument_program), format="audio/wav")
+
+fast_preview = st.sidebar.checkbox("⚡ Fast preview", value=True,
+                                   help="Play a quick low-rate preview first and swap in full quality when it is ready")
+show_performance = st.sidebar.checkbox("⏱️ Show performance", value=False)
+profiler = Profiler(track_memory=True) if show_performance else DISABLED
+profiler.start_memory_tracking()
+
+@st.cache_resource
+def get_soundfont_timing():
+    # SoundFont renderers are built per render; one timing record lets previews report their speedup
+    from preview import RenderTiming
+    return RenderTiming()
+
+@st.cache_resource
+def get_full_render_executor():
+    # Full-quality renders behind a preview run here and land in the render cache
+    from concurrent.futures import ThreadPoolExecutor
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="full-render")
+
+# Renderers are only built on a cache miss
+def make_audio_renderer(profiler=profiler):
+    if renderer_name == "soundfont":
+        from soundfont_audio_renderer import SoundFontAudioRenderer
+        from synth_pool import get_synth_pool
+        # Synths (and the loaded SoundFont) come from a process-wide pool shared by every session
+        pool = get_synth_pool("soundfonts/FluidR3_GM.sf2", size=int(os.environ.get("MOODRING_SYNTH_POOL_SIZE", 2)))
+        return SoundFontAudioRenderer(
             soundfont_path="soundfonts/FluidR3_GM.sf2",
-            program=instrument_program
+            program=instrument_program,
+            pool=pool,
+            profiler=profiler,
+            timing=get_soundfont_timing()
         )
-    else:
-        audio_renderer = AudioRenderer()
+    return get_sample_renderer().with_profiler(profiler)
 
 if is_streamlit_cloud():
     st.info("🌐 Running on Streamlit Cloud")
@@ -86,8 +96,7 @@ else:
 if "current_hour" not in st.session_state:
     st.session_state.current_hour = 7
 if "activity_schedule" not in st.session_state:
-    st.session_state.activity_schedule = ["sleep"] * 6 + ["family"] * 2 + ["work"] * 4 + \
-        ["free"] * 2 + ["work"] * 3 + ["family"] * 2 + ["play"] * 2 + ["free", "sleep", "sleep"]
+    st.session_state.activity_schedule = list(DEFAULT_SCHEDULE)
 
 current_hour = st.session_state.current_hour
 current_energy = diurnal_energy[current_hour]
@@ -115,56 +124,107 @@ with col2:
 melody_method = st.selectbox("🎶 Select Melody Generator", ["Markov", "Motif"])
 melody_length = st.slider("🎼 Melody Length (notes)", min_value=8, max_value=64, value=16, step=4)
 audio_duration = st.slider("⏱️ Audio Duration (seconds)", min_value=10, max_value=60, value=30, step=5)
+melody_seed = int(st.number_input("🎲 Melody Seed", min_value=0, max_value=2**31 - 1, value=0, step=1))
 
-key_root, scale_type = MidiGenerator.KEY_MAPPINGS.get(
-    (alignment.replace('✅ ', '').replace('❌ ', '').replace('⚪ ', ''), current_energy),
-    ("C", "major")
-)
-
-scale_notes = MidiGenerator.NOTE_MAP
-scale_intervals = MidiGenerator.SCALES[scale_type]
-scale_midi_notes = [scale_notes[key_root] + i for i in scale_intervals]
+key_root, scale_type = song_key(alignment, current_energy)
+scale_notes = scale_midi_notes(key_root, scale_type)
 
 if melody_method == "Markov":
-    melody_generator = MarkovMelodyGenerator(scale_midi_notes)
+    melody_generator = MarkovMelodyGenerator(scale_notes, seed=melody_seed, model=get_markov_model(scale_type))
 else:
-    melody_generator = MotifMelodyGenerator(scale_midi_notes)
+    melody_generator = MotifMelodyGenerator(scale_notes, seed=melody_seed)
 
-melody_notes = melody_generator.generate_melody(length=melody_length)
+with profiler.stage("melody"):
+    melody_notes = melody_generator.generate_melody(length=melody_length)
 
-# Audio and MIDI Generation
-#audio_renderer = AudioRenderer()
-audio_wave = audio_renderer.generate_song_audio(
+# Audio and MIDI Generation, served from the render cache when the musical parameters are unchanged
+render_cache = get_render_cache()
+song_params = dict(
     bpm=current_bpm,
     key_root=key_root,
     scale_type=scale_type,
     melody_notes=melody_notes,
-    duration_sec=audio_duration
+    duration_sec=audio_duration,
+    energy=current_energy
 )
-audio_buffer = audio_renderer.export_wav(audio_wave)
-st.audio(audio_buffer, format="audio/wav")
 
-midi_gen = MidiGenerator(bpm=current_bpm, alignment=alignment, energy=current_energy)
-midi_gen.generate_song()
-midi_buffer = midi_gen.export()
+def render_wav(audio_renderer=None, params=song_params, seed=melody_seed):
+    audio_renderer = audio_renderer or make_audio_renderer()
+    audio_wave = audio_renderer.generate_song_audio(**params, seed=seed)
+    return audio_renderer.export_wav(audio_wave).getvalue()
+
+def render_midi():
+    from midi_generator import MidiGenerator
+    # Drum, pad and melody tracks matching the rendered audio
+    midi_gen = MidiGenerator(bpm=current_bpm, alignment=alignment, energy=current_energy, seed=melody_seed, profiler=profiler)
+    return midi_gen.export_arrangement(melody_notes, audio_duration, current_energy).getvalue()
+
+def cached_render(key, render):
+    # Counts render-cache hits for the performance panel; render() only runs on a miss
+    rendered = []
+    def counted_render():
+        rendered.append(key)
+        return render()
+    data = render_cache.get_or_render(key, counted_render)
+    profiler.count("render_cache_miss" if rendered else "render_cache_hit")
+    return data
+
+audio_key = make_cache_key(kind="wav", renderer=renderer_name, program=instrument_program, seed=melody_seed, **song_params)
+
+def start_full_render(key):
+    # One background render per session and key; reruns while it is pending reuse the same future
+    pending = st.session_state.get("full_render")
+    if pending is None or pending[0] != key:
+        # Executor threads have no ScriptRunContext, so st.cache_resource factories and session state are off
+        # limits there: the renderer (and the pool or shared sample library behind it) is built here
+        full_renderer = make_audio_renderer(DISABLED)
+        pending = (key, get_full_render_executor().submit(render_cache.get_or_render, key,
+                                                          lambda: render_wav(full_renderer)))
+        st.session_state.full_render = pending
+    return pending[1]
+
+@st.fragment(run_every=0.5)
+def swap_in_full_render(future):
+    if future.done():
+        st.rerun()
+    st.caption("⏳ Rendering full quality…")
+
+# A failed background render falls through to a foreground one, which shows the error
+pending = st.session_state.get("full_render")
+failed = pending is not None and pending[0] == audio_key and pending[1].done() and pending[1].exception() is not None
+if fast_preview and not failed and render_cache.get(audio_key) is None:
+    # Cache miss: play the opening measures at a reduced rate now, full quality follows from the background
+    preview_renderer = make_audio_renderer()
+    st.audio(preview_renderer.render_preview(**song_params, seed=melody_seed), format="audio/wav")
+    stats = preview_renderer.preview_stats()
+    speedup = f", ~{stats['speedup']:.0f}× sooner than full quality" if stats["speedup"] else ""
+    st.caption(f"⚡ Preview: {stats['audio_sec']:.1f}s at {stats['sample_rate'] / 1000:g} kHz "
+               f"in {stats['latency_sec'] * 1000:.0f} ms{speedup}")
+    swap_in_full_render(start_full_render(audio_key))
+else:
+    audio_buffer = cached_render(audio_key, render_wav)
+    st.audio(audio_buffer, format="audio/wav")
+
+midi_key = make_cache_key(kind="midi", **song_params)
+midi_buffer = cached_render(midi_key, render_midi)
 
 st.download_button("📥 Download MIDI", data=midi_buffer, file_name=f"hour_{current_hour:02d}.mid", mime="audio/midi")
 
-# Schedule Table
-combined_schedule = []
-for hour in range(24):
-    activity = st.session_state.activity_schedule[hour]
-    energy = diurnal_energy[hour]
-    align = calculate_alignment(activity, energy)
-    bpm = calculate_bpm(energy, align)
-    combined_schedule.append({
-        "Hour": f"{hour:02d}:00",
-        "🕒": time_of_day_symbol(hour),
-        "Alignment": align,
-        "Activity": activity,
-        "Diurnal Energy": energy,
-        "BPM": bpm
-    })
+if show_performance:
+    with st.expander("⏱️ Performance", expanded=True):
+        st.json(profiler.finish())
+
+# Schedule Table, planned for the whole day in one batch call
+combined_schedule = [{
+    "Hour": f"{row['hour']:02d}:00",
+    "🕒": time_of_day_symbol(row["hour"]),
+    "Alignment": row["alignment"],
+    "Activity": row["activity"],
+    "Diurnal Energy": row["energy"],
+    "BPM": row["bpm"]
+} for row in plan_schedules(st.session_state.activity_schedule).rows()]
+
+import pandas as pd
 
 df = pd.DataFrame(combined_schedule)
 st.subheader("📋 Full 24-Hour Schedule")
@@ -1,48 +1,88 @@
 import numpy as np
+import copy
 import io
-import os
-from scipy.io.wavfile import read, write
-from scipy.signal import resample
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import DISABLED
+from midi_generator import MidiGenerator
+from pitch_cache import PITCH_CACHE, RESAMPLE_MODES, resample_to_length
+from sample_bank import SampleBank, midi_to_freq
+from streaming import tile
+from event_table import Arrangement, MixBus, SourceBank, make_events, mix_parallel, mix_window, peak_level, render_cycle
+from oscillator_bank import OscillatorBank
+from preview import PREVIEW_MEASURES, PREVIEW_RESAMPLE_MODE, PREVIEW_SAMPLE_RATE, RenderTiming, preview_duration
+from wav_writer import WavWriter, iter_wav_chunks, write_wav
+
+NORMALIZE_MODES = ("peak", "headroom")
 
 class AudioRenderer:
-    def __init__(self, sample_rate=44100, sample_folder="samples"):
+    channels = 1
+
+    def __init__(self, sample_rate=44100, sample_folder="samples", resample_mode="fft", pitch_cache=None,
+                 pad_waveform="sine", phase_lock=False, profiler=None, loop_mode=False, render_workers=1,
+                 segment_samples=None):
+        if resample_mode not in RESAMPLE_MODES:
+            raise ValueError(f"Unknown resample mode: {resample_mode}")
         self.sample_rate = sample_rate
         self.sample_folder = sample_folder
-        self.loaded_samples = {}
-        self._load_samples()
-
-    def _load_samples(self):
-        for filename in os.listdir(self.sample_folder):
-            if filename.endswith(".wav"):
-                note_name = filename.replace(".wav", "")
-                path = os.path.join(self.sample_folder, filename)
-                sr, data = read(path)
-                self.loaded_samples[note_name] = (sr, data.astype(np.float32) / 32768.0)
+        self.resample_mode = resample_mode
+        self.pitch_cache = pitch_cache if pitch_cache is not None else PITCH_CACHE
+        self.profiler = profiler or DISABLED
+        # Render one period of the arrangement and tile it, instead of synthesizing every beat. Only phase-locked
+        # pads ever repeat, so this takes effect with phase_lock=True (exact-pitch pads never line up again)
+        self.loop_mode = loop_mode
+        # float32 mix buffer reused by every render on this renderer (per thread)
+        self.mix_bus = MixBus()
+        # With more than one worker, a song is mixed as time segments on a thread pool (NumPy drops the GIL in
+        # the per-event kernels); output is identical to the serial mix. Copies of the renderer share the pool.
+        # Each segment repeats some per-window setup, so by default a song is cut into a few per worker
+        self.render_workers = render_workers
+        self.segment_samples = segment_samples
+        self.render_pool = ThreadPoolExecutor(render_workers, thread_name_prefix="mix") if render_workers > 1 else None
+        self.oscillators = OscillatorBank(sample_rate, waveform=pad_waveform, phase_lock=phase_lock)
+        # Indexed up front, read lazily: only samples that are actually played get loaded
+        self.samples = SampleBank(sample_folder, sample_rate, resample_mode)
+        self.timing = RenderTiming()
+        # Copies share the preview renderers, and the app renders from its script and worker threads at once
+        self._preview_renderers = {}
+        self._preview_lock = threading.Lock()
 
     def _pitch_shift_sample(self, base_sample, base_freq, target_freq, duration_sec):
         sr, data = base_sample
-        factor = target_freq / base_freq
+        # Pitch shift and sample-rate conversion happen in the same resample
+        factor = target_freq / base_freq * (sr / self.sample_rate)
         target_length = int(len(data) / factor)
-        resampled = resample(data, target_length)
+        resampled = resample_to_length(data, target_length, self.resample_mode)
         if len(resampled) < int(self.sample_rate * duration_sec):
             resampled = np.pad(resampled, (0, int(self.sample_rate * duration_sec) - len(resampled)))
         return resampled[:int(self.sample_rate * duration_sec)]
 
+    def _pitched_note(self, note_name, midi_note, sample_length):
+        key = (self.samples.digest(note_name), midi_note, sample_length, self.sample_rate, self.resample_mode)
+
+        computed = []
+
+        def compute():
+            computed.append(key)
+            freq = midi_to_freq(midi_note)
+            with self.profiler.stage("pitch_shift"):
+                tone = self._pitch_shift_sample(self.samples.raw(note_name), self._note_to_freq(note_name), freq, sample_length / self.sample_rate)
+            if len(tone) < sample_length:
+                tone = np.pad(tone, (0, sample_length - len(tone)))
+            return tone[:sample_length]
+
+        tone = self.pitch_cache.get(key, compute)
+        self.profiler.count("pitch_cache_miss" if computed else "pitch_cache_hit")
+        return tone
+
     def _note_to_freq(self, note_name):
-        note_freq_map = {"C4": 261.63, "E4": 329.63, "G4": 392.00}
-        return note_freq_map.get(note_name, 261.63)
+        return midi_to_freq(self.samples.root_note(note_name))
 
-    def _select_progression(self, energy):
+    def _select_progression(self, energy, seed=None):
         import random
-        progressions = {
-            "Lowest": [["C", "Am", "F", "G"]],
-            "Low": [["C", "Dm", "G", "C"]],
-            "Rising": [["C", "F", "G", "C"]],
-            "Moderate": [["C", "Am", "F", "G"]],
-            "High": [["C", "Em", "F", "G"]],
-            "Decreasing": [["C", "F", "Dm", "G"]]
-        }
-        return random.choice(progressions.get(energy, [["C", "F", "G", "C"]]))
+        return random.Random(seed).choice(MidiGenerator.PROGRESSIONS.get(energy, [MidiGenerator.DEFAULT_PROGRESSION]))
 
     def _chord_to_frequencies(self, chord):
         base_freqs = {"C": 261.63, "D": 293.66, "E": 329.63, "F": 349.23, 
@@ -57,7 +97,7 @@ class AudioRenderer:
         t = np.linspace(0, duration_sec, int(self.sample_rate * duration_sec), endpoint=False)
         return 0.3 * np.sign(np.sin(2 * np.pi * frequency * t))
 
-    def generate_song_audio(self, bpm, key_root="C", scale_type="major", melody_notes=None, duration_sec=30, energy="Moderate"):
+    def _song_measures(self, bpm, duration_sec):
         beats_per_sec = bpm / 60
         measure_beats = 4  # 4/4 Time
         measure_duration_sec = measure_beats / beats_per_sec
@@ -65,83 +105,261 @@ class AudioRenderer:
         # Snap to full measures for clean looping
         total_measures = max(1, int(duration_sec / measure_duration_sec))
         final_duration_sec = total_measures * measure_duration_sec
+        return total_measures, int(self.sample_rate * final_duration_sec)
 
-        # Recompute time array and related variables
-        t = np.linspace(0, final_duration_sec, int(self.sample_rate * final_duration_sec), endpoint=False)
-        beats_total = total_measures * measure_beats
-        modulation = (np.sin(2 * np.pi * beats_per_sec * t) > 0).astype(float)
+    def song_num_samples(self, bpm, duration_sec=30):
+        return self._song_measures(bpm, duration_sec)[1]
 
-        kick = np.zeros_like(t)
-        snare = np.zeros_like(t)
+    def _compile_arrangement(self, bpm, melody_notes=None, duration_sec=30, energy="Moderate", seed=None):
+        beats_per_sec = bpm / 60
+        measure_beats = 4  # 4/4 Time
+        total_measures, num_samples = self._song_measures(bpm, duration_sec)
+        beats_total = total_measures * measure_beats
         beat_samples = int(self.sample_rate / beats_per_sec)
 
-        for i in range(int(beats_total)):
-            start = i * beat_samples
-            end = start + beat_samples
-            if end > len(t):
-                end = len(t)
-            sample_length = end - start
-
-            if i % 4 == 0 and "kick" in self.loaded_samples:
-                sr, kick_sample = self.loaded_samples["kick"]
-                kick_data = kick_sample[:sample_length]
-                if len(kick_data) < sample_length:
-                    kick_data = np.pad(kick_data, (0, sample_length - len(kick_data)))
-                kick[start:end] += kick_data
-
-            if i % 4 == 2 and "snare" in self.loaded_samples:
-                sr, snare_sample = self.loaded_samples["snare"]
-                snare_data = snare_sample[:sample_length]
-                if len(snare_data) < sample_length:
-                    snare_data = np.pad(snare_data, (0, sample_length - len(snare_data)))
-                snare[start:end] += snare_data
-
-        # Chord Progressions (Pads)
-        progression = self._select_progression(energy)
-        chord_beats = len(progression)
-        pad = np.zeros_like(t)
-
-        for i in range(int(beats_total)):
-            current_chord = progression[i % chord_beats]
-            freqs = self._chord_to_frequencies(current_chord)
-            start = i * beat_samples
-            end = start + beat_samples
-            if end > len(t):
-                end = len(t)
-            for f in freqs:
-                pad[start:end] += 0.1 * np.sin(2 * np.pi * f * t[start:end])
-
-        # Melody Section
-        melody = np.zeros_like(t)
-        if melody_notes:
-            full_melody = (melody_notes * ((int(beats_total) // len(melody_notes)) + 1))[:int(beats_total)]
+        bank = SourceBank()
+        drums = []
+        for stem, beat_in_measure in (("kick", 0), ("snare", 2)):
+            if stem in self.samples:
+                data = self.samples.one_shot(stem)
+                drums.append((stem, beat_in_measure, bank.add(stem, data), len(data)))
+
+        progression = self._select_progression(energy, seed)
+        # The original pads read sin(2 pi f t) off np.linspace(0, song length, num_samples), whose step is a hair
+        # longer than 1 / sample_rate; scaling the frequencies keeps the oscillators on that same clock
+        time_scale = total_measures * measure_beats / beats_per_sec * self.sample_rate / num_samples
+        chord_freqs = np.array([self._chord_to_frequencies(chord) for chord in progression]) * time_scale
+        voices = chord_freqs.shape[1]
+
+        melody = None
+        if melody_notes and self.samples.nearest(60) is not None:
+            melody = np.asarray(melody_notes)
             note_duration_sec = 60 / bpm
+            note_samples = int(note_duration_sec * self.sample_rate)
+
+        def melody_source(midi_note, sample_length):
+            key = (midi_note, sample_length)
+            if key not in bank.ids:
+                # Shift from the nearest-pitched sample to keep the resample ratio small
+                bank.add(key, self._pitched_note(self.samples.nearest(int(midi_note)), midi_note, sample_length))
+            return bank.ids[key]
+
+        def compile_window(window_start, window_end):
+            # Only beats that can touch [window_start, window_end); every event lasts at most one beat
+            first = max(0, window_start // beat_samples - 1)
+            beats = np.arange(first, min(beats_total, window_end // beat_samples + 2))
+            events = []
+
+            # Drums: one hit per beat slot, cut off at the next beat
+            beat_onsets = beats * beat_samples
+            beat_lengths = np.minimum(beat_samples, num_samples - beat_onsets)
+            for stem, beat_in_measure, source, sample_length in drums:
+                hits = beats % 4 == beat_in_measure
+                lengths = np.minimum(beat_lengths[hits], sample_length)
+                events.append(make_events(beat_onsets[hits], lengths, stem, source, 1.0))
+
+            # Chord Progressions (Pads): one oscillator event per chord tone per beat
+            chords = beats % len(progression)
+            pad = make_events(
+                np.repeat(beat_onsets, voices), np.repeat(beat_lengths, voices), "pad",
+                np.tile(np.arange(voices), len(beats)), 0.1, chord_freqs[chords].ravel()
+            )
+            pad["phase"] = self.oscillators.start_phases(chord_freqs, beat_samples, beats).ravel()
+            events.append(pad)
+
+            # Melody Section: one pitch-shift per distinct note, reused by every occurrence
+            if melody is not None:
+                note_start = note_duration_sec * self.sample_rate
+                notes = np.arange(max(0, int(window_start // note_start) - 1),
+                                  min(beats_total, int(window_end // note_start) + 2))
+                onsets = (notes * note_duration_sec * self.sample_rate).astype(np.int64)
+                next_onsets = ((notes + 1) * note_duration_sec * self.sample_rate).astype(np.int64)
+                tone_lengths = np.minimum(note_samples, num_samples - onsets)
+                # A fractional note duration can put the next onset before this note's end; the next note
+                # takes over there, as it overwrote the tail in the original per-note loop
+                lengths = np.minimum(tone_lengths, next_onsets - onsets)
+                midi_notes = melody[notes % len(melody)]
+                sources = np.empty(len(notes), dtype=np.int32)
+                freqs = np.empty(len(notes))
+                for midi_note, sample_length in set(zip(midi_notes.tolist(), tone_lengths.tolist())):
+                    mask = (midi_notes == midi_note) & (tone_lengths == sample_length)
+                    sources[mask] = melody_source(midi_note, sample_length)
+                    freqs[mask] = 440.0 * (2 ** ((midi_note - 69) / 12))
+                events.append(make_events(onsets, lengths, "melody", sources, 0.8, freqs))
+
+            return np.concatenate(events)
 
-            for i, midi_note in enumerate(full_melody):
-                freq = 440.0 * (2 ** ((midi_note - 69) / 12))
-                start = int(i * note_duration_sec * self.sample_rate)
-                end = start + int(note_duration_sec * self.sample_rate)
-                if end > len(t):
-                    end = len(t)
-                sample_length = end - start
-
-                base_sample = self.loaded_samples.get("C4")
-                if base_sample:
-                    tone = self._pitch_shift_sample(base_sample, self._note_to_freq("C4"), freq, sample_length / self.sample_rate)
-                    if len(tone) < sample_length:
-                        tone = np.pad(tone, (0, sample_length - len(tone)))
-                    melody[start:end] = tone[:sample_length]
-
-            melody *= 0.8
-
-        # Final Mix and Normalize
-        combined = kick + snare + pad + melody
-        combined = combined / np.max(np.abs(combined))
-        audio_wave = (combined * 32767).astype(np.int16)
+        # Drums repeat every measure, pads every progression and the melody every len(melody) beats. Phase-locked
+        # pads restart every beat; free-running ones never line up again, so only the former loop
+        period = None
+        if self.oscillators.phase_lock:
+            period_beats = math.lcm(measure_beats, len(progression), len(melody) if melody is not None else 1)
+            if (period_beats + 1) * beat_samples <= num_samples:
+                period = period_beats * beat_samples
+
+        def headroom():
+            # Kick and snare never overlap and each melody note ends where the next begins, so at most one drum
+            # hit, every pad voice and one melody note sound at once; their peaks summed bound the mix
+            drum_peak = max((peak_level(bank.buffers[source]) for _, _, source, _ in drums), default=0.0)
+            pad_peak = voices * 0.1 * peak_level(self.oscillators.table)
+            melody_peak = 0.0
+            if melody is not None:
+                length = min(note_samples, num_samples)
+                melody_peak = 0.8 * max(peak_level(bank.buffers[melody_source(midi_note, length)])
+                                        for midi_note in set(melody.tolist()))
+            return drum_peak + pad_peak + melody_peak
+
+        return Arrangement(self.sample_rate, num_samples, compile_window, bank, self.oscillators, self.profiler,
+                           period, headroom)
+
+    def _segment_samples(self, num_samples):
+        if self.segment_samples:
+            return self.segment_samples
+        return max(1 << 15, -(-num_samples // (4 * self.render_workers)))
+
+    def _loop_cycle(self, arrangement):
+        if not self.loop_mode or arrangement.period is None:
+            return None
+        with self.profiler.stage("loop_cycle"):
+            return render_cycle(arrangement)
+
+    def generate_song_audio(self, bpm, key_root="C", scale_type="major", melody_notes=None, duration_sec=30, energy="Moderate",
+                            seed=None):
+        with self.timing.full(self.song_num_samples(bpm, duration_sec) / self.sample_rate):
+            return self._render_song(bpm, melody_notes, duration_sec, energy, seed)
+
+    def _render_song(self, bpm, melody_notes, duration_sec, energy, seed=None):
+        with self.profiler.stage("arrange"):
+            arrangement = self._compile_arrangement(bpm, melody_notes, duration_sec, energy, seed)
+        cycle = self._loop_cycle(arrangement)
+        if cycle is None:
+            bus = self.mix_bus.buffer(arrangement.num_samples)
+            if self.render_pool is None:
+                combined = mix_window(arrangement, 0, arrangement.num_samples, bus)
+            else:
+                combined = mix_parallel(arrangement, 0, arrangement.num_samples, bus, self.render_pool,
+                                        self._segment_samples(arrangement.num_samples))
+        else:
+            first, looped = cycle
+            combined = self.mix_bus.buffer(arrangement.num_samples)
+            combined[:len(first)] = first
+            for start in range(len(first), len(combined), len(looped)):
+                tile_end = min(start + len(looped), len(combined))
+                combined[start:tile_end] = looped[:tile_end - start]
+
+        # Final Mix and Normalize, in place on the bus; the int16 output is the only new full-length buffer
+        with self.profiler.stage("normalize"):
+            combined /= peak_level(combined)
+            combined *= 32767
+            audio_wave = combined.astype(np.int16)
         return audio_wave
 
+    def iter_song_blocks(self, bpm, key_root="C", scale_type="major", melody_notes=None, duration_sec=30,
+                         energy="Moderate", block_size=4096, dtype=np.int16, peak=None, normalize="peak", seed=None):
+        # normalize="peak" scales by the song's true peak, exactly as generate_song_audio does, which takes a
+        # peak-only pre-pass over the whole song (one period in loop mode) before the first block.
+        # normalize="headroom" scales by an upper bound read off the arrangement instead: the first block
+        # comes out after one block of work whatever the song length, but the song is somewhat quieter
+        if normalize not in NORMALIZE_MODES:
+            raise ValueError(f"Unknown normalization: {normalize}")
+        arrangement = self._compile_arrangement(bpm, melody_notes, duration_sec, energy, seed)
+        num_samples = arrangement.num_samples
+        if peak is None and normalize == "headroom":
+            peak = arrangement.headroom()
+        cycle = self._loop_cycle(arrangement)
+
+        if cycle is not None:
+            # Loop mode holds two periods and tiles them lazily; the peak is read off the parts actually played
+            first, looped = cycle
+            if peak is None:
+                peak = max(peak_level(first), peak_level(looped[:num_samples - len(first)]))
+            blocks = tile(first, looped, num_samples, block_size)
+        else:
+            # Normalization gain comes from a peak-only pre-pass, so neither pass holds the whole song
+            if peak is None:
+                scan_size = 16 * block_size
+                peak = max(peak_level(mix_window(arrangement, start, start + scan_size, self.mix_bus.buffer(scan_size)))
+                           for start in range(0, num_samples, scan_size))
+            blocks = (mix_window(arrangement, start, start + block_size, self.mix_bus.buffer(block_size))
+                      for start in range(0, num_samples, block_size))
+
+        # Blocks may be views of the reused bus: scale in place, hand out a copy
+        for block in blocks:
+            block /= peak
+            if np.dtype(dtype) == np.int16:
+                block *= 32767
+                yield block.astype(np.int16)
+            else:
+                yield block.astype(dtype)
+
+    def write_song_wav(self, fileobj, bpm, key_root="C", scale_type="major", melody_notes=None, duration_sec=30,
+                       energy="Moderate", block_size=4096, normalize="peak", seed=None):
+        # Streams the song into fileobj block by block; the header is exact, so fileobj need not be seekable
+        blocks = self.iter_song_blocks(bpm, key_root, scale_type, melody_notes, duration_sec, energy,
+                                       block_size, dtype=np.float32, normalize=normalize, seed=seed)
+        with self.profiler.stage("wav_stream"):
+            return write_wav(fileobj, blocks, self.sample_rate, num_frames=self.song_num_samples(bpm, duration_sec))
+
+    def iter_song_wav(self, bpm, key_root="C", scale_type="major", melody_notes=None, duration_sec=30,
+                      energy="Moderate", block_size=4096, normalize="peak", seed=None):
+        # WAV file as a stream of byte chunks, e.g. for a chunked HTTP response. With normalize="peak" the bytes
+        # equal export_wav(generate_song_audio(...)) for the same song
+        blocks = self.iter_song_blocks(bpm, key_root, scale_type, melody_notes, duration_sec, energy,
+                                       block_size, dtype=np.float32, normalize=normalize, seed=seed)
+        return iter_wav_chunks(blocks, self.sample_rate, num_frames=self.song_num_samples(bpm, duration_sec))
+
+    def render_preview(self, bpm, key_root="C", scale_type="major", melody_notes=None, duration_sec=30,
+                       energy="Moderate", sample_rate=PREVIEW_SAMPLE_RATE, measures=PREVIEW_MEASURES, seed=None):
+        # The opening measures at a reduced rate, as a WAV buffer, for playback while the full render runs.
+        # measures=None previews the whole song. Latency and speedup are reported by preview_stats()
+        renderer = self.preview_renderer(sample_rate).with_profiler(self.profiler)
+        preview_sec = preview_duration(bpm, duration_sec, measures)
+        audio_sec = renderer.song_num_samples(bpm, preview_sec) / sample_rate
+        song_sec = self.song_num_samples(bpm, duration_sec) / self.sample_rate
+        with self.timing.preview_render(sample_rate, audio_sec, song_sec), self.profiler.stage("preview"):
+            return renderer.export_wav(renderer._render_song(bpm, melody_notes, preview_sec, energy, seed))
+
+    def preview_stats(self):
+        return self.timing.preview_stats()
+
+    def preview_renderer(self, sample_rate=PREVIEW_SAMPLE_RATE):
+        # One reduced-rate renderer per rate, kept for the life of this renderer and its copies
+        with self._preview_lock:
+            if sample_rate not in self._preview_renderers:
+                self._preview_renderers[sample_rate] = self.at_sample_rate(sample_rate, PREVIEW_RESAMPLE_MODE)
+            return self._preview_renderers[sample_rate]
+
+    def at_sample_rate(self, sample_rate, resample_mode=None):
+        # Copy rendering at another rate; shares the sample library and the pitch cache (keyed by rate and mode)
+        resample_mode = resample_mode or self.resample_mode
+        if resample_mode not in RESAMPLE_MODES:
+            raise ValueError(f"Unknown resample mode: {resample_mode}")
+        if sample_rate == self.sample_rate and resample_mode == self.resample_mode:
+            return self
+        renderer = copy.copy(self)
+        renderer.sample_rate = sample_rate
+        renderer.resample_mode = resample_mode
+        renderer.samples = self.samples.at_rate(sample_rate, resample_mode)
+        oscillators = self.oscillators
+        renderer.oscillators = OscillatorBank(sample_rate, oscillators.waveform, oscillators.table_bits,
+                                              oscillators.phase_lock, oscillators.max_blocks)
+        renderer.mix_bus = MixBus()
+        renderer.timing = RenderTiming()
+        renderer._preview_renderers = {}
+        renderer._preview_lock = threading.Lock()
+        return renderer
+
+    def with_profiler(self, profiler):
+        # Shallow copy sharing the loaded samples and caches; lets one long-lived renderer serve profiled runs
+        renderer = copy.copy(self)
+        renderer.profiler = profiler or DISABLED
+        return renderer
+
     def export_wav(self, audio_data):
-        buffer = io.BytesIO()
-        write(buffer, self.sample_rate, audio_data)
-        buffer.seek(0)
+        with self.profiler.stage("wav_encode"):
+            buffer = io.BytesIO()
+            channels = audio_data.shape[1] if audio_data.ndim == 2 else 1
+            with WavWriter(buffer, self.sample_rate, channels, num_frames=len(audio_data)) as writer:
+                writer.write(audio_data)
+            buffer.seek(0)
         return buffer
\ No newline at end of file
@@ -0,0 +1,146 @@
+import argparse
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+from wav_writer import PCM_DTYPE, iter_wav_chunks
+
+AUDITION_MAGIC = b"MRAB"
+AUDITION_VERSION = 1
+# magic, version, channels, sample rate, clip count, byte offset of the PCM
+AUDITION_HEADER = struct.Struct("<4sHHIIQ")
+HEADER_BYTES = 32
+CLIP_DTYPE = np.dtype([
+    ("program", "<i4"),
+    ("note", "<i4"),
+    ("offset", "<i8"),   # first frame of the clip in the PCM block
+    ("frames", "<i8"),
+])
+
+GM_PROGRAMS = range(128)
+REFERENCE_NOTES = (48, 60, 72)  # C3, C4 (Middle C), C5
+DEFAULT_BANK_PATH = "soundfonts/FluidR3_GM.audition"
+
+
+def _aligned(size):
+    return -(-size // 8) * 8
+
+
+class AuditionBank:
+    # Short clips of every program playing a few reference notes, stored back to back in one file of
+    # interleaved int16 PCM. The file is memory-mapped: a clip is a view of it, nothing is decoded or copied
+    def __init__(self, path):
+        self.path = path
+        data = np.memmap(path, dtype=np.uint8, mode="r")
+        magic, version, channels, sample_rate, num_clips, pcm_offset = AUDITION_HEADER.unpack(
+            data[:AUDITION_HEADER.size].tobytes())
+        if magic != AUDITION_MAGIC:
+            raise ValueError(f"Not an audition bank: {path}")
+        if version != AUDITION_VERSION:
+            raise ValueError(f"Unsupported audition bank version: {version}")
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.index = data[HEADER_BYTES:HEADER_BYTES + num_clips * CLIP_DTYPE.itemsize].view(CLIP_DTYPE)
+        self.pcm = data[pcm_offset:].view(PCM_DTYPE).reshape(-1, channels)
+        self.positions = {(int(program), int(note)): i for i, (program, note) in
+                          enumerate(zip(self.index["program"], self.index["note"]))}
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, program):
+        return bool((self.index["program"] == program).any())
+
+    def programs(self):
+        return np.unique(self.index["program"]).tolist()
+
+    def notes(self, program):
+        return self.index["note"][self.index["program"] == program].tolist()
+
+    def clip(self, program, note=None):
+        # (frames, channels) int16 view; without a note, every reference note of the program in turn,
+        # which the builder stores contiguously
+        if note is not None:
+            entry = self.index[self.positions[(program, note)]]
+            start, end = int(entry["offset"]), int(entry["offset"] + entry["frames"])
+        else:
+            entries = self.index[self.index["program"] == program]
+            if not len(entries):
+                raise KeyError(program)
+            start, end = int(entries["offset"].min()), int((entries["offset"] + entries["frames"]).max())
+        return self.pcm[start:end]
+
+    def wav(self, program, note=None):
+        clip = self.clip(program, note)
+        return b"".join(iter_wav_chunks([clip], self.sample_rate, self.channels, num_frames=len(clip)))
+
+
+def render_clip(synth, sample_rate, program, note, note_sec=0.3, tail_sec=0.5, velocity=100):
+    # One note from a freshly reset synth: a long release (pads, strings, reverb) cut off at the end of the
+    # previous clip would otherwise ring on into this one
+    from soundfont_sequencer import SoundFontSequencer, sequence_from_notes
+
+    synth.reset(0, program)
+    sequencer = SoundFontSequencer(synth.fs, synth.sfid, sample_rate)
+    return sequencer.render(sequence_from_notes([(0.0, note_sec, note, velocity, 0)], sample_rate), tail_sec)
+
+
+def build_audition_bank(path=DEFAULT_BANK_PATH, soundfont_path="soundfonts/FluidR3_GM.sf2", sample_rate=44100,
+                        programs=GM_PROGRAMS, notes=REFERENCE_NOTES, note_sec=0.3, tail_sec=0.5, velocity=100,
+                        progress=None):
+    # Renders every (program, note) clip offline and writes the bank; returns the number of clips.
+    # The file is assembled under a temporary name so readers never map a half-written bank
+    from synth_pool import PooledSynth
+
+    programs, notes = list(programs), list(notes)
+    index = np.zeros(len(programs) * len(notes), dtype=CLIP_DTYPE)
+    pcm_offset = HEADER_BYTES + _aligned(index.nbytes)
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+
+    synth = PooledSynth(soundfont_path, sample_rate)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.seek(pcm_offset)
+            position, channels = 0, 1
+            for i, (program, note) in enumerate((program, note) for program in programs for note in notes):
+                clip = render_clip(synth, sample_rate, program, note, note_sec, tail_sec, velocity)
+                channels = clip.shape[1] if clip.ndim == 2 else 1
+                f.write(np.ascontiguousarray(clip, dtype=PCM_DTYPE).tobytes())
+                index[i] = (program, note, position, len(clip))
+                position += len(clip)
+                if progress is not None:
+                    progress(program, note)
+            f.seek(0)
+            f.write(AUDITION_HEADER.pack(AUDITION_MAGIC, AUDITION_VERSION, channels, sample_rate, len(index),
+                                         pcm_offset).ljust(HEADER_BYTES, b"\0"))
+            f.write(index.tobytes())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    finally:
+        synth.delete()
+    return len(index)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-render instrument audition clips for every GM program.")
+    parser.add_argument("--out", default=DEFAULT_BANK_PATH)
+    parser.add_argument("--soundfont", default="soundfonts/FluidR3_GM.sf2")
+    parser.add_argument("--sample-rate", type=int, default=44100)
+    parser.add_argument("--notes", type=int, nargs="+", default=list(REFERENCE_NOTES))
+    parser.add_argument("--note-sec", type=float, default=0.3)
+    parser.add_argument("--tail-sec", type=float, default=0.5, help="Release time rendered after each note")
+    args = parser.parse_args(argv)
+
+    count = build_audition_bank(args.out, args.soundfont, args.sample_rate, notes=args.notes,
+                                note_sec=args.note_sec, tail_sec=args.tail_sec)
+    print(f"Wrote {count} clips ({os.path.getsize(args.out) / 1e6:.1f} MB) to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+import argparse
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from audio_renderer import AudioRenderer
+from markov_melody import MarkovMelodyGenerator
+from midi_generator import MidiGenerator
+from motif_melody import MotifMelodyGenerator
+from pitch_cache import PITCH_CACHE
+from preview import PREVIEW_SAMPLE_RATES
+
+SCALE = [60, 62, 64, 65, 67, 69, 71]
+MELODY = [60, 62, 64, 65, 67, 69, 71, 72, 71, 69, 67, 65, 64, 62, 60, 62]
+
+# What app.py imports before drawing its first widget
+APP_STARTUP_IMPORTS = "markov_melody, motif_melody, render_cache, instrumentation, schedule_planner, mood_schedule"
+# Modules the renderers import on first use; they are loaded before the cold trace so it counts buffers, not modules
+LAZY_IMPORTS = ("scipy.signal",)
+FIRST_AUDIO = (
+    "from audio_renderer import AudioRenderer; "
+    f"AudioRenderer().generate_song_audio(120, melody_notes={MELODY}, duration_sec=10)"
+)
+
+
+class Case:
+    # setup() builds whatever the case needs and returns the zero-argument callable that is timed
+    def __init__(self, name, setup, audio_sec=None, items=None):
+        self.name = name
+        self.setup = setup
+        self.audio_sec = audio_sec
+        self.items = items
+
+
+def audio_renderer_cases(bpms, durations):
+    cases = []
+    for bpm in bpms:
+        for duration in durations:
+            def setup(bpm=bpm, duration=duration):
+                renderer = AudioRenderer()
+                return lambda: renderer.generate_song_audio(bpm, melody_notes=MELODY, duration_sec=duration)
+            cases.append(Case(f"audio_renderer/bpm{bpm}/{duration}s", setup, audio_sec=duration))
+    return cases
+
+
+def loop_mode_cases(durations):
+    cases = []
+    for duration in durations:
+        def setup(duration=duration):
+            renderer = AudioRenderer(loop_mode=True, phase_lock=True)
+            return lambda: renderer.generate_song_audio(120, melody_notes=MELODY, duration_sec=duration)
+        cases.append(Case(f"audio_renderer_loop/bpm120/{duration}s", setup, audio_sec=duration))
+    return cases
+
+
+def parallel_cases(durations, workers=(2, 4)):
+    # Time-segmented mixing on a thread pool; compare against audio_renderer/bpm120 on a multi-core machine
+    cases = []
+    for count in workers:
+        for duration in durations:
+            def setup(count=count, duration=duration):
+                renderer = AudioRenderer(render_workers=count)
+                return lambda: renderer.generate_song_audio(120, melody_notes=MELODY, duration_sec=duration)
+            cases.append(Case(f"audio_renderer_threads{count}/bpm120/{duration}s", setup, audio_sec=duration))
+    return cases
+
+
+def preview_cases():
+    # Opening 4 measures of a 60 s song at 120 bpm, i.e. 8 s of audio
+    cases = []
+    for rate in PREVIEW_SAMPLE_RATES:
+        def setup(rate=rate):
+            renderer = AudioRenderer()
+            return lambda: renderer.render_preview(120, melody_notes=MELODY, duration_sec=60, sample_rate=rate)
+        cases.append(Case(f"audio_renderer_preview/{rate}hz/4measures", setup, audio_sec=8))
+    return cases
+
+
+def soundfont_cases(durations):
+    cases = []
+    for duration in durations:
+        def setup(duration=duration):
+            from soundfont_audio_renderer import SoundFontAudioRenderer
+            renderer = SoundFontAudioRenderer()
+            return lambda: renderer.generate_song_audio(120, melody_notes=MELODY, duration_sec=duration)
+        cases.append(Case(f"soundfont_renderer/bpm120/{duration}s", setup, audio_sec=duration))
+    return cases
+
+
+def melody_cases():
+    def markov_single():
+        generator = MarkovMelodyGenerator(SCALE, seed=0)
+        return lambda: [generator.generate_melody(64) for _ in range(1000)]
+
+    def markov_batch():
+        generator = MarkovMelodyGenerator(SCALE, seed=0)
+        return lambda: generator.generate_melodies(10000, 64)
+
+    def motif_single():
+        generator = MotifMelodyGenerator(SCALE, seed=0)
+        return lambda: [generator.generate_melody(64) for _ in range(1000)]
+
+    def motif_batch():
+        generator = MotifMelodyGenerator(SCALE, seed=0)
+        return lambda: generator.generate_melodies(10000, 64)
+
+    return [
+        Case("markov/single/1000x64", markov_single, items=1000),
+        Case("markov/batch/10000x64", markov_batch, items=10000),
+        Case("motif/single/1000x64", motif_single, items=1000),
+        Case("motif/batch/10000x64", motif_batch, items=10000),
+    ]
+
+
+def export_cases():
+    def midi_song():
+        def run():
+            midi_gen = MidiGenerator(bpm=120, seed=0)
+            midi_gen.generate_song()
+            return midi_gen.export()
+        return run
+
+    def midi_arrangement():
+        midi_gen = MidiGenerator(bpm=120, seed=0)
+        return lambda: midi_gen.export_arrangement(MELODY, duration_sec=600)
+
+    def wav_export():
+        renderer = AudioRenderer()
+        audio = renderer.generate_song_audio(120, melody_notes=MELODY, duration_sec=60)
+        return lambda: renderer.export_wav(audio)
+
+    def wav_stream():
+        # Render and encode block by block into a sink, so peak memory stays flat with duration
+        renderer = AudioRenderer()
+        def run():
+            with open(os.devnull, "wb") as sink:
+                renderer.write_song_wav(sink, 120, melody_notes=MELODY, duration_sec=600)
+        return run
+
+    return [
+        Case("midi/export/song", midi_song, items=1),
+        Case("midi/export_arrangement/600s", midi_arrangement, audio_sec=600),
+        Case("wav/export/60s", wav_export, audio_sec=60),
+        Case("wav/stream/600s", wav_stream, audio_sec=600),
+    ]
+
+
+def run_fresh_interpreter(code, *flags):
+    # Each run starts a new interpreter so nothing is already in sys.modules
+    return subprocess.run([sys.executable, *flags, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                          check=True, capture_output=True, text=True)
+
+
+def startup_cases():
+    def importing(modules):
+        return lambda: (lambda: run_fresh_interpreter(f"import {modules}"))
+
+    return [
+        Case("startup/import/app", importing(APP_STARTUP_IMPORTS), items=1),
+        Case("startup/import/audio_renderer", importing("audio_renderer"), items=1),
+        Case("startup/import/midi_generator", importing("midi_generator"), items=1),
+        Case("startup/first_audio/10s", lambda: (lambda: run_fresh_interpreter(FIRST_AUDIO)), items=1),
+    ]
+
+
+def all_cases(quick=False):
+    durations = [10, 60] if quick else [10, 60, 600]
+    return (audio_renderer_cases([80, 120, 160], durations) + loop_mode_cases(durations)
+            + parallel_cases(durations[1:]) + preview_cases()
+            + soundfont_cases(durations[:2])
+            + melody_cases() + export_cases() + startup_cases())
+
+
+def import_profile(modules, top=15):
+    # Parses python -X importtime: "import time: self [us] | cumulative | imported package"
+    stderr = run_fresh_interpreter(f"import {modules}", "-X", "importtime").stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def run_case(case, repeats):
+    # Every case starts from an empty pitch cache, so earlier cases cannot warm it
+    for module in LAZY_IMPORTS:
+        importlib.import_module(module)
+    PITCH_CACHE.clear()
+    try:
+        run = case.setup()
+    except Exception as error:  # e.g. pyfluidsynth or the SoundFont is not installed
+        return {"skipped": f"{type(error).__name__}: {error}"}
+
+    # The first run is traced cold: buffers kept between calls (mix bus, pitch cache, oscillator blocks) are
+    # allocated here, and whatever is still allocated once its result is dropped is what the caches retain
+    tracemalloc.start()
+    run()
+    retained_bytes, cold_peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Timings run untraced; the warm peak comes from one more traced run and leaves out the retained buffers
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    run()
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    wall = min(timings)
+    result = {
+        "wall_sec": wall,
+        "median_sec": statistics.median(timings),
+        "repeats": repeats,
+        "peak_bytes": peak_bytes,
+        "cold_peak_bytes": cold_peak_bytes,
+        "retained_bytes": retained_bytes,
+        "pitch_cache_bytes": PITCH_CACHE.stats()["bytes"],
+    }
+    if case.audio_sec:
+        # Seconds of compute per second of audio; below 1.0 is faster than real time
+        result["real_time_factor"] = wall / case.audio_sec
+    if case.items:
+        result["items_per_sec"] = case.items / wall
+    return result
+
+
+def run_benchmarks(quick=False, repeats=3, pattern=None):
+    results = {}
+    for case in all_cases(quick):
+        if pattern and pattern not in case.name:
+            continue
+        results[case.name] = run_case(case, repeats)
+        print(format_result(case.name, results[case.name]), flush=True)
+    return {
+        "environment": {
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+
+def format_result(name, result):
+    if "skipped" in result:
+        return f"{name:<40} skipped ({result['skipped']})"
+    line = (f"{name:<40} {result['wall_sec'] * 1000:10.1f} ms  peak {result['peak_bytes'] / 2 ** 20:8.1f} MiB"
+            f"  cold {result['cold_peak_bytes'] / 2 ** 20:8.1f} MiB  retained {result['retained_bytes'] / 2 ** 20:8.1f} MiB")
+    if "real_time_factor" in result:
+        line += f"  RTF {result['real_time_factor']:.4f}"
+    return line
+
+
+def compare(baseline, current, time_threshold=0.10, memory_threshold=0.10):
+    regressions = []
+    for name, now in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None or "skipped" in before or "skipped" in now:
+            continue
+        for key, threshold in (("wall_sec", time_threshold), ("peak_bytes", memory_threshold),
+                               ("cold_peak_bytes", memory_threshold), ("retained_bytes", memory_threshold)):
+            if key not in before or key not in now:  # baselines saved before cold runs were traced
+                continue
+            ratio = now[key] / before[key] if before[key] else 1.0
+            if ratio > 1 + threshold:
+                regressions.append((name, key, before[key], now[key], ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless benchmarks for renderers, melody generators and exporters.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the suite and save results as JSON")
+    run_parser.add_argument("--out", default="bench_results.json")
+    run_parser.add_argument("--quick", action="store_true", help="Skip the 600 s renders")
+    run_parser.add_argument("--repeats", type=int, default=3)
+    run_parser.add_argument("--filter", help="Only run cases whose name contains this text")
+
+    imports_parser = commands.add_parser("imports", help="Show the slowest imports of a fresh interpreter")
+    imports_parser.add_argument("modules", nargs="?", default=APP_STARTUP_IMPORTS)
+    imports_parser.add_argument("--top", type=int, default=15)
+
+    compare_parser = commands.add_parser("compare", help="Flag regressions against a stored baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--time-threshold", type=float, default=0.10)
+    compare_parser.add_argument("--memory-threshold", type=float, default=0.10)
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        report = run_benchmarks(args.quick, args.repeats, args.filter)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved {len(report['results'])} results to {args.out}")
+        return 0
+    if args.command == "imports":
+        print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+        for cumulative_us, self_us, name in import_profile(args.modules, args.top):
+            print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:8.1f}  {name}")
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    regressions = compare(baseline, current, args.time_threshold, args.memory_threshold)
+    for name, key, before, now, ratio in regressions:
+        print(f"REGRESSION {name} {key}: {before:.6g} -> {now:.6g} ({ratio:.2f}x)")
+    if not regressions:
+        print("No regressions")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
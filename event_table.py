@@ -0,0 +1,194 @@
+import threading
+
+import numpy as np
+
+from instrumentation import DISABLED
+
+EVENT_DTYPE = np.dtype([
+    ("onset", np.int64),    # first sample of the event
+    ("length", np.int64),   # number of samples the event writes
+    ("stem", np.int8),      # index into STEMS
+    ("source", np.int32),   # SourceBank id for sampled stems, voice slot for oscillators
+    ("gain", np.float64),
+    ("pitch", np.float64),  # Hz, 0 for unpitched hits
+    ("phase", np.uint64),   # oscillator start phase, 32-bit fixed point
+])
+
+STEMS = ("kick", "snare", "pad", "melody")
+OSCILLATOR_STEMS = ("pad",)
+
+
+def make_events(onsets, lengths, stem, source, gain, pitch=0.0):
+    onsets = np.asarray(onsets, dtype=np.int64)
+    events = np.zeros(len(onsets), dtype=EVENT_DTYPE)
+    events["onset"] = onsets
+    events["length"] = lengths
+    events["stem"] = STEMS.index(stem)
+    events["source"] = source
+    events["gain"] = gain
+    events["pitch"] = pitch
+    return events
+
+
+class SourceBank:
+    def __init__(self):
+        self.ids = {}
+        self.buffers = []
+        self._packed = None
+
+    def add(self, key, data):
+        if key not in self.ids:
+            self.ids[key] = len(self.buffers)
+            self.buffers.append(np.asarray(data, dtype=np.float32))
+            self._packed = None
+        return self.ids[key]
+
+    def length(self, source_id):
+        return len(self.buffers[source_id])
+
+    def pack(self):
+        # One flat array lets every event of a stem be gathered in a single fancy-index. Buffers are only
+        # appended, so a pack holding fewer of them than the bank is stale, even if another thread stored it
+        packed = self._packed
+        if packed is None or len(packed[1]) < len(self.buffers):
+            buffers = list(self.buffers)
+            lengths = np.array([len(b) for b in buffers], dtype=np.int64)
+            offsets = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+            data = np.concatenate(buffers) if buffers else np.zeros(0)
+            packed = self._packed = (data, offsets)
+        return packed
+
+
+class Arrangement:
+    def __init__(self, sample_rate, num_samples, compile_window, bank, oscillators, profiler=DISABLED, period=None,
+                 headroom=None):
+        self.sample_rate = sample_rate
+        self.num_samples = num_samples
+        # Samples after which the arrangement repeats exactly, None when it never does
+        self.period = period
+        # Callable returning an upper bound on the mix's peak without mixing it, None when there is none
+        self.headroom = headroom
+        self.compile_window = compile_window
+        self.bank = bank
+        self.oscillators = oscillators
+        self.profiler = profiler
+
+    def events(self, window_start=0, window_end=None):
+        # Events are compiled per window so long songs never hold a full-length event table
+        if window_end is None:
+            window_end = self.num_samples
+        return self.compile_window(window_start, min(window_end, self.num_samples))
+
+
+def clip_to_window(events, window_start, window_end):
+    onsets = events["onset"]
+    starts = np.maximum(onsets, window_start)
+    ends = np.minimum(onsets + events["length"], window_end)
+    keep = ends > starts
+    return keep, starts[keep], ends[keep] - starts[keep], (starts - onsets)[keep]
+
+
+def render_sampled(events, bank, out, window_start=0):
+    keep, starts, lengths, skips = clip_to_window(events, window_start, window_start + len(out))
+    if len(starts) == 0:
+        return out
+    events = events[keep]
+    data, offsets = bank.pack()
+    # Every event is one contiguous slice, so it is added in place; no per-sample index arrays, and the
+    # only temporary is one event-sized scratch buffer
+    scratch = np.empty(int(lengths.max()), dtype=out.dtype)
+    sources = (offsets[events["source"]] + skips).tolist()
+    for start, length, src, gain in zip((starts - window_start).tolist(), lengths.tolist(), sources,
+                                        events["gain"].tolist()):
+        segment = data[src:src + length]
+        if gain != 1.0:
+            segment = np.multiply(segment, gain, out=scratch[:length])
+        out[start:start + length] += segment
+    return out
+
+
+def render_stem(arrangement, stem, out, window_start=0, events=None):
+    if events is None:
+        events = arrangement.events(window_start, window_start + len(out))
+    events = events[events["stem"] == STEMS.index(stem)]
+    if stem in OSCILLATOR_STEMS:
+        return arrangement.oscillators.render(events, out, window_start)
+    return render_sampled(events, arrangement.bank, out, window_start)
+
+
+class MixBus:
+    # Reusable float32 mix buffer, one per thread so a renderer shared between threads can mix concurrently.
+    # Windows longer than max_samples get a buffer of their own instead of growing the retained one
+    def __init__(self, max_samples=1 << 22):
+        self.max_samples = max_samples
+        self._local = threading.local()
+
+    def buffer(self, length):
+        if length > self.max_samples:
+            return np.zeros(length, dtype=np.float32)
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None or len(buffer) < length:
+            buffer = self._local.buffer = np.empty(length, dtype=np.float32)
+        out = buffer[:length]
+        out.fill(0)
+        return out
+
+
+def mix_events(arrangement, events, window_start, out):
+    # Every stem accumulates straight into the one bus, in the order the original per-beat mixer summed them
+    for stem in STEMS:
+        with arrangement.profiler.stage(stem):
+            render_stem(arrangement, stem, out, window_start, events)
+    return out
+
+
+def mix_window(arrangement, window_start, window_end, out=None):
+    window_end = min(window_end, arrangement.num_samples)
+    with arrangement.profiler.stage("compile_events"):
+        events = arrangement.events(window_start, window_end)
+    if out is None:
+        out = np.zeros(window_end - window_start, dtype=np.float32)
+    return mix_events(arrangement, events, window_start, out[:window_end - window_start])
+
+
+def mix_parallel(arrangement, window_start, window_end, out, executor, segment_samples):
+    # Same result as mix_window, bit for bit: the window is cut into segments that own disjoint slices of
+    # out, and each segment sums its events in the serial order. Splitting by stem instead would change the
+    # float32 summation order, and the pad stem outweighs the rest anyway
+    window_end = min(window_end, arrangement.num_samples)
+    with arrangement.profiler.stage("compile_events"):
+        events = arrangement.events(window_start, window_end)
+    # Compiling fills the source bank; pack it once here rather than racing to in every segment
+    arrangement.bank.pack()
+    out = out[:window_end - window_start]
+    ends = events["onset"] + events["length"]
+
+    def mix_segment(start):
+        end = min(start + segment_samples, window_end)
+        # A chord's voices share onset and length, so they are kept or dropped together
+        touching = events[(events["onset"] < end) & (ends > start)]
+        mix_events(arrangement, touching, start, out[start - window_start:end - window_start])
+
+    # list() re-raises the first failure from a worker
+    list(executor.map(mix_segment, range(window_start, window_end, segment_samples)))
+    return out
+
+
+def peak_level(audio):
+    # max(|audio|) without a full-length abs() temporary
+    return max(float(audio.max()), -float(audio.min())) if len(audio) else 0.0
+
+
+def render_cycle(arrangement):
+    # One period of a repeating arrangement, twice: as it opens the song, and as every later repeat
+    # sounds, with whatever rings past the period end folded back onto its start so the seams are seamless
+    period = arrangement.period
+    with arrangement.profiler.stage("compile_events"):
+        events = arrangement.events(0, period)
+        events = events[(events["onset"] >= 0) & (events["onset"] < period)]
+    end = max(period, int((events["onset"] + events["length"]).max())) if len(events) else period
+    cycle = mix_events(arrangement, events, 0, np.zeros(end, dtype=np.float32))
+    first = cycle[:period]
+    looped = first.copy()
+    looped[:end - period] += cycle[period:]
+    return first, looped
@@ -0,0 +1,154 @@
+import logging
+import threading
+import time
+import tracemalloc
+import weakref
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger("moodring.perf")
+
+_NULL_STAGE = nullcontext()
+
+
+class _MemoryTracker:
+    # tracemalloc has a single process-wide peak, shared by every profiler and thread. Open stages are kept
+    # here, and each stage entry or exit first folds the peak so far into every open stage before resetting
+    # it, so nested and concurrent stages each see the highest point reached while they were open.
+    # Both numbers are process-wide: allocations by other threads while a stage is open count towards it
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._open = []
+        self._users = 0
+        self._started = False
+
+    def acquire(self):
+        # Starts tracing for the first user unless something else already traces; the last release stops it
+        with self._lock:
+            if self._users == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started = True
+            self._users += 1
+
+    def release(self):
+        with self._lock:
+            self._users -= 1
+            if self._users == 0 and self._started:
+                tracemalloc.stop()
+                self._started = False
+                self._open.clear()
+
+    def _fold(self):
+        current, peak = tracemalloc.get_traced_memory()
+        for frame in self._open:
+            frame[1] = max(frame[1], peak)
+        tracemalloc.reset_peak()
+        return current
+
+    def enter(self):
+        # [start bytes, peak bytes] of a new stage, or None when nothing is tracing
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                return None
+            current = self._fold()
+            frame = [current, current]
+            self._open.append(frame)
+            return frame
+
+    def exit(self, frame):
+        # (net bytes, peak bytes above the start) of a stage, or (None, None) if tracing stopped meanwhile
+        with self._lock:
+            if not any(open_frame is frame for open_frame in self._open):
+                return None, None
+            current = self._fold()
+            self._open = [open_frame for open_frame in self._open if open_frame is not frame]
+            return current - frame[0], frame[1] - frame[0]
+
+
+_MEMORY = _MemoryTracker()
+
+
+class Profiler:
+    # Per-stage wall time, optional traced allocations and named counters (cache hits etc.).
+    # A disabled profiler hands out one shared no-op context, so instrumented code costs a method call
+    def __init__(self, enabled=True, track_memory=False, callback=None, log=False):
+        self.enabled = enabled
+        self.track_memory = track_memory
+        self.callback = callback
+        self.log = log
+        self._lock = threading.Lock()
+        self._release_memory = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.counters = {}
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_STAGE
+        return self._timed_stage(name)
+
+    @contextmanager
+    def _timed_stage(self, name):
+        frame = _MEMORY.enter() if self.track_memory else None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            net_bytes = peak_bytes = None
+            if frame is not None:
+                net_bytes, peak_bytes = _MEMORY.exit(frame)
+            self._record(name, elapsed, net_bytes, peak_bytes)
+
+    def _record(self, name, elapsed, net_bytes, peak_bytes):
+        with self._lock:
+            entry = self.stages.setdefault(name, {"calls": 0, "total_sec": 0.0})
+            entry["calls"] += 1
+            entry["total_sec"] += elapsed
+            if peak_bytes is not None:
+                entry["net_bytes"] = entry.get("net_bytes", 0) + net_bytes
+                entry["peak_bytes"] = max(entry.get("peak_bytes", 0), peak_bytes)
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def start_memory_tracking(self):
+        # Tracing slows every allocation, so it lasts only until finish(), or until this profiler is
+        # garbage collected if finish() is never reached
+        if self.enabled and self.track_memory and self._release_memory is None:
+            _MEMORY.acquire()
+            self._release_memory = weakref.finalize(self, _MEMORY.release)
+
+    def stop_memory_tracking(self):
+        if self._release_memory is not None:
+            self._release_memory()
+            self._release_memory = None
+
+    def report(self):
+        with self._lock:
+            return {
+                "stages": {name: dict(entry) for name, entry in self.stages.items()},
+                "counters": dict(self.counters),
+            }
+
+    def finish(self):
+        # Hand the collected numbers to the log and/or the user's metrics callback
+        self.stop_memory_tracking()
+        report = self.report()
+        if self.enabled and self.log:
+            for name, entry in report["stages"].items():
+                logger.info("stage %s: %d calls, %.2f ms, peak %s bytes",
+                            name, entry["calls"], entry["total_sec"] * 1000, entry.get("peak_bytes", "n/a"))
+            for name, value in report["counters"].items():
+                logger.info("counter %s: %s", name, value)
+        if self.enabled and self.callback is not None:
+            self.callback(report)
+        return report
+
+
+# Shared default for components built without a profiler
+DISABLED = Profiler(enabled=False)
@@ -1,20 +1,190 @@
-import random
+import struct
+from bisect import bisect_right
+
+import numpy as np
+
+MODEL_VERSION = 1
+
+# Binary model file: a 32-byte header, then indptr (int64), indices (int32), probs (float64) and the sampling
+# CDF (float64), each 8-byte aligned and stored in the dtypes MarkovModel uses, so loading maps the file instead
+# of parsing it. Version 1 files have no CDF; it is rebuilt when they are loaded
+BINARY_MAGIC = b"MRMK"
+BINARY_VERSION = 2
+BINARY_HEADER = struct.Struct("<4sHHIQQ")
+
+
+class MarkovModel:
+    # Order-k transition table over scale degrees, stored row-compressed (CSR) so dense and
+    # sparse models sample through the same cumulative-probability lookup
+    def __init__(self, num_degrees, order, indptr, indices, probs, cdf=None):
+        self.num_degrees = num_degrees
+        self.order = order
+        self.num_contexts = num_degrees ** order
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.probs = np.asarray(probs, dtype=np.float64)
+
+        row_lengths = np.diff(self.indptr)
+        if len(row_lengths) != self.num_contexts or (row_lengths == 0).any():
+            raise ValueError("Every context needs at least one outgoing transition")
+
+        # A CDF mapped from a binary model file is used as stored
+        self.cdf = self._build_cdf(row_lengths) if cdf is None else np.asarray(cdf, dtype=np.float64)
+        if len(self.cdf) != len(self.indices):
+            raise ValueError(f"CDF has {len(self.cdf)} entries for {len(self.indices)} transitions")
+        self._tables = None
+
+    def _build_cdf(self, row_lengths):
+        # Row-local CDFs shifted by their row number give one globally increasing table,
+        # so a whole batch is sampled with a single searchsorted
+        normalized = self.probs / np.repeat(np.add.reduceat(self.probs, self.indptr[:-1]), row_lengths)
+        running = np.cumsum(normalized)
+        local = running - np.repeat(running[self.indptr[:-1]] - normalized[self.indptr[:-1]], row_lengths)
+        local[self.indptr[1:] - 1] = 1.0
+        return np.repeat(np.arange(self.num_contexts), row_lengths) + local
+
+    @classmethod
+    def from_dense(cls, transitions, order=1):
+        transitions = np.asarray(transitions, dtype=np.float64)
+        num_degrees = transitions.shape[1]
+        rows, cols = np.nonzero(transitions)
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=len(transitions)))))
+        return cls(num_degrees, order, indptr, cols, transitions[rows, cols])
+
+    @classmethod
+    def from_steps(cls, num_degrees, step_probs):
+        # First-order model of relative moves, clamped at the ends of the scale
+        transitions = np.zeros((num_degrees, num_degrees))
+        for degree in range(num_degrees):
+            for step, prob in step_probs.items():
+                transitions[degree, max(0, min(num_degrees - 1, degree + step))] += prob
+        return cls.from_dense(transitions, order=1)
+
+    @classmethod
+    def from_counts(cls, counts, num_degrees, order, smoothing=0.0):
+        counts = np.asarray(counts, dtype=np.float64).reshape(num_degrees ** order, num_degrees) + smoothing
+        # Unseen contexts back off to the transitions seen after their most recent degree
+        unseen = counts.sum(axis=1) == 0
+        if unseen.any():
+            last_degree = np.arange(len(counts)) % num_degrees
+            backoff = np.zeros((num_degrees, num_degrees))
+            np.add.at(backoff, last_degree, counts)
+            backoff[backoff.sum(axis=1) == 0] = 1.0
+            counts[unseen] = backoff[last_degree[unseen]]
+        return cls.from_dense(counts / counts.sum(axis=1, keepdims=True), order)
+
+    @classmethod
+    def fit(cls, sequences, num_degrees, order=1, smoothing=0.0):
+        return cls.from_counts(count_transitions(sequences, num_degrees, order), num_degrees, order, smoothing)
+
+    def start_context(self, start_degrees):
+        # History before the first note is the first note repeated
+        start_degrees = np.asarray(start_degrees, dtype=np.int64)
+        return start_degrees * sum(self.num_degrees ** i for i in range(self.order))
+
+    def sample(self, count, length, start_degrees, rng):
+        degrees = np.empty((count, length), dtype=np.int32)
+        if length == 0:
+            return degrees
+        degrees[:, 0] = start_degrees
+        context = self.start_context(degrees[:, 0])
+        uniforms = rng.random((length - 1, count))
+        if count == 1:
+            degrees[0, 1:] = self._walk(int(context[0]), uniforms[:, 0])
+            return degrees
+        for step in range(1, length):
+            position = np.searchsorted(self.cdf, context + uniforms[step - 1], side="right")
+            position = np.clip(position, self.indptr[context], self.indptr[context + 1] - 1)
+            degrees[:, step] = self.indices[position]
+            context = (context * self.num_degrees + degrees[:, step]) % self.num_contexts
+        return degrees
+
+    def _walk(self, context, uniforms):
+        # Per-step NumPy overhead dominates a single chain; walk the same table with bisect instead
+        if self._tables is None:
+            self._tables = (self.cdf.tolist(), self.indptr.tolist(), self.indices.tolist())
+        cdf, indptr, indices = self._tables
+        walk = []
+        for u in uniforms.tolist():
+            position = min(max(bisect_right(cdf, context + u), indptr[context]), indptr[context + 1] - 1)
+            walk.append(indices[position])
+            context = (context * self.num_degrees + indices[position]) % self.num_contexts
+        return walk
+
+    def save(self, path):
+        np.savez_compressed(
+            path, version=MODEL_VERSION, num_degrees=self.num_degrees, order=self.order,
+            indptr=self.indptr, indices=self.indices.astype(np.uint8 if self.num_degrees <= 256 else np.int32),
+            probs=self.probs.astype(np.float32)
+        )
+
+    def save_binary(self, path):
+        arrays = (self.indptr.astype("<i8"), self.indices.astype("<i4"), self.probs.astype("<f8"), self.cdf.astype("<f8"))
+        with open(path, "wb") as f:
+            f.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, self.num_degrees, self.order,
+                                       len(self.indices), 0).ljust(32, b"\0"))
+            for array in arrays:
+                f.write(array.tobytes())
+                f.write(b"\0" * (_aligned(array.nbytes) - array.nbytes))
+
+    @classmethod
+    def load_binary(cls, path):
+        data = np.memmap(path, dtype=np.uint8, mode="r")
+        magic, version, num_degrees, order, nnz, _ = BINARY_HEADER.unpack(data[:BINARY_HEADER.size].tobytes())
+        if magic != BINARY_MAGIC:
+            raise ValueError(f"Not a Markov model file: {path}")
+        if version not in (1, BINARY_VERSION):
+            raise ValueError(f"Unsupported Markov model file version: {version}")
+        offset = 32
+        arrays = []
+        layout = [("<i8", num_degrees ** order + 1), ("<i4", nnz), ("<f8", nnz)] + [("<f8", nnz)] * (version > 1)
+        for dtype, count in layout:
+            size = np.dtype(dtype).itemsize * count
+            arrays.append(data[offset:offset + size].view(dtype))
+            offset += _aligned(size)
+        return cls(num_degrees, order, *arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if int(data["version"]) != MODEL_VERSION:
+                raise ValueError(f"Unsupported Markov model version: {int(data['version'])}")
+            return cls(int(data["num_degrees"]), int(data["order"]), data["indptr"], data["indices"], data["probs"])
+
+
+def _aligned(size):
+    return -(-size // 8) * 8
+
+
+def count_transitions(sequences, num_degrees, order=1):
+    counts = np.zeros(num_degrees ** (order + 1), dtype=np.int64)
+    weights = num_degrees ** np.arange(order, -1, -1)
+    for sequence in sequences:
+        sequence = np.asarray(sequence, dtype=np.int64)
+        if len(sequence) <= order:
+            continue
+        # Each (order + 1)-gram read as a base-num_degrees number is (context, next degree)
+        windows = np.lib.stride_tricks.sliding_window_view(sequence, order + 1)
+        counts += np.bincount(windows @ weights, minlength=len(counts))
+    return counts
+
 
 class MarkovMelodyGenerator:
-    def __init__(self, scale_notes):
+    def __init__(self, scale_notes, seed=None, model=None):
         self.scale_notes = scale_notes
+        self.rng = np.random.default_rng(seed)
         self.transition_prob = self._build_simple_transitions()
+        self.model = model or MarkovModel.from_steps(len(scale_notes), self.transition_prob)
+        if self.model.num_degrees != len(scale_notes):
+            raise ValueError(f"Model has {self.model.num_degrees} degrees but the scale has {len(scale_notes)} notes")
 
     def _build_simple_transitions(self):
         return {-1: 0.3, 0: 0.4, 1: 0.3}  # Move down, stay, move up
 
-    def generate_melody(self, length=16, start_note=None):
-        melody = []
-        current_idx = self.scale_notes.index(start_note) if start_note in self.scale_notes else len(self.scale_notes) // 2
-
-        for _ in range(length):
-            melody.append(self.scale_notes[current_idx])
-            move = random.choices(list(self.transition_prob.keys()), weights=self.transition_prob.values())[0]
-            current_idx = max(0, min(len(self.scale_notes) - 1, current_idx + move))
+    def generate_melodies(self, count, length=16, start_note=None):
+        start_idx = self.scale_notes.index(start_note) if start_note in self.scale_notes else len(self.scale_notes) // 2
+        degrees = self.model.sample(count, length, start_idx, self.rng)
+        return np.asarray(self.scale_notes)[degrees]
 
-        return melody
\ No newline at end of file
+    def generate_melody(self, length=16, start_note=None):
+        return self.generate_melodies(1, length, start_note)[0].tolist()
@@ -1,7 +1,10 @@
-import mido
 import io
 import random
 
+import numpy as np
+
+import smf_writer
+from instrumentation import DISABLED
 from markov_melody import MarkovMelodyGenerator
 from motif_melody import MotifMelodyGenerator
 
@@ -17,13 +20,36 @@ class MidiGenerator:
 
     NOTE_MAP = {"C": 60, "D": 62, "E": 64, "F": 65, "G": 67, "A": 69, "B": 71}
     SCALES = {"major": [0, 2, 4, 5, 7, 9, 11], "minor": [0, 2, 3, 5, 7, 8, 10]}
+    PROGRESSIONS = {
+        "Lowest": [["C", "Am", "F", "G"]],
+        "Low": [["C", "Dm", "G", "C"]],
+        "Rising": [["C", "F", "G", "C"]],
+        "Moderate": [["C", "Am", "F", "G"]],
+        "High": [["C", "Em", "F", "G"]],
+        "Decreasing": [["C", "F", "Dm", "G"]]
+    }
+    DEFAULT_PROGRESSION = ["C", "F", "G", "C"]
+
+    # General MIDI channels/notes for the stems the audio renderers mix
+    DRUM_CHANNEL, PAD_CHANNEL, MELODY_CHANNEL = 9, 1, 0
+    KICK_NOTE, SNARE_NOTE = 36, 38
 
-    def __init__(self, bpm=120, alignment="Neutral", energy="Moderate"):
+    def __init__(self, bpm=120, alignment="Neutral", energy="Moderate", seed=None, profiler=None):
         self.bpm = bpm
+        self.seed = seed
+        self.profiler = profiler or DISABLED
         self.ticks_per_beat = 480
-        self.mid = mido.MidiFile(ticks_per_beat=self.ticks_per_beat)
+        self._mid = None
         self.key_root, self.scale_type = self.select_key(alignment, energy)
 
+    @property
+    def mid(self):
+        # mido is only needed by the message-based generate_song/export path, so it is imported on first use
+        if self._mid is None:
+            import mido
+            self._mid = mido.MidiFile(ticks_per_beat=self.ticks_per_beat)
+        return self._mid
+
     def select_key(self, alignment, energy):
         for (align, ener), (key, scale) in self.KEY_MAPPINGS.items():
             if alignment.startswith(align) and (ener is None or ener == energy):
@@ -36,6 +62,7 @@ class MidiGenerator:
         return [root_note + i for i in intervals]
 
     def generate_song(self):
+        import mido
         scale_notes = self.get_scale_notes()
         track = mido.MidiTrack()
         self.mid.tracks.append(track)
@@ -45,16 +72,69 @@ class MidiGenerator:
         ticks = int(self.ticks_per_beat / 2)
 
         # Choose the melody generator you want to use:
-        melody_generator = MarkovMelodyGenerator(scale_notes)  # Or MotifMelodyGenerator(scale_notes)
-        melody_notes = melody_generator.generate_melody(length=8)
+        with self.profiler.stage("midi_melody"):
+            melody_generator = MarkovMelodyGenerator(scale_notes, seed=self.seed)  # Or MotifMelodyGenerator(scale_notes)
+            melody_notes = melody_generator.generate_melody(length=8)
 
         # Add the generated melody notes to the MIDI track:
         for note in melody_notes:
             track.append(mido.Message('note_on', note=note, velocity=64, time=0))
             track.append(mido.Message('note_off', note=note, velocity=64, time=ticks))
 
+    def chord_notes(self, chord):
+        root = self.NOTE_MAP[chord.rstrip("m")]
+        return [root, root + (3 if chord.endswith("m") else 4), root + 7]
+
+    def song_beats(self, duration_sec):
+        # Same whole-measure snapping as the audio renderers
+        measure_duration_sec = 4 * 60 / self.bpm
+        return max(1, int(duration_sec / measure_duration_sec)) * 4
+
+    def arrangement_tracks(self, melody_notes, duration_sec=30, energy="Moderate", progression=None,
+                           pad_program=89, melody_program=0):
+        beats_total = self.song_beats(duration_sec)
+        beat = self.ticks_per_beat
+        beats = np.arange(beats_total)
+        onsets = beats * beat
+
+        # Drums: kick on beat 1, snare on beat 3 of every measure
+        drums = np.concatenate([
+            smf_writer.note_events(onsets[beats % 4 == 0], beat // 4, self.KICK_NOTE, 110, self.DRUM_CHANNEL),
+            smf_writer.note_events(onsets[beats % 4 == 2], beat // 4, self.SNARE_NOTE, 100, self.DRUM_CHANNEL),
+        ])
+
+        # Pads: the progression's triad held for every beat
+        progression = progression or self.PROGRESSIONS.get(energy, [self.DEFAULT_PROGRESSION])[0]
+        chord_table = np.array([self.chord_notes(chord) for chord in progression])
+        chords = chord_table[beats % len(progression)]
+        pad = np.concatenate([
+            smf_writer.make_track_events([0], smf_writer.PROGRAM_CHANGE | self.PAD_CHANNEL, pad_program),
+            smf_writer.note_events(np.repeat(onsets, chords.shape[1]), beat, chords.ravel(), 64, self.PAD_CHANNEL),
+        ])
+
+        # Melody: one note per beat, looping the melody like the renderers do
+        notes = np.resize(np.asarray(melody_notes), beats_total) if melody_notes else np.zeros(0, dtype=np.int64)
+        melody = np.concatenate([
+            smf_writer.make_track_events([0], smf_writer.PROGRAM_CHANGE | self.MELODY_CHANNEL, melody_program),
+            smf_writer.note_events(onsets[:len(notes)], beat, notes, 100, self.MELODY_CHANNEL),
+        ])
+        return {"drums": drums, "pad": pad, "melody": melody}
+
+    def export_arrangement(self, melody_notes, duration_sec=30, energy="Moderate", progression=None):
+        # Byte-level SMF: conductor track plus drum, pad and melody tracks, no mido message objects
+        with self.profiler.stage("midi_events"):
+            tracks = self.arrangement_tracks(melody_notes, duration_sec, energy, progression)
+        with self.profiler.stage("midi_encode"):
+            conductor = smf_writer.set_tempo(self.bpm) + smf_writer.time_signature(4, 4)
+            chunks = [smf_writer.encode_track(np.zeros(0, dtype=smf_writer.TRACK_EVENT_DTYPE), conductor)]
+            chunks += [smf_writer.encode_track(events, smf_writer.track_name(name)) for name, events in tracks.items()]
+            buffer = io.BytesIO(smf_writer.write_smf(chunks, self.ticks_per_beat))
+            buffer.seek(0)
+        return buffer
+
     def export(self):
-        buffer = io.BytesIO()
-        self.mid.save(file=buffer)
-        buffer.seek(0)
+        with self.profiler.stage("midi_encode"):
+            buffer = io.BytesIO()
+            self.mid.save(file=buffer)
+            buffer.seek(0)
         return buffer
\ No newline at end of file
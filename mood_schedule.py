@@ -0,0 +1,73 @@
+# Activity / diurnal energy rules shared by the app, batch renderer and services
+from midi_generator import MidiGenerator
+
+# ----- Constants -----
+allowed_activities = ["work", "sleep", "free", "play", "family"]
+diurnal_energy = [
+    "Low", "Low", "Lowest", "Lowest", "Lowest", "Low",
+    "Rising", "Rising", "High", "High", "High", "High",
+    "Moderate", "Moderate", "High", "High", "High", "Moderate",
+    "Moderate", "Moderate", "Decreasing", "Decreasing", "Low", "Low"
+]
+DEFAULT_SCHEDULE = ["sleep"] * 6 + ["family"] * 2 + ["work"] * 4 + \
+    ["free"] * 2 + ["work"] * 3 + ["family"] * 2 + ["play"] * 2 + ["free", "sleep", "sleep"]
+bpm_mapping = {
+    "Lowest": 80, "Low": 90, "Rising": 110,
+    "Moderate": 120, "High": 140, "Decreasing": 100
+}
+
+def time_of_day_symbol(hour):
+    return ["🌙", "🌅", "☀️", "🌇"][min(hour // 6, 3)]
+
+def calculate_alignment(activity, energy):
+    rules = {
+        "sleep": ["Low", "Lowest"],
+        "work": ["High"],
+        "play": ["Moderate", "High"],
+        "family": ["Moderate", "Rising", "Decreasing"],
+        "free": ["Moderate", "Decreasing"]
+    }
+    if energy in rules.get(activity, []):
+        return "✅ Enhance"
+    if activity == "work" and energy in ["Low", "Lowest", "Decreasing"]:
+        return "❌ Oppose"
+    if activity == "sleep" and energy in ["High", "Rising"]:
+        return "❌ Oppose"
+    if activity == "play" and energy in ["Low", "Lowest"]:
+        return "❌ Oppose"
+    return "⚪ Neutral"
+
+def alignment_modifier(alignment, energy):
+    if "Enhance" in alignment:
+        return 10 if energy in ["High", "Rising"] else -10
+    if "Oppose" in alignment:
+        return -10 if energy in ["High", "Rising"] else 10
+    return 0
+
+def calculate_bpm(energy, alignment):
+    bpm_value = bpm_mapping[energy] + alignment_modifier(alignment, energy)
+    return max(min(bpm_value, 160), 80)
+
+def song_key(alignment, energy):
+    return MidiGenerator.KEY_MAPPINGS.get(
+        (alignment.replace('✅ ', '').replace('❌ ', '').replace('⚪ ', ''), energy),
+        ("C", "major")
+    )
+
+def scale_midi_notes(key_root, scale_type):
+    root = MidiGenerator.NOTE_MAP[key_root]
+    return [root + i for i in MidiGenerator.SCALES[scale_type]]
+
+def plan_hour(hour, activity):
+    energy = diurnal_energy[hour]
+    alignment = calculate_alignment(activity, energy)
+    key_root, scale_type = song_key(alignment, energy)
+    return {
+        "hour": hour,
+        "activity": activity,
+        "energy": energy,
+        "alignment": alignment,
+        "bpm": calculate_bpm(energy, alignment),
+        "key_root": key_root,
+        "scale_type": scale_type
+    }
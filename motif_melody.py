@@ -1,8 +1,30 @@
-import random
+import numpy as np
+
+TRANSFORMATIONS = ['invert', 'retrograde', 'transpose', 'original', 'variation']
+INVERT, RETROGRADE, TRANSPOSE, ORIGINAL, VARIATION = range(len(TRANSFORMATIONS))
+TRANSPOSE_STEPS = np.array([-2, -1, 1, 2])
+VARIATION_CHANGES = np.array([-1, 1])
+MOTIF_LENGTH = 4
+
+# Uniforms drawn per motif slot: one per motif note, then transform, transpose step,
+# variation index and variation direction. Both code paths consume exactly this many,
+# so a seeded scalar call and the matching row of a batch see the same numbers
+DRAWS_PER_SLOT = MOTIF_LENGTH + 4
+
+
+def build_snap_table(scale_notes):
+    # Nearest scale note for every MIDI note; argmin keeps the first of two equidistant notes,
+    # matching min(scale_notes, key=...)
+    scale = np.asarray(scale_notes)
+    return scale[np.argmin(np.abs(np.arange(128)[:, None] - scale[None, :]), axis=1)]
+
 
 class MotifMelodyGenerator:
-    def __init__(self, scale_notes):
+    def __init__(self, scale_notes, seed=None):
         self.scale_notes = scale_notes
+        self.rng = np.random.default_rng(seed)
+        self.snap_table = build_snap_table(scale_notes)
+        self._snap_list = self.snap_table.tolist()
 
     def _invert(self, motif):
         center = motif[0]
@@ -14,38 +36,39 @@ class MotifMelodyGenerator:
     def _transpose(self, motif, steps):
         return [note + steps for note in motif]
 
-    def _add_variation(self, motif):
+    def _add_variation(self, motif, idx, change):
         varied = motif[:]
-        idx = random.randint(0, len(varied) - 1)
-        change = random.choice([-1, 1])
         varied[idx] = max(21, min(108, varied[idx] + change))
         return varied
 
     def _snap_to_scale(self, motif):
-        return [min(self.scale_notes, key=lambda s: abs(s - note)) for note in motif]
+        return [self._snap_list[min(127, max(0, note))] for note in motif]
+
+    def _pick(self, options, u):
+        return options[int(u * len(options))]
 
     def generate_melody(self, length=16):
+        slots = -(-length // MOTIF_LENGTH)
+        draws = self.rng.random((slots, DRAWS_PER_SLOT)).tolist()
         melody = []
-        motif_length = 4
-        transformations = ['invert', 'retrograde', 'transpose', 'original', 'variation']
         last_transform = None
 
-        while len(melody) < length:
+        for slot in draws:
             if len(melody) % 8 == 0 or last_transform == 'original':
-                motif = random.choices(self.scale_notes, k=motif_length)
+                motif = [self._pick(self.scale_notes, u) for u in slot[:MOTIF_LENGTH]]
 
-            available_transforms = [t for t in transformations if t != last_transform]
-            transform = random.choice(available_transforms)
+            available_transforms = [t for t in TRANSFORMATIONS if t != last_transform]
+            transform = self._pick(available_transforms, slot[MOTIF_LENGTH])
 
             if transform == 'invert':
                 new_motif = self._invert(motif)
             elif transform == 'retrograde':
                 new_motif = self._retrograde(motif)
             elif transform == 'transpose':
-                steps = random.choice([-2, -1, 1, 2])
-                new_motif = self._transpose(motif, steps)
+                new_motif = self._transpose(motif, int(self._pick(TRANSPOSE_STEPS, slot[MOTIF_LENGTH + 1])))
             elif transform == 'variation':
-                new_motif = self._add_variation(motif)
+                idx = self._pick(range(MOTIF_LENGTH), slot[MOTIF_LENGTH + 2])
+                new_motif = self._add_variation(motif, idx, int(self._pick(VARIATION_CHANGES, slot[MOTIF_LENGTH + 3])))
             else:
                 new_motif = motif
 
@@ -53,4 +76,39 @@ class MotifMelodyGenerator:
             melody.extend(new_motif)
             last_transform = transform
 
-        return melody[:length]
\ No newline at end of file
+        return melody[:length]
+
+    def generate_melodies(self, count, length=16):
+        slots = -(-length // MOTIF_LENGTH)
+        draws = self.rng.random((count, slots, DRAWS_PER_SLOT))
+        scale = np.asarray(self.scale_notes)
+        rows = np.arange(count)
+        melodies = np.empty((count, slots * MOTIF_LENGTH), dtype=np.int64)
+        motif = np.zeros((count, MOTIF_LENGTH), dtype=np.int64)
+        last = np.full(count, -1)
+
+        # Slots depend on the previous transform, so walk them in order; each step is vectorized over melodies
+        for s in range(slots):
+            u = draws[:, s]
+            fresh = (s % 2 == 0) | (last == ORIGINAL)
+            motif[fresh] = scale[(u[fresh, :MOTIF_LENGTH] * len(scale)).astype(np.int64)]
+
+            # Pick among the transforms other than the previous one, keeping their list order
+            choice = (u[:, MOTIF_LENGTH] * np.where(last < 0, 5, 4)).astype(np.int64)
+            transform = choice + ((last >= 0) & (choice >= last))
+
+            varied = motif.copy()
+            var_idx = (u[:, MOTIF_LENGTH + 2] * MOTIF_LENGTH).astype(np.int64)
+            var_change = VARIATION_CHANGES[(u[:, MOTIF_LENGTH + 3] * 2).astype(np.int64)]
+            varied[rows, var_idx] = np.clip(varied[rows, var_idx] + var_change, 21, 108)
+
+            step = TRANSPOSE_STEPS[(u[:, MOTIF_LENGTH + 1] * 4).astype(np.int64)]
+            new_motif = np.select(
+                [transform[:, None] == t for t in (INVERT, RETROGRADE, TRANSPOSE, VARIATION)],
+                [2 * motif[:, :1] - motif, motif[:, ::-1], motif + step[:, None], varied],
+                default=motif,
+            )
+            melodies[:, s * MOTIF_LENGTH:(s + 1) * MOTIF_LENGTH] = self.snap_table[np.clip(new_motif, 0, 127)]
+            last = transform
+
+        return melodies[:, :length]
@@ -0,0 +1,114 @@
+import threading
+
+import numpy as np
+
+from event_table import SourceBank, clip_to_window, make_events, render_sampled
+
+WAVEFORMS = ("sine", "square", "saw")
+PHASE_BITS = 32
+PHASE_MASK = np.uint64((1 << PHASE_BITS) - 1)
+
+
+def make_wavetable(waveform, size):
+    phase = np.arange(size) / size
+    if waveform == "sine":
+        table = np.sin(2 * np.pi * phase)
+    elif waveform == "square":
+        table = np.where(phase < 0.5, 1.0, -1.0)
+    elif waveform == "saw":
+        table = 2 * phase - 1
+    else:
+        raise ValueError(f"Unknown waveform: {waveform}")
+    return table.astype(np.float32)
+
+
+class OscillatorBank:
+    def __init__(self, sample_rate=44100, waveform="sine", table_bits=14, phase_lock=False, max_blocks=256):
+        self.sample_rate = sample_rate
+        self.waveform = waveform
+        self.table_bits = table_bits
+        self.table = make_wavetable(waveform, 1 << table_bits)
+        self.phase_lock = phase_lock
+        self.max_blocks = max_blocks
+        self.blocks = SourceBank()
+        self._lock = threading.Lock()
+
+    def increments(self, freqs, length=None):
+        cycles_per_sample = np.asarray(freqs, dtype=np.float64) / self.sample_rate
+        if self.phase_lock:
+            # Whole cycles per block: every block starts and ends at phase 0, so blocks tile seamlessly
+            cycles_per_sample = np.maximum(1, np.round(cycles_per_sample * length)) / length
+        return np.round(cycles_per_sample * (1 << PHASE_BITS)).astype(np.uint64)
+
+    def start_phases(self, chord_freqs, length, index):
+        # Phase of each voice at the start of chord number `index` (chords of `length` samples, cycling
+        # through chord_freqs): every voice reads a clock that starts at phase 0 with the song, as the
+        # original np.sin(2 * pi * f * t) pads did, so it is the increment times the onset
+        index = np.asarray(index, dtype=np.uint64)
+        if self.phase_lock:
+            return np.zeros((len(index), chord_freqs.shape[1]), dtype=np.uint64)
+        increments = self.increments(chord_freqs)[index % np.uint64(len(chord_freqs))]
+        # uint64 products wrap modulo 2**64, which leaves the 32 phase bits intact
+        return increments * (index * np.uint64(length))[:, None]
+
+    def lookup(self, phases):
+        return self.table[(phases & PHASE_MASK) >> np.uint64(PHASE_BITS - self.table_bits)]
+
+    def render_block(self, freqs, gains, length):
+        n = np.arange(length, dtype=np.uint64)
+        block = np.zeros(length, dtype=np.float32)
+        for inc, gain in zip(self.increments(freqs, length), gains):
+            block += np.float32(gain) * self.lookup(n * inc)
+        return block
+
+    def block_bank(self, keys, voices):
+        # Rendered chord blocks persist across calls and renders; returns the bank and an id per key.
+        # The bound is checked before anything is added: a call whose new blocks would not fit starts a
+        # fresh bank, and one that needs more than max_blocks by itself gets a bank that is not kept
+        keys = [tuple(key) for key in keys]
+        with self._lock:
+            bank = self.blocks
+            missing = sum(key not in bank.ids for key in keys)
+            if len(bank.buffers) + missing > self.max_blocks:
+                bank = SourceBank()
+                if len(keys) <= self.max_blocks:
+                    self.blocks = bank
+            ids = []
+            for key in keys:
+                if key not in bank.ids:
+                    bank.add(key, self.render_block(key[:voices], key[voices:2 * voices], int(key[-1])))
+                ids.append(bank.ids[key])
+        return bank, np.array(ids, dtype=np.int32)
+
+    def render(self, events, out, window_start=0):
+        if len(events) == 0:
+            return out
+        if self.phase_lock:
+            return self._render_blocks(events, out, window_start)
+        return self._render_continuous(events, out, window_start)
+
+    def _render_blocks(self, events, out, window_start):
+        # Events are voice-level and onset-ordered; a chord is every voice sharing an onset
+        voices = int(events["source"].max()) + 1
+        chords = events.reshape(-1, voices)
+        keys = np.column_stack((chords["pitch"], chords["gain"], chords["length"][:, :1]))
+        unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+        bank, ids = self.block_bank(unique_keys, voices)
+
+        chord_events = make_events(chords["onset"][:, 0], chords["length"][:, 0], "pad", ids[inverse.ravel()], 1.0)
+        return render_sampled(chord_events, bank, out, window_start)
+
+    def _render_continuous(self, events, out, window_start):
+        # Exact pitch: every event starts where its voice's phase accumulator left off
+        keep, starts, lengths, skips = clip_to_window(events, window_start, window_start + len(out))
+        if len(starts) == 0:
+            return out
+        events = events[keep]
+        n = np.arange(int(lengths.max()), dtype=np.uint64)
+        for start, length, skip, inc, phase, gain in zip((starts - window_start).tolist(), lengths.tolist(),
+                                                         skips.tolist(), self.increments(events["pitch"]),
+                                                         events["phase"], events["gain"].tolist()):
+            values = self.lookup(phase + (n[:length] + np.uint64(skip)) * inc)
+            values *= np.float32(gain)
+            out[start:start + length] += values
+        return out
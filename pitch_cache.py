@@ -0,0 +1,85 @@
+import threading
+from collections import OrderedDict
+from fractions import Fraction
+
+import numpy as np
+
+RESAMPLE_MODES = ("fft", "polyphase", "linear")
+
+
+def resample_to_length(data, target_length, mode="fft"):
+    # scipy.signal takes most of a second to import, so it is only loaded once a note is actually shifted
+    if mode == "fft":
+        from scipy.signal import resample
+        return resample(data, target_length)
+    if mode == "polyphase":
+        from scipy.signal import resample_poly
+        ratio = Fraction(target_length, len(data)).limit_denominator(64)
+        shifted = resample_poly(data, ratio.numerator, ratio.denominator)
+    elif mode == "linear":
+        positions = np.arange(target_length) * (len(data) / target_length)
+        shifted = np.interp(positions, np.arange(len(data)), data)
+    else:
+        raise ValueError(f"Unknown resample mode: {mode}")
+    shifted = shifted.astype(data.dtype, copy=False)[:target_length]
+    if len(shifted) < target_length:
+        shifted = np.pad(shifted, (0, target_length - len(shifted)))
+    return shifted
+
+
+class PitchShiftCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, compute):
+        with self._lock:
+            buffer = self._entries.get(key)
+            if buffer is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return buffer
+            self.misses += 1
+
+        # Compute outside the lock so other renderers are not blocked on one FFT
+        buffer = np.array(compute())
+        buffer.setflags(write=False)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = buffer
+                self.bytes += buffer.nbytes
+                self._evict()
+        return buffer
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and len(self._entries) > 1:
+            _, old = self._entries.popitem(last=False)
+            self.bytes -= old.nbytes
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# Shared by every AudioRenderer in the process unless one is passed explicitly
+PITCH_CACHE = PitchShiftCache()
@@ -0,0 +1,131 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from markov_melody import MarkovMelodyGenerator
+from midi_generator import MidiGenerator
+from mood_schedule import DEFAULT_SCHEDULE, allowed_activities, plan_hour, scale_midi_notes
+from motif_melody import MotifMelodyGenerator
+
+# One renderer per worker process, so samples / the SoundFont are loaded once per worker
+_worker_renderer = None
+
+
+def make_renderer(renderer="sample", program=0, soundfont_path="soundfonts/FluidR3_GM.sf2"):
+    if renderer == "soundfont":
+        from soundfont_audio_renderer import SoundFontAudioRenderer
+        return SoundFontAudioRenderer(soundfont_path=soundfont_path, program=program)
+    from audio_renderer import AudioRenderer
+    return AudioRenderer()
+
+
+def _init_worker(renderer, program, soundfont_path):
+    global _worker_renderer
+    _worker_renderer = make_renderer(renderer, program, soundfont_path)
+
+
+def plan_day(schedule=None, melody_method="Markov", melody_length=16, duration_sec=30, seed=0):
+    schedule = list(schedule or DEFAULT_SCHEDULE)
+    if len(schedule) != 24:
+        raise ValueError(f"Schedule needs 24 hourly activities, got {len(schedule)}")
+
+    return [plan_job(hour, activity, melody_method, melody_length, duration_sec, seed)
+            for hour, activity in enumerate(schedule)]
+
+
+def plan_job(hour, activity, melody_method="Markov", melody_length=16, duration_sec=30, seed=0):
+    if activity not in allowed_activities:
+        raise ValueError(f"Unknown activity for {hour:02d}:00: {activity}")
+    job = plan_hour(hour, activity)
+    scale_notes = scale_midi_notes(job["key_root"], job["scale_type"])
+    generator_class = MarkovMelodyGenerator if melody_method == "Markov" else MotifMelodyGenerator
+    job["melody_notes"] = generator_class(scale_notes, seed=seed).generate_melody(length=melody_length)
+    job["duration_sec"] = duration_sec
+    job["seed"] = seed
+    return job
+
+
+def render_hour(job, output_dir, renderer=None):
+    renderer = renderer or _worker_renderer
+    start = time.perf_counter()
+
+    audio_wave = renderer.generate_song_audio(
+        bpm=job["bpm"],
+        key_root=job["key_root"],
+        scale_type=job["scale_type"],
+        melody_notes=job["melody_notes"],
+        duration_sec=job["duration_sec"],
+        energy=job["energy"],
+        seed=job["seed"]
+    )
+    wav_name = f"hour_{job['hour']:02d}.wav"
+    with open(os.path.join(output_dir, wav_name), "wb") as f:
+        f.write(renderer.export_wav(audio_wave).getvalue())
+
+    midi_gen = MidiGenerator(bpm=job["bpm"], alignment=job["alignment"], energy=job["energy"], seed=job["seed"])
+    midi_name = f"hour_{job['hour']:02d}.mid"
+    with open(os.path.join(output_dir, midi_name), "wb") as f:
+        f.write(midi_gen.export_arrangement(job["melody_notes"], job["duration_sec"], job["energy"]).getvalue())
+
+    return dict(job, wav=wav_name, midi=midi_name, samples=len(audio_wave),
+                render_sec=round(time.perf_counter() - start, 4))
+
+
+def prerender_day(output_dir, schedule=None, renderer="sample", program=0, workers=None,
+                  melody_method="Markov", melody_length=16, duration_sec=30, seed=0,
+                  soundfont_path="soundfonts/FluidR3_GM.sf2"):
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = plan_day(schedule, melody_method, melody_length, duration_sec, seed)
+    start = time.perf_counter()
+
+    if workers == 1:
+        local_renderer = make_renderer(renderer, program, soundfont_path)
+        tracks = [render_hour(job, output_dir, local_renderer) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(renderer, program, soundfont_path)) as pool:
+            tracks = list(pool.map(render_hour, jobs, [output_dir] * len(jobs)))
+
+    manifest = {
+        "renderer": renderer,
+        "program": program if renderer == "soundfont" else None,
+        "melody_method": melody_method,
+        "melody_length": melody_length,
+        "duration_sec": duration_sec,
+        "seed": seed,
+        "workers": workers or os.cpu_count(),
+        "wall_sec": round(time.perf_counter() - start, 4),
+        "tracks": tracks
+    }
+    with open(os.path.join(output_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-render all 24 hourly Mood Ring tracks (WAV + MIDI).")
+    parser.add_argument("output_dir")
+    parser.add_argument("--schedule", help="24 comma-separated activities; defaults to the app's schedule")
+    parser.add_argument("--renderer", choices=["sample", "soundfont"], default="sample")
+    parser.add_argument("--program", type=int, default=0, help="General MIDI program for the SoundFont renderer")
+    parser.add_argument("--soundfont", default="soundfonts/FluidR3_GM.sf2")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--melody", choices=["Markov", "Motif"], default="Markov")
+    parser.add_argument("--melody-length", type=int, default=16)
+    parser.add_argument("--duration", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    schedule = args.schedule.split(",") if args.schedule else None
+    manifest = prerender_day(
+        args.output_dir, schedule, args.renderer, args.program, args.workers,
+        args.melody, args.melody_length, args.duration, args.seed, args.soundfont
+    )
+    print(f"Rendered {len(manifest['tracks'])} tracks to {args.output_dir} "
+          f"in {manifest['wall_sec']:.2f}s with {manifest['workers']} workers")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import threading
+import time
+from contextlib import contextmanager
+
+PREVIEW_SAMPLE_RATES = (11025, 22050)
+PREVIEW_SAMPLE_RATE = 22050
+PREVIEW_MEASURES = 4
+# Pitch shifts for previews use interpolation; the FFT resampler (and importing scipy for it) dominates a cold preview
+PREVIEW_RESAMPLE_MODE = "linear"
+
+
+def preview_duration(bpm, duration_sec, measures=PREVIEW_MEASURES):
+    # Length of the opening measures (4/4), never longer than the song. The extra half beat keeps
+    # float rounding from flooring the measure or note count one short
+    if measures is None:
+        return duration_sec
+    return min(duration_sec, (measures * 4 + 0.5) * 60 / bpm)
+
+
+class RenderTiming:
+    # Wall time per second of audio for full-quality renders and the latest preview, so the renderer can
+    # report how long a preview took and how much sooner it arrived than the full render would have.
+    # Shared by the copies a renderer hands out (with_profiler, preview renderers)
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.full_sec_per_audio_sec = None
+        self.preview = None
+
+    @contextmanager
+    def full(self, audio_sec):
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+        if audio_sec > 0:
+            with self._lock:
+                self.full_sec_per_audio_sec = elapsed / audio_sec
+
+    @contextmanager
+    def preview_render(self, sample_rate, audio_sec, song_sec):
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.preview = {
+                "latency_sec": elapsed,
+                "sample_rate": sample_rate,
+                "audio_sec": audio_sec,
+                "song_sec": song_sec,
+            }
+
+    def preview_stats(self):
+        # None before the first preview; the speedup needs at least one timed full-quality render
+        with self._lock:
+            if self.preview is None:
+                return None
+            stats = dict(self.preview)
+            rate = self.full_sec_per_audio_sec
+        stats["estimated_full_sec"] = None if rate is None else rate * stats["song_sec"]
+        stats["speedup"] = None if rate is None else stats["estimated_full_sec"] / max(stats["latency_sec"], 1e-9)
+        return stats
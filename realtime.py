@@ -0,0 +1,290 @@
+import argparse
+import json
+import threading
+import time
+
+import numpy as np
+
+from mood_schedule import DEFAULT_SCHEDULE
+
+
+class RingBuffer:
+    # Preallocated single-producer / single-consumer ring of float32 frames. Each side only ever advances
+    # its own counter, and only after its copy is done, so the two threads never need a lock
+    def __init__(self, capacity, channels=1):
+        self.capacity = capacity
+        self.channels = channels
+        self.frames = np.zeros((capacity, channels), dtype=np.float32)
+        self.written = 0
+        self.read_total = 0
+
+    def fill(self):
+        return self.written - self.read_total
+
+    def space(self):
+        return self.capacity - self.fill()
+
+    def write(self, block):
+        # Copies as much of block as fits; returns the number of frames taken
+        block = np.asarray(block, dtype=np.float32).reshape(len(block), -1)
+        count = min(len(block), self.space())
+        start = self.written % self.capacity
+        first = min(count, self.capacity - start)
+        self.frames[start:start + first] = block[:first]
+        self.frames[:count - first] = block[first:count]
+        self.written += count
+        return count
+
+    def read(self, out):
+        # Fills out from the ring as far as it can; returns the number of frames copied
+        count = min(len(out), self.fill())
+        start = self.read_total % self.capacity
+        first = min(count, self.capacity - start)
+        out[:first] = self.frames[start:start + first]
+        out[first:count] = self.frames[:count - first]
+        self.read_total += count
+        return count
+
+
+def local_hour():
+    return time.localtime().tm_hour
+
+
+def scheduled_song(schedule=None, melody_method="Markov", melody_length=16, seed=0):
+    # Song parameters for an hour of the day, as prerender plans them
+    from prerender import plan_job
+    schedule = list(schedule or DEFAULT_SCHEDULE)
+    return lambda hour: plan_job(hour, schedule[hour], melody_method, melody_length, seed=seed)
+
+
+class RealtimePlayer:
+    # Renders just ahead of playback on a producer thread. The consumer (an audio callback, or NullSink)
+    # calls read(); the producer keeps the ring topped up one block at a time. When clock() moves to a new
+    # hour, the song switches to that hour's BPM, key and energy at the next measure boundary
+    def __init__(self, renderer, plan=None, clock=None, block_size=1024, buffer_sec=1.0, song_sec=300):
+        self.renderer = renderer
+        self.sample_rate = renderer.sample_rate
+        self.plan = plan or scheduled_song()
+        self.clock = clock or local_hour
+        self.block_size = block_size
+        # A song restarts after song_sec. Songs are normalized to their arrangement's headroom rather than a
+        # measured peak, so a switch costs one block of mixing plus the new song's setup, never a pre-pass
+        self.song_sec = song_sec
+        self.ring = RingBuffer(max(block_size, int(buffer_sec * self.sample_rate)), renderer.channels)
+        self.block_budget_sec = block_size / self.sample_rate
+
+        self.error = None
+        self.underruns = 0
+        self.underrun_frames = 0
+        self.blocks = 0
+        self.deadline_misses = 0
+        self.render_sec = 0.0
+        self.max_render_sec = 0.0
+        self.songs = []
+        self._stop = threading.Event()
+        self._space = threading.Event()
+        self._data = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._produce, name="realtime-producer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._space.set()
+        self._data.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def read(self, out):
+        # Consumer side: never blocks; a short ring is an underrun and the rest of out is silence
+        out = out.reshape(len(out), -1)
+        count = self.ring.read(out)
+        if count < len(out):
+            out[count:] = 0
+            self.underruns += 1
+            self.underrun_frames += len(out) - count
+        self._space.set()
+        return out
+
+    def wait_for_frames(self, frames, timeout=None):
+        # For consumers without a clock: True once `frames` are buffered, False if the producer stopped
+        # or nothing arrived within timeout
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while self.ring.fill() < frames:
+            if self._thread is None or not self._thread.is_alive():
+                return False
+            self._data.clear()
+            if self.ring.fill() >= frames:
+                break
+            remaining = None if deadline is None else deadline - time.perf_counter()
+            if remaining is not None and remaining <= 0:
+                return False
+            self._data.wait(remaining if remaining is not None else 0.1)
+        return True
+
+    def _wait_for_space(self, frames):
+        while not self._stop.is_set():
+            self._space.clear()
+            if self.ring.space() >= frames:
+                return True
+            self._space.wait(0.1)
+        return False
+
+    def _songs(self):
+        # Blocks of the current song; a pending hour change cuts the block at the next measure boundary
+        while not self._stop.is_set():
+            hour = self.clock()
+            song = self.plan(hour)
+            self.songs.append({"frame": self.ring.written, "hour": hour, "bpm": song["bpm"],
+                               "key_root": song["key_root"], "scale_type": song["scale_type"],
+                               "energy": song["energy"]})
+            measure = 4 * int(self.sample_rate / (song["bpm"] / 60))
+            position = 0
+            for block in self.renderer.iter_song_blocks(
+                    song["bpm"], song["key_root"], song["scale_type"], song["melody_notes"], self.song_sec,
+                    song["energy"], block_size=self.block_size, dtype=np.float32, normalize="headroom",
+                    seed=song.get("seed")):
+                if self.clock() != hour:
+                    cut = -position % measure
+                    if cut < len(block):
+                        if cut:
+                            yield block[:cut]
+                        break
+                yield block
+                position += len(block)
+
+    def _produce(self):
+        try:
+            songs = self._songs()
+            while self._wait_for_space(self.block_size):
+                start = time.perf_counter()
+                block = next(songs, None)
+                elapsed = time.perf_counter() - start
+                if block is None:
+                    break
+                # A block that took longer to make than it lasts cannot keep up with playback
+                self.blocks += 1
+                self.render_sec += elapsed
+                self.max_render_sec = max(self.max_render_sec, elapsed)
+                if elapsed > len(block) / self.sample_rate:
+                    self.deadline_misses += 1
+                self.ring.write(block)
+                self._data.set()
+        except Exception as exc:
+            self.error = exc
+        finally:
+            self._data.set()
+
+    def stats(self):
+        fill = self.ring.fill()
+        return {
+            "sample_rate": self.sample_rate,
+            "capacity_frames": self.ring.capacity,
+            "fill_frames": fill,
+            "fill_ratio": fill / self.ring.capacity,
+            "frames_produced": self.ring.written,
+            "frames_played": self.ring.read_total,
+            "underruns": self.underruns,
+            "underrun_frames": self.underrun_frames,
+            "blocks": self.blocks,
+            "block_budget_sec": self.block_budget_sec,
+            "deadline_misses": self.deadline_misses,
+            "mean_render_sec": self.render_sec / self.blocks if self.blocks else 0.0,
+            "max_render_sec": self.max_render_sec,
+            "songs": len(self.songs),
+            "current": self.songs[-1] if self.songs else None,
+            "error": None if self.error is None else f"{type(self.error).__name__}: {self.error}",
+        }
+
+
+class NullSink:
+    # Consumer with no audio device: pulls fixed-size blocks from a player, paced like a sound card or as
+    # fast as the caller asks, and keeps the lowest fill level it saw
+    def __init__(self, player, block_size=512):
+        self.player = player
+        self.buffer = np.zeros((block_size, player.ring.channels), dtype=np.float32)
+        self.frames = 0
+        self.min_fill = None
+
+    def pull(self, blocks=1):
+        for _ in range(blocks):
+            fill = self.player.ring.fill()
+            self.min_fill = fill if self.min_fill is None else min(self.min_fill, fill)
+            self.player.read(self.buffer)
+            self.frames += len(self.buffer)
+        return self.buffer
+
+    def run(self, seconds, realtime=True):
+        # Plays `seconds` of audio. In real time each pull waits for the moment a device would ask for it;
+        # otherwise it waits only for the producer, so underruns then mean the producer stopped or stalled
+        block_sec = len(self.buffer) / self.player.sample_rate
+        start = time.perf_counter()
+        for i in range(int(seconds / block_sec)):
+            if realtime:
+                delay = start + i * block_sec - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                self.player.wait_for_frames(len(self.buffer), timeout=5.0)
+            self.pull()
+        return self.frames
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play the mood schedule in real time into a null sink and report buffer health.")
+    parser.add_argument("--renderer", choices=["sample", "soundfont"], default="sample")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Audio to play")
+    parser.add_argument("--start-hour", type=int, default=None, help="Hour to start at (default: the local hour)")
+    parser.add_argument("--hour-every", type=float, default=None,
+                        help="Advance the hour every this many seconds of playback instead of following the clock")
+    parser.add_argument("--block-size", type=int, default=1024, help="Frames rendered per producer block")
+    parser.add_argument("--sink-block", type=int, default=512, help="Frames pulled per consumer callback")
+    parser.add_argument("--buffer-sec", type=float, default=1.0)
+    parser.add_argument("--fast", action="store_true", help="Pull as fast as possible instead of in real time")
+    args = parser.parse_args(argv)
+
+    if args.renderer == "soundfont":
+        from prerender import make_renderer
+        renderer, song_sec = make_renderer("soundfont"), 300
+    else:
+        from audio_renderer import AudioRenderer
+        renderer, song_sec = AudioRenderer(), 3600
+    start_hour = local_hour() if args.start_hour is None else args.start_hour
+
+    sink = None
+    if args.hour_every:
+        # Hours follow the audio played, so a test run sweeps through the day in seconds
+        def clock():
+            played = sink.frames if sink is not None else 0
+            return (start_hour + int(played / renderer.sample_rate / args.hour_every)) % 24
+    else:
+        clock = local_hour if args.start_hour is None else (lambda: start_hour)
+
+    player = RealtimePlayer(renderer, clock=clock, block_size=args.block_size, buffer_sec=args.buffer_sec,
+                            song_sec=song_sec)
+    sink = NullSink(player, args.sink_block)
+    with player:
+        # Let the producer fill the buffer first, as a device would only start once primed
+        while player.ring.space() >= args.block_size and player.error is None:
+            time.sleep(0.01)
+        sink.run(args.seconds, realtime=not args.fast)
+    stats = player.stats()
+    stats["min_fill_frames"] = sink.min_fill
+    stats["song_starts"] = player.songs
+    print(json.dumps(stats, indent=2))
+    return 1 if player.error else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Bump when renderer output changes so stale on-disk renders are never served
+CACHE_VERSION = 3
+
+
+def make_cache_key(**params):
+    # Canonical JSON so equal parameters hash equally regardless of argument order, list/tuple or NumPy scalars
+    blob = json.dumps(dict(params, cache_version=CACHE_VERSION), sort_keys=True, separators=(",", ":"), default=lambda value: value.tolist())
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    def __init__(self, cache_dir=".render_cache", memory_items=32, disk_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.memory_items = memory_items
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()
+        self._disk = OrderedDict()
+        self._disk_total = 0
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._scan_disk()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".bin")
+
+    def _scan_disk(self):
+        entries = []
+        for filename in os.listdir(self.cache_dir):
+            if filename.endswith(".bin"):
+                stat = os.stat(os.path.join(self.cache_dir, filename))
+                entries.append((stat.st_mtime, filename[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_total += size
+
+    def get(self, key):
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return data
+            on_disk = key in self._disk
+
+        if not on_disk:
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            # Evicted by another process sharing the directory
+            with self._lock:
+                self._disk_total -= self._disk.pop(key, 0)
+            return None
+
+        with self._lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+            self._remember(key, data)
+        return data
+
+    def put(self, key, data):
+        data = bytes(data)
+        with self._lock:
+            self._remember(key, data)
+        if not self.cache_dir:
+            return
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+
+        with self._lock:
+            self._disk_total += len(data) - self._disk.pop(key, 0)
+            self._disk[key] = len(data)
+            while self._disk_total > self.disk_bytes and len(self._disk) > 1:
+                old_key, size = self._disk.popitem(last=False)
+                self._disk_total -= size
+                try:
+                    os.remove(self._path(old_key))
+                except FileNotFoundError:
+                    pass
+
+    def _remember(self, key, data):
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get_or_render(self, key, render):
+        data = self.get(key)
+        if data is None:
+            data = render()
+            self.put(key, data)
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            keys = list(self._disk)
+            self._disk.clear()
+            self._disk_total = 0
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,360 @@
+import argparse
+import asyncio
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from mood_schedule import DEFAULT_SCHEDULE
+from prerender import plan_job
+from render_cache import RenderCache, make_cache_key
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_DURATION_SEC = 600
+STREAM_NORMALIZE = "headroom"
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+class InflightRender:
+    # One render shared by every request for the same key. Chunks are kept in order so a request
+    # that joins late replays what was already produced and then follows the live stream
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self._changed = asyncio.Event()
+
+    def publish(self, chunk):
+        self.chunks.append(chunk)
+        self._wake()
+
+    def finish(self, error=None):
+        self.done = True
+        self.error = error
+        self._wake()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self):
+        position = 0
+        while True:
+            while position < len(self.chunks):
+                yield self.chunks[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class RenderService:
+    def __init__(self, workers=None, cache=None, soundfont_path="soundfonts/FluidR3_GM.sf2", block_size=16384):
+        # Renders run in worker threads; the NumPy mixing and FluidSynth calls do their heavy lifting outside the GIL
+        self.workers = workers or os.cpu_count()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="render")
+        self.cache = cache if cache is not None else RenderCache()
+        self.soundfont_path = soundfont_path
+        self.block_size = block_size
+        self.inflight = {}
+        self.stats = {"requests": 0, "cache_hits": 0, "coalesced": 0, "renders": 0, "errors": 0}
+        self._renderers = {}
+        self._renderers_lock = threading.Lock()
+
+    def renderer(self, renderer_name, program):
+        with self._renderers_lock:
+            key = (renderer_name, program)
+            if key not in self._renderers:
+                if renderer_name == "soundfont":
+                    from soundfont_audio_renderer import SoundFontAudioRenderer
+                    from synth_pool import get_synth_pool
+                    pool = get_synth_pool(self.soundfont_path, size=self.workers)
+                    self._renderers[key] = SoundFontAudioRenderer(self.soundfont_path, program=program, pool=pool)
+                else:
+                    from audio_renderer import AudioRenderer
+                    self._renderers[key] = AudioRenderer()
+            return self._renderers[key]
+
+    def parse_request(self, query):
+        params = {name: values[-1] for name, values in parse_qs(query).items()}
+        hour = int(params["hour"])
+        if not 0 <= hour < 24:
+            raise ValueError("hour must be between 0 and 23")
+        renderer_name = params.get("renderer", "sample")
+        if renderer_name not in ("sample", "soundfont"):
+            raise ValueError(f"Unknown renderer: {renderer_name}")
+        melody_method = params.get("melody", "Markov")
+        if melody_method not in ("Markov", "Motif"):
+            raise ValueError(f"Unknown melody generator: {melody_method}")
+        duration_sec = int(params.get("duration", 30))
+        if not 1 <= duration_sec <= MAX_DURATION_SEC:
+            raise ValueError(f"duration must be between 1 and {MAX_DURATION_SEC} seconds")
+        program = int(params.get("program", 0)) if renderer_name == "soundfont" else None
+
+        job = plan_job(hour, params.get("activity", DEFAULT_SCHEDULE[hour]), melody_method,
+                       int(params.get("length", 16)), duration_sec, int(params.get("seed", 0)))
+        song_params = dict(
+            bpm=job["bpm"],
+            key_root=job["key_root"],
+            scale_type=job["scale_type"],
+            melody_notes=job["melody_notes"],
+            duration_sec=duration_sec,
+            energy=job["energy"],
+            seed=job["seed"]
+        )
+        # Streams are normalized to the arrangement's headroom so audio starts before the song is mixed; the app
+        # normalizes to the true peak, so the bytes differ and the keys must too
+        key = make_cache_key(kind="wav", normalize=STREAM_NORMALIZE, renderer=renderer_name, program=program,
+                             **song_params)
+        return key, renderer_name, program, song_params
+
+    async def stream(self, key, renderer_name, program, song_params):
+        # Returns (source, chunks): source is "cache", "coalesced" or "render", chunks an async iterator of bytes
+        self.stats["requests"] += 1
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            return "cache", _single(cached)
+        if key in self.inflight:
+            self.stats["coalesced"] += 1
+            return "coalesced", self.inflight[key].follow()
+
+        self.stats["renders"] += 1
+        render = self.inflight[key] = InflightRender()
+        loop = asyncio.get_running_loop()
+        loop.run_in_executor(self.executor, self._produce, loop, render, key, renderer_name, program, song_params)
+        return "render", render.follow()
+
+    def _produce(self, loop, render, key, renderer_name, program, song_params):
+        # Worker thread: render block by block and hand each encoded chunk to the event loop
+        chunks = []
+        try:
+            renderer = self.renderer(renderer_name, program)
+            for chunk in renderer.iter_song_wav(**song_params, block_size=self.block_size,
+                                                normalize=STREAM_NORMALIZE):
+                # The writer reuses its scratch buffer, so every chunk is copied before it leaves the thread
+                chunk = bytes(chunk)
+                chunks.append(chunk)
+                loop.call_soon_threadsafe(render.publish, chunk)
+            self.cache.put(key, b"".join(chunks))
+            error = None
+        except Exception as exc:
+            error = exc
+        loop.call_soon_threadsafe(self._finish, key, render, error)
+
+    def _finish(self, key, render, error):
+        if error is not None:
+            self.stats["errors"] += 1
+        if self.inflight.get(key) is render:
+            del self.inflight[key]
+        render.finish(error)
+
+    async def handle(self, reader, writer):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            writer.close()
+            return
+        try:
+            method, target, _ = head.split(b"\r\n", 1)[0].decode("latin-1").split(" ", 2)
+            url = urlsplit(target)
+            if method != "GET":
+                await send_text(writer, 405, "Only GET is supported\n")
+            elif url.path == "/health":
+                await send_text(writer, 200, "ok\n")
+            elif url.path == "/stats":
+                await send_text(writer, 200, "".join(f"{name} {value}\n" for name, value in self.stats.items())
+                                + f"inflight {len(self.inflight)}\n")
+            elif url.path == "/render":
+                await self.handle_render(writer, url.query)
+            else:
+                await send_text(writer, 404, "Not found\n")
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_render(self, writer, query):
+        try:
+            request = self.parse_request(query)
+        except (KeyError, ValueError) as exc:
+            await send_text(writer, 400, f"Bad request: {exc}\n")
+            return
+
+        source, chunks = await self.stream(*request)
+        # The first chunk (the WAV header) arrives once the renderer is up, so setup errors still get a 500
+        try:
+            first = await anext(chunks)
+        except Exception as exc:
+            await send_text(writer, 500, f"Render failed: {type(exc).__name__}: {exc}\n")
+            return
+        writer.write(response_head(200, {
+            "Content-Type": "audio/wav",
+            "Transfer-Encoding": "chunked",
+            "X-Render-Source": source,
+        }))
+        try:
+            writer.write(b"%X\r\n" % len(first) + first + b"\r\n")
+            async for chunk in chunks:
+                writer.write(b"%X\r\n" % len(chunk) + chunk + b"\r\n")
+                await writer.drain()
+        except Exception:
+            # Client gone or render failed; the headers are already out, and a chunked body without its
+            # terminating chunk is how HTTP/1.1 reports a broken stream
+            return
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_HEADER_BYTES)
+        print(f"Serving Mood Ring renders on http://{host}:{port}/render?hour=7", flush=True)
+        async with server:
+            await server.serve_forever()
+
+
+async def _single(data):
+    yield data
+
+
+def response_head(status, headers):
+    lines = [f"HTTP/1.1 {status} {STATUS_TEXT[status]}"]
+    lines += [f"{name}: {value}" for name, value in dict(headers, Connection="close").items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def send_text(writer, status, text):
+    body = text.encode("utf-8")
+    writer.write(response_head(status, {"Content-Type": "text/plain; charset=utf-8", "Content-Length": len(body)}) + body)
+    await writer.drain()
+
+
+async def fetch(host, port, path):
+    # Minimal HTTP/1.1 GET; returns (status, headers, body bytes, time to first body byte)
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode("latin-1"))
+    await writer.drain()
+    status_line, *header_lines = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+    headers = dict(line.split(": ", 1) for line in header_lines if line)
+    status = int(status_line.split(" ")[1])
+
+    body = bytearray()
+    first_byte = None
+    if headers.get("Transfer-Encoding") == "chunked":
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            if size == 0:
+                break
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            body += await reader.readexactly(size)
+            await reader.readexactly(2)
+    else:
+        body += await reader.read()
+        first_byte = time.perf_counter() - start
+    writer.close()
+    return status, headers, bytes(body), first_byte
+
+
+async def run_load(host, port, requests, concurrency, distinct, duration_sec, renderer="sample"):
+    # Fires `requests` renders, `concurrency` at a time, cycling through `distinct` parameter sets so
+    # repeated sets exercise coalescing and the cache
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(i)
+    results = []
+
+    async def client():
+        while not queue.empty():
+            i = queue.get_nowait()
+            query = urlencode({"hour": i % distinct % 24, "seed": i % distinct // 24, "duration": duration_sec,
+                               "renderer": renderer})
+            start = time.perf_counter()
+            try:
+                status, headers, body, first_byte = await fetch(host, port, f"/render?{query}")
+            except (OSError, asyncio.IncompleteReadError) as exc:
+                results.append({"status": type(exc).__name__, "latency": time.perf_counter() - start})
+                continue
+            results.append({"status": status, "latency": time.perf_counter() - start, "first_byte": first_byte,
+                            "bytes": len(body), "source": headers.get("X-Render-Source")})
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return summarize(results, time.perf_counter() - start)
+
+
+def summarize(results, wall_sec):
+    ok = [result for result in results if result["status"] == 200]
+    latencies = sorted(result["latency"] for result in ok)
+    first_bytes = sorted(result["first_byte"] for result in ok if result["first_byte"] is not None)
+    sources = {}
+    for result in ok:
+        sources[result["source"]] = sources.get(result["source"], 0) + 1
+    return {
+        "requests": len(results),
+        "ok": len(ok),
+        "wall_sec": wall_sec,
+        "requests_per_sec": len(ok) / wall_sec,
+        "mb_per_sec": sum(result["bytes"] for result in ok) / wall_sec / 1e6,
+        "p50_sec": percentile(latencies, 50),
+        "p99_sec": percentile(latencies, 99),
+        "first_byte_p50_sec": percentile(first_bytes, 50),
+        "first_byte_p99_sec": percentile(first_bytes, 99),
+        "sources": sources,
+    }
+
+
+def percentile(values, pct):
+    # Nearest-rank percentile of sorted values
+    if not values:
+        return None
+    return values[max(0, math.ceil(pct / 100 * len(values)) - 1)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Asyncio HTTP service streaming Mood Ring renders, plus a load generator.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="Run the render service")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--workers", type=int, default=None, help="Render threads (default: CPU count)")
+    serve_parser.add_argument("--cache-dir", default=".render_cache", help="Empty string keeps the cache in memory only")
+    serve_parser.add_argument("--soundfont", default="soundfonts/FluidR3_GM.sf2")
+
+    load_parser = commands.add_parser("load", help="Measure latency and throughput of a running service")
+    load_parser.add_argument("--host", default="127.0.0.1")
+    load_parser.add_argument("--port", type=int, default=8765)
+    load_parser.add_argument("--requests", type=int, default=100)
+    load_parser.add_argument("--concurrency", type=int, default=10)
+    load_parser.add_argument("--distinct", type=int, default=8, help="Number of different parameter sets to cycle through")
+    load_parser.add_argument("--duration", type=int, default=30, help="Seconds of audio per request")
+    load_parser.add_argument("--renderer", choices=["sample", "soundfont"], default="sample")
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        service = RenderService(args.workers, RenderCache(cache_dir=args.cache_dir or None), args.soundfont)
+        try:
+            asyncio.run(service.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    report = asyncio.run(run_load(args.host, args.port, args.requests, args.concurrency, args.distinct,
+                                  args.duration, args.renderer))
+    print(f"{report['ok']}/{report['requests']} ok in {report['wall_sec']:.2f}s: "
+          f"{report['requests_per_sec']:.1f} req/s, {report['mb_per_sec']:.1f} MB/s")
+    for name in ("p50_sec", "p99_sec", "first_byte_p50_sec", "first_byte_p99_sec"):
+        if report[name] is not None:
+            print(f"  {name[:-4]:<16} {report[name] * 1000:9.1f} ms")
+    print(f"  sources          {report['sources']}")
+    return 0 if report["ok"] == report["requests"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+import copy
+import hashlib
+import os
+import re
+import threading
+
+import numpy as np
+from scipy.io.wavfile import read
+
+from pitch_cache import resample_to_length
+
+# "C4", "F#3", "Bb2_v80": note name, octave and an optional velocity layer (the layer's top velocity)
+SAMPLE_NAME = re.compile(r"^([A-Ga-g])([#b]?)(-?\d)(?:_v(\d{1,3}))?$")
+NOTE_OFFSETS = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+
+INDEX_DTYPE = np.dtype([
+    ("midi_note", np.int16),     # -1 for unpitched one-shots such as kick and snare
+    ("velocity", np.uint8),
+    ("sample_rate", np.int32),
+    ("frames", np.int64),        # length in the file
+    ("out_frames", np.int64),    # length after conversion to the bank's sample rate
+    ("channels", np.uint8),
+])
+
+
+def parse_sample_name(name):
+    # Returns (midi_note, velocity) for pitched sample names, None otherwise
+    match = SAMPLE_NAME.match(name)
+    if not match:
+        return None
+    letter, accidental, octave, velocity = match.groups()
+    midi_note = 12 * (int(octave) + 1) + NOTE_OFFSETS[letter.upper()] + {"#": 1, "b": -1, "": 0}[accidental]
+    return midi_note, int(velocity) if velocity else 127
+
+
+def midi_to_freq(midi_note):
+    return 440.0 * (2 ** ((midi_note - 69) / 12))
+
+
+class SampleBank:
+    # Index of every WAV under a folder, built from headers only. PCM stays memory-mapped on disk until
+    # a sample is first played, so resident memory follows the samples in use, not the library size
+    def __init__(self, folder, sample_rate=44100, resample_mode="fft"):
+        self.folder = folder
+        self.sample_rate = sample_rate
+        self.resample_mode = resample_mode
+        self.names = []
+        self.paths = []
+        self.positions = {}
+        self._loaded = {}
+        self._one_shots = {}
+        self._digests = {}
+        self._lock = threading.Lock()
+        self.index = self._build_index()
+        self._pitched = np.flatnonzero(self.index["midi_note"] >= 0)
+
+    def _build_index(self):
+        rows = []
+        for root, _, files in os.walk(self.folder):
+            for filename in sorted(files):
+                if not filename.lower().endswith(".wav"):
+                    continue
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, self.folder)[:-len(".wav")].replace(os.sep, "/")
+                sr, data = _read_wav(path)
+                parsed = parse_sample_name(os.path.basename(name))
+                midi_note, velocity = parsed if parsed else (-1, 127)
+                frames = len(data)
+                # Rate conversion is settled here: out_frames is what every later resample targets
+                out_frames = frames if sr == self.sample_rate else int(round(frames * self.sample_rate / sr))
+                channels = 1 if data.ndim == 1 else data.shape[1]
+                rows.append((midi_note, velocity, sr, frames, out_frames, channels))
+                self.positions[name] = len(self.names)
+                self.names.append(name)
+                self.paths.append(path)
+                del data
+        return np.array(rows, dtype=INDEX_DTYPE)
+
+    def at_rate(self, sample_rate, resample_mode=None):
+        # The same library for another output rate: loaded PCM and digests are shared, only the
+        # rate-dependent lengths and converted one-shots are new
+        resample_mode = resample_mode or self.resample_mode
+        if sample_rate == self.sample_rate and resample_mode == self.resample_mode:
+            return self
+        bank = copy.copy(self)
+        bank.sample_rate = sample_rate
+        bank.resample_mode = resample_mode
+        bank.index = self.index.copy()
+        converted = np.round(bank.index["frames"] * sample_rate / bank.index["sample_rate"]).astype(np.int64)
+        bank.index["out_frames"] = np.where(bank.index["sample_rate"] == sample_rate, bank.index["frames"], converted)
+        bank._one_shots = {}
+        return bank
+
+    def __contains__(self, name):
+        return name in self.positions
+
+    def __len__(self):
+        return len(self.names)
+
+    def _position(self, name):
+        return self.positions[name]
+
+    def raw(self, name):
+        # float32 mono at the file's own sample rate; the first call maps the file and converts it
+        with self._lock:
+            if name not in self._loaded:
+                sr, data = _read_wav(self.paths[self._position(name)])
+                self._digests[name] = hashlib.blake2b(np.ascontiguousarray(data), digest_size=16).hexdigest()
+                data = _to_float(data)
+                if data.ndim == 2:
+                    data = data.mean(axis=1, dtype=np.float32)
+                self._loaded[name] = (sr, data)
+            return self._loaded[name]
+
+    def digest(self, name):
+        # Content digest so renderers sharing the pitch cache never mix up sample sets
+        self.raw(name)
+        return self._digests[name]
+
+    def one_shot(self, name):
+        # Unpitched use at the bank's sample rate
+        sr, data = self.raw(name)
+        if sr == self.sample_rate:
+            return data
+        with self._lock:
+            if name not in self._one_shots:
+                out_frames = int(self.index["out_frames"][self._position(name)])
+                self._one_shots[name] = resample_to_length(data, out_frames, self.resample_mode)
+            return self._one_shots[name]
+
+    def nearest(self, midi_note, velocity=127):
+        # Pitched sample needing the smallest shift; among equally near notes the velocity layer
+        # covering the requested velocity wins, then the lower note
+        if not len(self._pitched):
+            return None
+        candidates = self.index[self._pitched]
+        distance = np.abs(candidates["midi_note"].astype(np.int64) - midi_note)
+        layers = candidates["velocity"].astype(np.int64)
+        # Layers that cover the velocity first (quietest such layer), otherwise the loudest layer
+        layer_rank = np.where(layers >= velocity, layers, 1000 - layers)
+        order = np.lexsort((candidates["midi_note"], layer_rank, distance))
+        return self.names[self._pitched[order[0]]]
+
+    def root_note(self, name):
+        return int(self.index["midi_note"][self._position(name)])
+
+    def resident_bytes(self):
+        with self._lock:
+            return (sum(data.nbytes for _, data in self._loaded.values())
+                    + sum(data.nbytes for data in self._one_shots.values()))
+
+
+def _read_wav(path):
+    # mmap=True only parses the header, but scipy cannot map 24-bit PCM (or any width it widens on read);
+    # those files are read in full instead and come back as left-justified int32
+    try:
+        return read(path, mmap=True)
+    except ValueError:
+        return read(path)
+
+
+def _to_float(data):
+    if data.dtype.kind == "f":
+        return data.astype(np.float32)
+    if data.dtype == np.uint8:
+        return (data.astype(np.float32) - 128) / 128.0
+    return data.astype(np.float32) / float(-np.iinfo(data.dtype).min)
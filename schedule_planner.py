@@ -0,0 +1,111 @@
+import numpy as np
+
+from mood_schedule import allowed_activities, bpm_mapping, calculate_alignment, calculate_bpm, diurnal_energy, song_key
+
+ENERGIES = list(bpm_mapping)
+ALIGNMENTS = ["✅ Enhance", "❌ Oppose", "⚪ Neutral"]
+HOUR_ENERGY = np.array([ENERGIES.index(energy) for energy in diurnal_energy], dtype=np.uint8)
+
+
+def _compile_rules():
+    # Evaluate the scalar rules once for every (activity, energy) pair, so the tables cannot drift from them
+    keys = []
+    alignment = np.empty((len(allowed_activities), len(ENERGIES)), dtype=np.uint8)
+    bpm = np.empty(alignment.shape, dtype=np.int16)
+    key = np.empty(alignment.shape, dtype=np.uint8)
+    for a, activity in enumerate(allowed_activities):
+        for e, energy in enumerate(ENERGIES):
+            name = calculate_alignment(activity, energy)
+            alignment[a, e] = ALIGNMENTS.index(name)
+            bpm[a, e] = calculate_bpm(energy, name)
+            key_scale = song_key(name, energy)
+            if key_scale not in keys:
+                keys.append(key_scale)
+            key[a, e] = keys.index(key_scale)
+    return alignment, bpm, key, keys
+
+
+ALIGNMENT_TABLE, BPM_TABLE, KEY_TABLE, KEYS = _compile_rules()
+KEY_ROOTS = np.array([key_root for key_root, _ in KEYS])
+SCALE_TYPES = np.array([scale_type for _, scale_type in KEYS])
+
+
+def encode_activities(schedules):
+    # (users, 24) activity names -> uint8 codes into allowed_activities; integer input is taken as codes already
+    schedules = np.asarray(schedules)
+    if schedules.ndim == 1:
+        schedules = schedules[None, :]
+    if schedules.shape[1] != 24:
+        raise ValueError(f"Schedules need 24 hourly activities, got {schedules.shape[1]}")
+    if schedules.dtype.kind in "iu":
+        if schedules.size and (schedules.min() < 0 or schedules.max() >= len(allowed_activities)):
+            raise ValueError("Activity codes must index allowed_activities")
+        return schedules.astype(np.uint8)
+
+    codes = np.full(schedules.shape, 255, dtype=np.uint8)
+    for code, activity in enumerate(allowed_activities):
+        codes[schedules == activity] = code
+    unknown = codes == 255
+    if unknown.any():
+        user, hour = np.argwhere(unknown)[0]
+        raise ValueError(f"Unknown activity for user {user} at {hour:02d}:00: {schedules[user, hour]}")
+    return codes
+
+
+class SchedulePlan:
+    # Per-user, per-hour plan as small integer arrays; names are decoded only on request
+    def __init__(self, activity):
+        self.activity = activity
+        self.energy = np.broadcast_to(HOUR_ENERGY, activity.shape)
+        rule = activity.astype(np.intp) * len(ENERGIES) + HOUR_ENERGY
+        self.alignment = ALIGNMENT_TABLE.ravel()[rule]
+        self.bpm = BPM_TABLE.ravel()[rule]
+        self.key = KEY_TABLE.ravel()[rule]
+
+    def __len__(self):
+        return len(self.activity)
+
+    @property
+    def key_root(self):
+        return KEY_ROOTS[self.key]
+
+    @property
+    def scale_type(self):
+        return SCALE_TYPES[self.key]
+
+    def rows(self, user=0):
+        # One user's day in the same shape as mood_schedule.plan_hour
+        return [{
+            "hour": hour,
+            "activity": allowed_activities[self.activity[user, hour]],
+            "energy": ENERGIES[self.energy[user, hour]],
+            "alignment": ALIGNMENTS[self.alignment[user, hour]],
+            "bpm": int(self.bpm[user, hour]),
+            "key_root": KEYS[self.key[user, hour]][0],
+            "scale_type": KEYS[self.key[user, hour]][1],
+        } for hour in range(24)]
+
+    def render_jobs(self, melody_method="Markov", melody_length=16, duration_sec=30, seed=0):
+        # A render is fully determined by (bpm, key, energy), which depends only on (activity, hour), so
+        # dedupe over the at most 5 x 24 pairs that occur instead of over every user. Returns the job list
+        # and a (users, 24) array of indices into it
+        from prerender import plan_job
+
+        seen = np.zeros((len(allowed_activities), 24), dtype=bool)
+        seen[self.activity, np.arange(24)] = True
+        pair_job = np.full(seen.shape, -1, dtype=np.int32)
+        jobs, job_ids = [], {}
+        for hour in range(24):
+            for activity in np.flatnonzero(seen[:, hour]):
+                rule = activity * len(ENERGIES) + HOUR_ENERGY[hour]
+                combo = (int(BPM_TABLE.flat[rule]), int(KEY_TABLE.flat[rule]), int(HOUR_ENERGY[hour]))
+                if combo not in job_ids:
+                    job_ids[combo] = len(jobs)
+                    jobs.append(plan_job(hour, allowed_activities[activity], melody_method, melody_length,
+                                         duration_sec, seed))
+                pair_job[activity, hour] = job_ids[combo]
+        return jobs, pair_job[self.activity, np.arange(24)]
+
+
+def plan_schedules(schedules):
+    return SchedulePlan(encode_activities(schedules))
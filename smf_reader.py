@@ -0,0 +1,114 @@
+import struct
+
+import numpy as np
+
+from smf_writer import NOTE_ON, TRACK_EVENT_DTYPE
+
+KEY_SIGNATURE = 0x59
+END_OF_TRACK = 0x2F
+# Data bytes that follow each channel-message type (status >> 4)
+_DATA_BYTES = [0] * 8 + [2, 2, 2, 2, 1, 1, 2, 0]
+
+
+class SmfError(ValueError):
+    pass
+
+
+class SmfFile:
+    # Channel messages per track as TRACK_EVENT_DTYPE arrays with absolute ticks, plus the key signatures
+    # as (tick, sharps/flats, minor); meta and sysex payloads are skipped without building objects
+    def __init__(self, ticks_per_beat, tracks, key_signatures):
+        self.ticks_per_beat = ticks_per_beat
+        self.tracks = tracks
+        self.key_signatures = key_signatures
+
+    def note_ons(self, track):
+        # Note-on messages with a non-zero velocity, i.e. actual note starts
+        events = self.tracks[track]
+        return events[((events["status"] & 0xF0) == NOTE_ON) & (events["data2"] > 0)]
+
+
+def read_vlq(data, pos):
+    value = 0
+    while True:
+        if pos >= len(data):
+            raise SmfError("Truncated variable-length quantity")
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, pos
+
+
+def parse_track(data, key_signatures):
+    ticks, statuses, data1s, data2s = [], [], [], []
+    pos, tick, running = 0, 0, 0
+    while pos < len(data):
+        delta, pos = read_vlq(data, pos)
+        tick += delta
+        status = data[pos]
+        if status & 0x80:
+            pos += 1
+        elif running:
+            status = running
+        else:
+            raise SmfError("Data byte without a running status")
+
+        if status == 0xFF:
+            meta_type = data[pos]
+            length, pos = read_vlq(data, pos + 1)
+            if meta_type == KEY_SIGNATURE and length >= 2:
+                # Sharps (+) or flats (-) is a signed byte
+                key_signatures.append((tick, (data[pos] ^ 0x80) - 0x80, data[pos + 1]))
+            pos += length
+            if meta_type == END_OF_TRACK:
+                break
+        elif status in (0xF0, 0xF7):
+            length, pos = read_vlq(data, pos)
+            pos += length
+        else:
+            # Running status applies to channel messages only
+            running = status
+            count = _DATA_BYTES[status >> 4]
+            ticks.append(tick)
+            statuses.append(status)
+            data1s.append(data[pos])
+            data2s.append(data[pos + 1] if count == 2 else 0)
+            pos += count
+
+    events = np.zeros(len(ticks), dtype=TRACK_EVENT_DTYPE)
+    events["tick"] = ticks
+    events["status"] = statuses
+    events["data1"] = data1s
+    events["data2"] = data2s
+    return events
+
+
+def read_smf(data):
+    data = memoryview(data)
+    if bytes(data[:4]) != b"MThd":
+        raise SmfError("Not a Standard MIDI File")
+    if len(data) < 14:
+        raise SmfError("Truncated header")
+    header_length, _, num_tracks, division = struct.unpack(">IHHH", data[4:14])
+    if header_length < 6:
+        raise SmfError("Header chunk too short")
+    pos = 8 + header_length
+    tracks, key_signatures = [], []
+    while len(tracks) < num_tracks and pos + 8 <= len(data):
+        chunk_type, length = bytes(data[pos:pos + 4]), struct.unpack(">I", data[pos + 4:pos + 8])[0]
+        chunk = data[pos + 8:pos + 8 + length]
+        pos += 8 + length
+        # Unknown chunk types are allowed by the spec and skipped
+        if chunk_type == b"MTrk":
+            try:
+                tracks.append(parse_track(chunk, key_signatures))
+            except IndexError:
+                raise SmfError("Truncated track") from None
+    key_signatures.sort()
+    return SmfFile(division, tracks, key_signatures)
+
+
+def read_smf_file(path):
+    with open(path, "rb") as f:
+        return read_smf(f.read())
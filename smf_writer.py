@@ -0,0 +1,92 @@
+import struct
+
+import numpy as np
+
+NOTE_OFF = 0x80
+NOTE_ON = 0x90
+CONTROL_CHANGE = 0xB0
+PROGRAM_CHANGE = 0xC0
+
+# Order of message types sharing a tick: program and controllers first, then note-offs, then note-ons
+_TICK_PRIORITY = np.full(16, 4)
+_TICK_PRIORITY[[PROGRAM_CHANGE >> 4, CONTROL_CHANGE >> 4, NOTE_OFF >> 4, NOTE_ON >> 4]] = [0, 1, 2, 3]
+
+TRACK_EVENT_DTYPE = np.dtype([
+    ("tick", np.int64),
+    ("status", np.uint8),  # message type | channel
+    ("data1", np.uint8),
+    ("data2", np.uint8),
+])
+
+
+def encode_vlq(values):
+    # Variable-length quantities for a whole column at once: an (n, 4) byte matrix plus a mask of the bytes used
+    values = np.asarray(values, dtype=np.int64)
+    lengths = 1 + (values >= 1 << 7) + (values >= 1 << 14) + (values >= 1 << 21)
+    position = np.arange(4)
+    shifts = np.maximum(7 * (lengths[:, None] - 1 - position), 0)
+    groups = (values[:, None] >> shifts) & 0x7F
+    groups |= np.where(position < lengths[:, None] - 1, 0x80, 0)
+    return groups.astype(np.uint8), position < lengths[:, None]
+
+
+def make_track_events(ticks, status, data1, data2=0):
+    events = np.zeros(len(ticks), dtype=TRACK_EVENT_DTYPE)
+    events["tick"] = ticks
+    events["status"] = status
+    events["data1"] = data1
+    events["data2"] = data2
+    return events
+
+
+def note_events(starts, lengths, notes, velocities, channel):
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = starts + np.asarray(lengths, dtype=np.int64)
+    count = len(starts)
+    return make_track_events(
+        np.concatenate([ends, starts]),
+        np.concatenate([np.full(count, NOTE_OFF | channel), np.full(count, NOTE_ON | channel)]),
+        np.concatenate([np.broadcast_to(notes, count), np.broadcast_to(notes, count)]),
+        np.concatenate([np.zeros(count), np.broadcast_to(velocities, count)]),
+    )
+
+
+def meta_event(meta_type, payload):
+    length, used = encode_vlq([len(payload)])
+    return bytes([0x00, 0xFF, meta_type]) + length[used].tobytes() + payload
+
+
+def track_name(name):
+    return meta_event(0x03, name.encode("latin-1"))
+
+
+def set_tempo(bpm):
+    return meta_event(0x51, round(60_000_000 / bpm).to_bytes(3, "big"))
+
+
+def time_signature(numerator=4, denominator=4):
+    return meta_event(0x58, bytes([numerator, denominator.bit_length() - 1, 24, 8]))
+
+
+def encode_track(events, prefix=b""):
+    # Channel events are sorted stably by tick, delta-encoded and written with running status.
+    # Meta events only appear in `prefix`, so running status is never interrupted mid-track
+    order = np.lexsort((_TICK_PRIORITY[events["status"] >> 4], events["tick"]))
+    events = events[order]
+    deltas = np.diff(events["tick"], prepend=0)
+    status = events["status"]
+    send_status = np.ones(len(events), dtype=bool)
+    send_status[1:] = status[1:] != status[:-1]
+    has_data2 = (status & 0xF0 != PROGRAM_CHANGE) & (status & 0xF0 != 0xD0)
+
+    vlq, vlq_used = encode_vlq(deltas)
+    columns = np.column_stack((vlq, status, events["data1"], events["data2"]))
+    used = np.column_stack((vlq_used, send_status, np.ones(len(events), dtype=bool), has_data2))
+    body = prefix + columns[used].astype(np.uint8).tobytes() + b"\x00\xFF\x2F\x00"
+    return b"MTrk" + struct.pack(">I", len(body)) + body
+
+
+def write_smf(tracks, ticks_per_beat=480):
+    # tracks: encoded MTrk chunks; always written as format 1
+    header = b"MThd" + struct.pack(">IHHH", 6, 1, len(tracks), ticks_per_beat)
+    return header + b"".join(tracks)
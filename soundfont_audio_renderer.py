@@ -2,55 +2,177 @@
 import io
 import os
 import random
+import threading
+from contextlib import contextmanager
 import numpy as np
 import fluidsynth
-from scipy.io.wavfile import write
+
+from instrumentation import DISABLED
+from preview import PREVIEW_MEASURES, PREVIEW_SAMPLE_RATE, RenderTiming, preview_duration
+from soundfont_sequencer import SoundFontSequencer, sequence_from_notes
+from wav_writer import WavWriter, iter_wav_chunks, write_wav
 
 class SoundFontAudioRenderer:
-    def __init__(self, soundfont_path="soundfonts/FluidR3_GM.sf2", sample_rate=44100, bank=0, program=0):
+    # The synth renders interleaved stereo; every output here is (frames, 2)
+    channels = 2
+
+    def __init__(self, soundfont_path="soundfonts/FluidR3_GM.sf2", sample_rate=44100, bank=0, program=0, pool=None,
+                 profiler=None, timing=None):
+        self.soundfont_path = soundfont_path
         self.sample_rate = sample_rate
-        self.fs = fluidsynth.Synth(samplerate=sample_rate)
-        self.fs.start(driver="file")  # Prevent trying to use system audio drivers
-        self.sfid = self.fs.sfload(soundfont_path)
+        self.pool = pool
+        self.profiler = profiler or DISABLED
+        self.fs = None
+        self.last_sequence_stats = None
         self.bank = bank
         self.program = program
-        self.set_instrument(bank, program)
-        self.fs.cc(0, 7, 127)  # Max out volume for channel 0
+        # Pass a shared RenderTiming when renderers are built per request, so previews can be compared
+        # with earlier full renders
+        self.timing = timing or RenderTiming()
+        self._preview_renderers = {}
+        self._preview_lock = threading.Lock()
+        if pool is None:
+            self.fs = fluidsynth.Synth(samplerate=sample_rate)
+            self.fs.start(driver="file")  # Prevent trying to use system audio drivers
+            self.sfid = self.fs.sfload(soundfont_path)
+            self.set_instrument(bank, program)
+            self.fs.cc(0, 7, 127)  # Max out volume for channel 0
 
     def set_instrument(self, bank, program):
         self.bank = bank
         self.program = program
-        self.fs.program_select(0, self.sfid, bank, program)
+        if self.fs is not None:
+            self.fs.program_select(0, self.sfid, bank, program)
+
+    @contextmanager
+    def _synth(self):
+        # Pooled renderers borrow a preloaded synth for the length of one render
+        if self.pool is None:
+            yield self.fs, self.sfid
+        else:
+            with self.profiler.stage("synth_checkout"):
+                synth = self.pool.checkout(self.bank, self.program)
+            try:
+                yield synth.fs, synth.sfid
+            finally:
+                self.pool.checkin(synth)
 
-    def generate_song_audio(self, bpm, key_root="C", scale_type="major", melody_notes=None, duration_sec=30, energy="Moderate"):
-        beats_per_sec = bpm / 60
+    def _melody_sequence(self, bpm, melody_notes, duration_sec, seed=None):
+        # One note per beat, back to back, each with a random velocity and a length within 20% of a beat.
+        # The jitter is drawn from the song's seed, so renders cached under that seed are reproducible
+        rng = random.Random(seed)
         note_duration_sec = 60 / bpm
-        total_notes = int(duration_sec * beats_per_sec)
+        total_notes = int(duration_sec * bpm / 60)
         melody_notes = (melody_notes * ((total_notes // len(melody_notes)) + 1))[:total_notes]
+        rows = []
+        start_sec = 0.0
+        for midi_note in melody_notes:
+            velocity = rng.randint(80, 127)
+            adjusted_duration_sec = note_duration_sec * rng.uniform(0.8, 1.2)
+            rows.append((start_sec, adjusted_duration_sec, midi_note, velocity, 0))
+            start_sec += adjusted_duration_sec
+        return sequence_from_notes(rows, self.sample_rate)
 
-        audio = []
+    @contextmanager
+    def _sequencer(self):
+        with self._synth() as (fs, sfid):
+            fs.program_select(0, sfid, self.bank, self.program)
+            yield SoundFontSequencer(fs, sfid, self.sample_rate)
 
-        for midi_note in melody_notes:
-            velocity = random.randint(80, 127)
-            adjusted_duration_sec = note_duration_sec * random.uniform(0.8, 1.2)
+    def _song_seconds(self, bpm, duration_sec):
+        # Nominal length: one beat per melody note; individual notes vary by up to 20% either way
+        return int(duration_sec * bpm / 60) * 60 / bpm
+
+    def generate_song_audio(self, bpm, key_root="C", scale_type="major", melody_notes=None, duration_sec=30, energy="Moderate",
+                            seed=None):
+        with self.timing.full(self._song_seconds(bpm, duration_sec)):
+            return self._render_song(bpm, melody_notes, duration_sec, seed)
+
+    def _render_song(self, bpm, melody_notes, duration_sec, seed=None):
+        # (frames, 2) int16 stereo, ending with the last note-off as the note-by-note render did
+        events = self._melody_sequence(bpm, melody_notes, duration_sec, seed)
+        with self._sequencer() as sequencer, self.profiler.stage("synth_render"):
+            return sequencer.render(events, tail_sec=0)
+
+    def iter_song_blocks(self, bpm, key_root="C", scale_type="major", melody_notes=None, duration_sec=30,
+                         energy="Moderate", block_size=4096, dtype=np.int16, normalize=None, seed=None):
+        # Synth output is never normalized, so there is no pre-pass; normalize is accepted (and ignored) so
+        # callers can stream from either renderer alike
+        events = self._melody_sequence(bpm, melody_notes, duration_sec, seed)
+        return self._iter_sequence_blocks(events, block_size, dtype)
+
+    def _iter_sequence_blocks(self, events, block_size, dtype):
+        with self._sequencer() as sequencer:
+            for block in sequencer.iter_blocks(events, tail_sec=0, block_size=block_size):
+                if np.dtype(dtype) == np.int16:
+                    yield block
+                else:
+                    yield (block / 32767).astype(dtype)
+
+    def write_song_wav(self, fileobj, bpm, key_root="C", scale_type="major", melody_notes=None, duration_sec=30,
+                       energy="Moderate", block_size=4096, normalize=None, seed=None):
+        # Note lengths are random, but they are all drawn before rendering, so the header is exact up front
+        events = self._melody_sequence(bpm, melody_notes, duration_sec, seed)
+        num_frames = int(events["frame"][-1]) if len(events) else 0
+        with self.profiler.stage("wav_stream"):
+            return write_wav(fileobj, self._iter_sequence_blocks(events, block_size, np.int16), self.sample_rate,
+                             self.channels, num_frames)
+
+    def iter_song_wav(self, bpm, key_root="C", scale_type="major", melody_notes=None, duration_sec=30,
+                      energy="Moderate", block_size=4096, normalize=None, seed=None):
+        events = self._melody_sequence(bpm, melody_notes, duration_sec, seed)
+        num_frames = int(events["frame"][-1]) if len(events) else 0
+        return iter_wav_chunks(self._iter_sequence_blocks(events, block_size, np.int16), self.sample_rate,
+                               self.channels, num_frames)
 
-            self.fs.program_select(0, self.sfid, self.bank, self.program)
-            self.fs.noteon(0, midi_note, velocity)
+    def render_preview(self, bpm, key_root="C", scale_type="major", melody_notes=None, duration_sec=30,
+                       energy="Moderate", sample_rate=PREVIEW_SAMPLE_RATE, measures=PREVIEW_MEASURES, seed=None):
+        # The opening measures from a synth running at a reduced rate, as a WAV buffer. measures=None
+        # previews the whole song. Latency and speedup are reported by preview_stats()
+        renderer = self.preview_renderer(sample_rate)
+        renderer.profiler = self.profiler
+        renderer.set_instrument(self.bank, self.program)
+        preview_sec = preview_duration(bpm, duration_sec, measures)
+        audio_sec, song_sec = self._song_seconds(bpm, preview_sec), self._song_seconds(bpm, duration_sec)
+        with self.timing.preview_render(sample_rate, audio_sec, song_sec), self.profiler.stage("preview"):
+            return renderer.export_wav(renderer._render_song(bpm, melody_notes, preview_sec, seed))
 
-            sample_count = int(self.sample_rate * adjusted_duration_sec)
-            samples = self.fs.get_samples(sample_count)
+    def preview_stats(self):
+        return self.timing.preview_stats()
 
-            self.fs.noteoff(0, midi_note)
-            audio.extend(samples)
+    def preview_renderer(self, sample_rate=PREVIEW_SAMPLE_RATE):
+        # Synths are built for one rate, so previews come from a second renderer with its own synth
+        # (or its own process-wide pool at that rate)
+        if sample_rate == self.sample_rate:
+            return self
+        with self._preview_lock:
+            if sample_rate not in self._preview_renderers:
+                pool = None
+                if self.pool is not None:
+                    from synth_pool import get_synth_pool
+                    pool = get_synth_pool(self.pool.soundfont_path, sample_rate, self.pool.size)
+                self._preview_renderers[sample_rate] = SoundFontAudioRenderer(
+                    self.soundfont_path, sample_rate, self.bank, self.program, pool=pool, profiler=self.profiler
+                )
+            return self._preview_renderers[sample_rate]
 
-        audio_np = (np.array(audio) * 32767).astype(np.int16)
-        return audio_np
+    def render_sequence(self, events, tail_sec=1.0):
+        # events: a time-ordered SEQ_EVENT_DTYPE array or a mido.MidiFile; returns (frames, 2) int16
+        with self._synth() as (fs, sfid), self.profiler.stage("sequence"):
+            sequencer = SoundFontSequencer(fs, sfid, self.sample_rate)
+            audio = sequencer.render(events, tail_sec)
+        self.last_sequence_stats = sequencer.last_stats
+        return audio
 
     def export_wav(self, audio_data):
-        buffer = io.BytesIO()
-        write(buffer, self.sample_rate, audio_data)
-        buffer.seek(0)
+        with self.profiler.stage("wav_encode"):
+            buffer = io.BytesIO()
+            channels = audio_data.shape[1] if audio_data.ndim == 2 else 1
+            with WavWriter(buffer, self.sample_rate, channels, num_frames=len(audio_data)) as writer:
+                writer.write(audio_data)
+            buffer.seek(0)
         return buffer
 
     def __del__(self):
-        self.fs.delete()
\ No newline at end of file
+        if self.fs is not None:
+            self.fs.delete()
\ No newline at end of file
@@ -0,0 +1,156 @@
+import time
+
+import numpy as np
+import fluidsynth
+
+SEQ_EVENT_DTYPE = np.dtype([
+    ("frame", np.int64),
+    ("kind", np.int8),
+    ("channel", np.int8),
+    ("data1", np.int16),  # note, program or controller number
+    ("data2", np.int16),  # velocity or controller value
+])
+
+# Kinds double as the tie-break order for events on the same frame
+PROGRAM, CONTROL, NOTE_OFF, NOTE_ON = range(4)
+
+# pyfluidsynth's get_samples allocates a fresh buffer per call; the raw writer renders in place
+_write_s16 = getattr(fluidsynth, "fluid_synth_write_s16", None)
+
+
+def make_sequence(frames, kinds, channels, data1, data2=0):
+    events = np.zeros(len(frames), dtype=SEQ_EVENT_DTYPE)
+    events["frame"] = frames
+    events["kind"] = kinds
+    events["channel"] = channels
+    events["data1"] = data1
+    events["data2"] = data2
+    return events[np.lexsort((events["kind"], events["frame"]))]
+
+
+def sequence_from_notes(notes, sample_rate=44100, programs=None):
+    # notes: (start_sec, duration_sec, midi_note, velocity, channel) rows
+    notes = np.asarray(notes, dtype=np.float64).reshape(-1, 5)
+    starts = np.round(notes[:, 0] * sample_rate).astype(np.int64)
+    ends = np.round((notes[:, 0] + notes[:, 1]) * sample_rate).astype(np.int64)
+    channels = notes[:, 4].astype(np.int8)
+    program_channels = sorted((programs or {}).items())
+    return make_sequence(
+        np.concatenate([np.zeros(len(program_channels), dtype=np.int64), starts, ends]),
+        np.concatenate([np.full(len(program_channels), PROGRAM), np.full(len(notes), NOTE_ON), np.full(len(notes), NOTE_OFF)]),
+        np.concatenate([[c for c, _ in program_channels], channels, channels]),
+        np.concatenate([[p for _, p in program_channels], notes[:, 2], notes[:, 2]]),
+        np.concatenate([np.zeros(len(program_channels)), notes[:, 3], np.zeros(len(notes))]),
+    )
+
+
+def sequence_from_midi(midi_file, sample_rate=44100):
+    # Iterating a MidiFile merges its tracks and yields tempo-aware delta times in seconds
+    rows = []
+    now = 0.0
+    for msg in midi_file:
+        now += msg.time
+        frame = int(round(now * sample_rate))
+        if msg.type == "note_on" and msg.velocity > 0:
+            rows.append((frame, NOTE_ON, msg.channel, msg.note, msg.velocity))
+        elif msg.type in ("note_off", "note_on"):
+            rows.append((frame, NOTE_OFF, msg.channel, msg.note, 0))
+        elif msg.type == "program_change":
+            rows.append((frame, PROGRAM, msg.channel, msg.program, 0))
+        elif msg.type == "control_change":
+            rows.append((frame, CONTROL, msg.channel, msg.control, msg.value))
+    if not rows:
+        return np.zeros(0, dtype=SEQ_EVENT_DTYPE)
+    return make_sequence(*np.array(rows, dtype=np.int64).T)
+
+
+class SoundFontSequencer:
+    def __init__(self, fs, sfid, sample_rate=44100, block_frames=65536):
+        self.fs = fs
+        self.sfid = sfid
+        self.sample_rate = sample_rate
+        self.block_frames = block_frames
+        self.last_stats = None
+
+    def _write(self, out, start, count):
+        # Render `count` stereo frames straight into out[start:start + count], in bounded slices
+        end = start + count
+        while start < end:
+            frames = min(end - start, self.block_frames)
+            if _write_s16 is not None:
+                address = out[start:].ctypes.data
+                _write_s16(self.fs.synth, frames, address, 0, 2, address, 1, 2)
+            else:
+                out[start:start + frames] = np.asarray(self.fs.get_samples(frames)).reshape(-1, 2)
+            start += frames
+
+    def _apply(self, event):
+        kind, channel, data1, data2 = int(event["kind"]), int(event["channel"]), int(event["data1"]), int(event["data2"])
+        if kind == NOTE_ON:
+            self.fs.noteon(channel, data1, data2)
+        elif kind == NOTE_OFF:
+            self.fs.noteoff(channel, data1)
+        elif kind == PROGRAM:
+            bank = 128 if channel == 9 else 0  # General MIDI percussion lives on channel 10
+            self.fs.program_select(channel, self.sfid, bank, data1)
+        elif kind == CONTROL:
+            self.fs.cc(channel, data1, data2)
+
+    def total_frames(self, events, tail_sec=1.0):
+        last_frame = int(events["frame"][-1]) if len(events) else 0
+        return last_frame + int(tail_sec * self.sample_rate)
+
+    def render(self, events, tail_sec=1.0):
+        if not isinstance(events, np.ndarray):
+            events = sequence_from_midi(events, self.sample_rate)
+        start_time = time.perf_counter()
+
+        # One preallocated interleaved-stereo buffer for the whole sequence plus release tail
+        total_frames = self.total_frames(events, tail_sec)
+        out = np.empty((total_frames, 2), dtype=np.int16)
+
+        position = 0
+        for event in events:
+            frame = int(event["frame"])
+            if frame > position:
+                self._write(out, position, frame - position)
+                position = frame
+            self._apply(event)
+        self._write(out, position, total_frames - position)
+
+        render_sec = time.perf_counter() - start_time
+        audio_sec = total_frames / self.sample_rate
+        self.last_stats = {
+            "events": len(events),
+            "frames": total_frames,
+            "audio_sec": audio_sec,
+            "render_sec": render_sec,
+            # Render time per second of audio: below 1.0 is faster than real time
+            "real_time_factor": render_sec / audio_sec if audio_sec else 0.0,
+        }
+        return out
+
+    def iter_blocks(self, events, tail_sec=1.0, block_size=4096):
+        # The same audio as render() as (block_size, 2) int16 blocks, only the last one short, so memory
+        # stays bounded by the block size however long the sequence is
+        if not isinstance(events, np.ndarray):
+            events = sequence_from_midi(events, self.sample_rate)
+        total_frames = self.total_frames(events, tail_sec)
+        frames = events["frame"].tolist()
+        block = np.empty((block_size, 2), dtype=np.int16)
+        position = filled = i = 0
+        while position < total_frames:
+            while i < len(events) and frames[i] <= position:
+                self._apply(events[i])
+                i += 1
+            next_frame = frames[i] if i < len(events) else total_frames
+            count = min(next_frame, total_frames) - position
+            count = min(count, block_size - filled)
+            self._write(block, filled, count)
+            filled += count
+            position += count
+            if filled == block_size:
+                yield block.copy()
+                filled = 0
+        if filled:
+            yield block[:filled].copy()
@@ -0,0 +1,36 @@
+import numpy as np
+
+
+def rebuffer(chunks, block_size, dtype):
+    # Regroup variable-length chunks into fixed-size blocks; only the last block may be short
+    block = np.empty(block_size, dtype=dtype)
+    filled = 0
+    for chunk in chunks:
+        chunk = np.asarray(chunk)
+        while len(chunk):
+            take = min(block_size - filled, len(chunk))
+            block[filled:filled + take] = chunk[:take]
+            filled += take
+            chunk = chunk[take:]
+            if filled == block_size:
+                yield block.copy()
+                filled = 0
+    if filled:
+        yield block[:filled].copy()
+
+
+def tile(first, looped, num_samples, block_size):
+    # Fixed-size blocks of first followed by looped repeated, cut at num_samples
+    position = 0
+    while position < num_samples:
+        end = min(position + block_size, num_samples)
+        parts = []
+        while position < end:
+            if position < len(first):
+                source, offset = first, position
+            else:
+                source, offset = looped, (position - len(first)) % len(looped)
+            take = min(end - position, len(source) - offset)
+            parts.append(source[offset:offset + take])
+            position += take
+        yield parts[0].copy() if len(parts) == 1 else np.concatenate(parts)
@@ -0,0 +1,103 @@
+import queue
+import threading
+from contextlib import contextmanager
+
+
+class PooledSynth:
+    def __init__(self, soundfont_path, sample_rate):
+        import fluidsynth
+
+        self.fs = fluidsynth.Synth(samplerate=sample_rate)
+        self.fs.start(driver="file")  # Prevent trying to use system audio drivers
+        self.sfid = self.fs.sfload(soundfont_path)
+
+    def reset(self, bank, program):
+        # Silence ringing voices and restore controllers so the next session starts clean
+        self.fs.system_reset()
+        self.fs.program_select(0, self.sfid, bank, program)
+        self.fs.cc(0, 7, 127)  # Max out volume for channel 0
+
+    def delete(self):
+        self.fs.delete()
+
+
+class SynthPool:
+    def __init__(self, soundfont_path="soundfonts/FluidR3_GM.sf2", sample_rate=44100, size=2):
+        self.soundfont_path = soundfont_path
+        self.sample_rate = sample_rate
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def checkout(self, bank=0, program=0, timeout=None):
+        try:
+            synth = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                grow = self._created < self.size
+                if grow:
+                    self._created += 1
+            if grow:
+                try:
+                    synth = PooledSynth(self.soundfont_path, self.sample_rate)
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                # Every synth is busy: wait for a session to hand one back
+                synth = self._idle.get(timeout=timeout)
+        try:
+            synth.reset(bank, program)
+        except Exception:
+            self._replace(synth)
+            raise
+        return synth
+
+    def _replace(self, synth):
+        # A synth that failed to reset is in an unknown state. A fresh one takes its place in the idle queue,
+        # where a session waiting for a synth can pick it up; if that fails too, the slot is freed so a later
+        # checkout builds one. Either way the pool keeps its size
+        try:
+            synth.delete()
+            replacement = PooledSynth(self.soundfont_path, self.sample_rate)
+        except Exception:
+            with self._lock:
+                self._created -= 1
+        else:
+            self._idle.put(replacement)
+
+    def checkin(self, synth):
+        self._idle.put(synth)
+
+    @contextmanager
+    def synth(self, bank=0, program=0, timeout=None):
+        synth = self.checkout(bank, program, timeout)
+        try:
+            yield synth
+        finally:
+            self.checkin(synth)
+
+    def close(self):
+        while True:
+            try:
+                synth = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            synth.delete()
+            with self._lock:
+                self._created -= 1
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_synth_pool(soundfont_path="soundfonts/FluidR3_GM.sf2", sample_rate=44100, size=2):
+    # One pool per SoundFont and rate for the whole process; the first caller fixes the size
+    key = (soundfont_path, sample_rate)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = SynthPool(soundfont_path, sample_rate, size)
+        return _pools[key]
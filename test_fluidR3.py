@@ -1,30 +1,87 @@
-import time
-import fluidsynth
+import argparse
+import os
+import sys
 
-# Initialize FluidSynth
-sf_path = "soundfonts/FluidR3_GM.sf2"
-fs = fluidsynth.Synth()
-fs.start()
+import numpy as np
 
-# Load SoundFont
-sfid = fs.sfload(sf_path)
-fs.program_select(0, sfid, 0, 0)
+from audition_bank import DEFAULT_BANK_PATH, GM_PROGRAMS, REFERENCE_NOTES, AuditionBank, build_audition_bank, render_clip
 
-# Notes to Test (C3 to C5)
-test_notes = [48, 60, 72]  # C3, C4 (Middle C), C5
+# Quietest peak a clip may have and still count as sounding (about -50 dBFS)
+MIN_PEAK = 100
+# Strings, ensembles and pads: the long releases most likely to ring on into the next clip
+LONG_RELEASE_PROGRAMS = (48, 49, 50, 51, 52, 88, 89, 90, 91, 92, 93, 94, 95)
 
-print("🎹 Starting SoundFont Program Test...")
 
-for program in range(0, 128):
-    fs.program_select(0, sfid, 0, program)
-    print(f"Program {program}: Playing C3, C4, C5")
+def check_bank(bank, programs=GM_PROGRAMS, notes=REFERENCE_NOTES, min_peak=MIN_PEAK, reference=None,
+               reference_programs=LONG_RELEASE_PROGRAMS):
+    # Every problem found, as messages; an empty list means the bank is complete and every clip sounds.
+    # reference(program, note) renders a clip from a freshly reset synth; clips of reference_programs that
+    # differ from it carry the tail of the clip before them
+    problems = []
+    index = bank.index
+    ends = index["offset"] + index["frames"]
+    if len(index) and (index["offset"][0] != 0 or (index["offset"][1:] != ends[:-1]).any()):
+        problems.append("clips are not stored back to back")
+    if len(index) and ends[-1] != len(bank.pcm):
+        problems.append(f"index covers {int(ends[-1])} frames but the file holds {len(bank.pcm)}")
 
-    for note in test_notes:
-        fs.noteon(0, note, 100)
-        time.sleep(0.3)
-        fs.noteoff(0, note)
+    fingerprints = {}
+    for program in programs:
+        missing = [note for note in notes if (program, note) not in bank.positions]
+        if missing:
+            problems.append(f"program {program}: no clip for notes {missing}")
+            continue
+        for note in notes:
+            clip = bank.clip(program, note)
+            peak = int(np.abs(clip.astype(np.int32)).max()) if len(clip) else 0
+            if peak < min_peak:
+                problems.append(f"program {program} note {note}: silent (peak {peak})")
+        # Identical audio for two programs means a program change was lost while rendering
+        fingerprint = hash(bank.clip(program).tobytes())
+        if fingerprint in fingerprints:
+            problems.append(f"program {program}: same audio as program {fingerprints[fingerprint]}")
+        fingerprints.setdefault(fingerprint, program)
 
-    time.sleep(0.5)  # Pause before next program
+    if reference is not None:
+        for program in reference_programs:
+            for note in notes:
+                if (program, note) not in bank.positions:
+                    continue
+                clip, fresh = bank.clip(program, note).astype(np.int32), reference(program, note).astype(np.int32)
+                if clip.shape != fresh.shape:
+                    problems.append(f"program {program} note {note}: {len(clip)} frames, a fresh render has {len(fresh)}")
+                    continue
+                bleed = int(np.abs(clip - fresh).max()) if len(clip) else 0
+                if bleed >= min_peak:
+                    problems.append(f"program {program} note {note}: differs from a fresh render by {bleed}, "
+                                    "an earlier clip bleeds into it")
+    return problems
 
-print("🎵 Test Complete!")
-fs.delete()
\ No newline at end of file
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build (if needed) and verify the GM program audition bank.")
+    parser.add_argument("--bank", default=DEFAULT_BANK_PATH)
+    parser.add_argument("--soundfont", default="soundfonts/FluidR3_GM.sf2")
+    parser.add_argument("--rebuild", action="store_true", help="Render the bank again even if it exists")
+    args = parser.parse_args(argv)
+
+    if args.rebuild or not os.path.exists(args.bank):
+        print(f"🎹 Rendering audition clips for {len(GM_PROGRAMS)} programs...")
+        build_audition_bank(args.bank, args.soundfont)
+
+    from synth_pool import PooledSynth
+
+    bank = AuditionBank(args.bank)
+    synth = PooledSynth(args.soundfont, bank.sample_rate)
+    try:
+        problems = check_bank(bank, reference=lambda program, note: render_clip(synth, bank.sample_rate, program, note))
+    finally:
+        synth.delete()
+    for problem in problems:
+        print(f"❌ {problem}")
+    print(f"🎵 Checked {len(bank)} clips in {args.bank}: {'OK' if not problems else f'{len(problems)} problems'}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,16 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+
+@pytest.fixture
+def c4_samples(tmp_path):
+    # Drums and the C4 sample only, so every melody note shifts from C4 as the original renderer did
+    for name in ("C4", "kick", "snare"):
+        shutil.copy(os.path.join(REPO_DIR, "samples", f"{name}.wav"), tmp_path / f"{name}.wav")
+    return str(tmp_path)
@@ -0,0 +1,145 @@
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from scipy.io.wavfile import read
+from scipy.signal import resample
+
+from audio_renderer import AudioRenderer
+from event_table import render_stem
+
+MELODY = [60, 62, 64, 65, 67, 69, 71, 72]
+C4_HZ = 440.0 * 2 ** (-9 / 12)
+
+
+def reference_stems(sample_folder, bpm, melody_notes, duration_sec, sample_rate=44100):
+    # Drums and melody as the original per-beat, per-note loops built them. Pads are left out: the
+    # oscillator bank deliberately replaced their per-sample np.sin
+    samples = {}
+    for name in ("C4", "kick", "snare"):
+        sr, data = read(f"{sample_folder}/{name}.wav")
+        samples[name] = (sr, data.astype(np.float32) / 32768.0)
+
+    beats_per_sec = bpm / 60
+    total_measures = max(1, int(duration_sec / (4 / beats_per_sec)))
+    num_samples = int(sample_rate * total_measures * 4 / beats_per_sec)
+    beats_total = total_measures * 4
+    beat_samples = int(sample_rate / beats_per_sec)
+
+    drums = np.zeros(num_samples)
+    for i in range(beats_total):
+        start = i * beat_samples
+        end = min(start + beat_samples, num_samples)
+        for stem, beat_in_measure in (("kick", 0), ("snare", 2)):
+            if i % 4 == beat_in_measure:
+                hit = samples[stem][1][:end - start]
+                drums[start:start + len(hit)] += hit
+
+    melody = np.zeros(num_samples)
+    full_melody = (melody_notes * (beats_total // len(melody_notes) + 1))[:beats_total]
+    note_duration_sec = 60 / bpm
+    data = samples["C4"][1]
+    for i, midi_note in enumerate(full_melody):
+        freq = 440.0 * (2 ** ((midi_note - 69) / 12))
+        start = int(i * note_duration_sec * sample_rate)
+        end = min(start + int(note_duration_sec * sample_rate), num_samples)
+        tone = np.zeros(end - start)
+        # The C4 root is now the exact equal-tempered 261.626 Hz rather than the old table's 261.63
+        shifted = resample(data, int(len(data) / (freq / C4_HZ)))[:end - start]
+        tone[:len(shifted)] = shifted
+        # Each note overwrites whatever the previous one left in its span
+        melody[start:end] = tone
+    return drums, 0.8 * melody
+
+
+def render(renderer, bpm, melody_notes, duration_sec, energy="Moderate"):
+    random.seed(7)
+    return renderer.generate_song_audio(bpm, melody_notes=melody_notes, duration_sec=duration_sec, energy=energy)
+
+
+@pytest.mark.parametrize("bpm", [60, 90, 100, 128, 140])
+def test_stems_match_original_loops(c4_samples, bpm):
+    # At 90 BPM a note lasts a fractional number of samples, so neighbouring notes must not overlap
+    arrangement = AudioRenderer(sample_folder=c4_samples)._compile_arrangement(bpm, MELODY, 12)
+    drums, melody = reference_stems(c4_samples, bpm, MELODY, 12)
+    assert arrangement.num_samples == len(melody)
+    rendered = {stem: render_stem(arrangement, stem, np.zeros(len(melody), dtype=np.float32))
+                for stem in ("kick", "snare", "melody")}
+    np.testing.assert_allclose(rendered["kick"] + rendered["snare"], drums, atol=1e-6)
+    np.testing.assert_allclose(rendered["melody"], melody, atol=1e-4)
+
+
+@pytest.mark.parametrize("options", [{}, {"loop_mode": True, "phase_lock": True}, {"phase_lock": True}])
+def test_streaming_matches_full_render(c4_samples, options):
+    renderer = AudioRenderer(sample_folder=c4_samples, **options)
+    full = render(renderer, 90, MELODY, 20)
+    random.seed(7)
+    blocks = list(renderer.iter_song_blocks(90, melody_notes=MELODY, duration_sec=20, block_size=4096))
+    assert all(len(block) == 4096 for block in blocks[:-1])
+    np.testing.assert_array_equal(np.concatenate(blocks), full)
+
+
+@pytest.mark.parametrize("bpm", [73, 128])
+def test_streamed_wav_bytes_match_one_shot_export(c4_samples, bpm):
+    renderer = AudioRenderer(sample_folder=c4_samples)
+    one_shot = renderer.export_wav(render(renderer, bpm, MELODY, 20)).getvalue()
+    random.seed(7)
+    streamed = b"".join(bytes(chunk) for chunk in renderer.iter_song_wav(bpm, melody_notes=MELODY, duration_sec=20,
+                                                                         block_size=16384))
+    assert streamed == one_shot
+
+
+def test_headroom_stream_starts_without_a_pre_pass(c4_samples, monkeypatch):
+    import audio_renderer
+    windows = []
+    mix_window = audio_renderer.mix_window
+
+    def counting_mix_window(arrangement, start, end, out=None):
+        windows.append((start, end))
+        return mix_window(arrangement, start, end, out)
+
+    monkeypatch.setattr(audio_renderer, "mix_window", counting_mix_window)
+    renderer = AudioRenderer(sample_folder=c4_samples)
+
+    next(renderer.iter_song_blocks(90, melody_notes=MELODY, duration_sec=600, block_size=4096))
+    assert len(windows) > 100
+    windows.clear()
+    first = next(renderer.iter_song_blocks(90, melody_notes=MELODY, duration_sec=600, block_size=4096,
+                                           normalize="headroom"))
+    assert windows == [(0, 4096)] and len(first) == 4096
+
+
+def test_headroom_bounds_the_mix(c4_samples):
+    renderer = AudioRenderer(sample_folder=c4_samples)
+    for bpm in (60, 90, 140):
+        random.seed(7)
+        blocks = renderer.iter_song_blocks(bpm, melody_notes=MELODY, duration_sec=30, dtype=np.float32,
+                                           normalize="headroom")
+        peak = max(float(np.abs(block).max()) for block in blocks)
+        assert 0.5 < peak <= 1.0
+
+
+def test_parallel_mix_matches_serial(c4_samples):
+    serial = render(AudioRenderer(sample_folder=c4_samples), 90, MELODY, 20)
+    parallel = AudioRenderer(sample_folder=c4_samples, render_workers=4, segment_samples=20000)
+    try:
+        np.testing.assert_array_equal(render(parallel, 90, MELODY, 20), serial)
+    finally:
+        parallel.render_pool.shutdown()
+
+
+def test_copies_on_several_threads_share_one_preview_renderer(c4_samples):
+    # The app's script thread and its full-render worker both reach the preview renderers through copies
+    renderer = AudioRenderer(sample_folder=c4_samples)
+    copies = [renderer.with_profiler(None) for _ in range(8)]
+    barrier = threading.Barrier(len(copies))
+
+    def preview(copy):
+        barrier.wait()
+        return copy.preview_renderer()
+
+    with ThreadPoolExecutor(len(copies)) as pool:
+        previews = list(pool.map(preview, copies))
+    assert all(preview is previews[0] for preview in previews)
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from markov_melody import MarkovModel, count_transitions
+
+
+def dense(model):
+    transitions = np.zeros((model.num_contexts, model.num_degrees))
+    rows = np.repeat(np.arange(model.num_contexts), np.diff(model.indptr))
+    transitions[rows, model.indices] = model.probs
+    return transitions
+
+
+def test_from_dense_round_trip():
+    transitions = np.array([[0.5, 0.5, 0.0], [0.0, 0.0, 1.0], [0.2, 0.3, 0.5]])
+    model = MarkovModel.from_dense(transitions)
+    np.testing.assert_array_equal(model.indptr, [0, 2, 3, 6])
+    np.testing.assert_array_equal(dense(model), transitions)
+
+
+def test_from_counts_normalizes_and_backs_off():
+    # Order 2 over 3 degrees; only contexts ending in degree 0 or 1 are seen
+    counts = np.zeros((9, 3))
+    counts[0] = [1, 3, 0]  # context (0, 0)
+    counts[4] = [0, 2, 2]  # context (1, 1)
+    model = MarkovModel.from_counts(counts, 3, order=2)
+    transitions = dense(model)
+    np.testing.assert_allclose(transitions[0], [0.25, 0.75, 0.0])
+    np.testing.assert_allclose(transitions[4], [0.0, 0.5, 0.5])
+    # Unseen (1, 0) backs off to everything seen after degree 0, (0, 2) to a uniform row
+    np.testing.assert_allclose(transitions[3], [0.25, 0.75, 0.0])
+    np.testing.assert_allclose(transitions[2], [1 / 3] * 3)
+
+
+def test_fit_counts_every_window():
+    counts = count_transitions([[0, 1, 1, 2], [2, 0]], num_degrees=3, order=1).reshape(3, 3)
+    np.testing.assert_array_equal(counts, [[0, 1, 0], [0, 1, 1], [1, 0, 0]])
+
+
+@pytest.mark.parametrize("order", [1, 2])
+def test_sampler_follows_the_transition_probabilities(order):
+    rng = np.random.default_rng(0)
+    counts = rng.integers(0, 5, size=(4 ** order, 4)) * (rng.random((4 ** order, 4)) < 0.7)
+    model = MarkovModel.from_counts(counts, 4, order)
+    start = 2
+    context = int(model.start_context(start))
+    degrees = model.sample(200000, 2, start, np.random.default_rng(1))
+    frequencies = np.bincount(degrees[:, 1], minlength=4) / len(degrees)
+    np.testing.assert_allclose(frequencies, dense(model)[context], atol=0.005)
+
+
+def test_single_chain_walk_matches_the_batch_sampler():
+    model = MarkovModel.from_counts(np.random.default_rng(2).integers(0, 4, size=(49, 7)), 7, order=2)
+    single = model.sample(1, 64, 3, np.random.default_rng(5))[0]
+    # Replaying the single chain's uniforms through the searchsorted path gives the same notes
+    uniforms = np.random.default_rng(5).random((63, 1))
+    batch = model.sample(2, 64, 3, _Replay(np.hstack([uniforms, uniforms])))
+    np.testing.assert_array_equal(batch[0], single)
+    np.testing.assert_array_equal(batch[1], single)
+
+
+class _Replay:
+    def __init__(self, uniforms):
+        self.uniforms = uniforms
+
+    def random(self, shape):
+        assert shape == self.uniforms.shape
+        return self.uniforms
+
+
+def test_binary_round_trip_maps_the_stored_cdf(tmp_path, monkeypatch):
+    model = MarkovModel.from_counts(np.random.default_rng(3).integers(0, 3, size=(49, 7)), 7, order=2)
+    path = str(tmp_path / "model.mrmk")
+    model.save_binary(path)
+
+    def rebuilt(self, row_lengths):
+        raise AssertionError("load_binary rebuilt the CDF instead of mapping it")
+
+    monkeypatch.setattr(MarkovModel, "_build_cdf", rebuilt)
+    loaded = MarkovModel.load_binary(path)
+    assert (loaded.num_degrees, loaded.order) == (7, 2)
+    for name in ("indptr", "indices", "probs", "cdf"):
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(model, name))
+    assert isinstance(loaded.cdf.base, np.memmap)
+    np.testing.assert_array_equal(loaded.sample(50, 32, 3, np.random.default_rng(4)),
+                                  model.sample(50, 32, 3, np.random.default_rng(4)))
+
+
+def test_compressed_round_trip(tmp_path):
+    model = MarkovModel.from_steps(7, {-1: 0.3, 0: 0.4, 1: 0.3})
+    path = str(tmp_path / "model.npz")
+    model.save(path)
+    loaded = MarkovModel.load(path)
+    np.testing.assert_array_equal(loaded.indices, model.indices)
+    np.testing.assert_allclose(loaded.probs, model.probs, rtol=1e-7)
@@ -0,0 +1,15 @@
+import numpy as np
+import pytest
+
+from motif_melody import MotifMelodyGenerator
+
+C_MAJOR = [60, 62, 64, 65, 67, 69, 71]
+
+
+@pytest.mark.parametrize("length", [4, 16, 33])
+def test_batch_rows_match_scalar_calls(length):
+    batch = MotifMelodyGenerator(C_MAJOR, seed=11).generate_melodies(5, length)
+    scalar = MotifMelodyGenerator(C_MAJOR, seed=11)
+    assert np.asarray(batch).shape == (5, length)
+    for row in batch:
+        assert list(row) == scalar.generate_melody(length)
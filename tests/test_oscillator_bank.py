@@ -0,0 +1,61 @@
+import random
+
+import numpy as np
+import pytest
+
+from audio_renderer import AudioRenderer
+from event_table import render_stem
+from oscillator_bank import OscillatorBank
+
+
+def reference_pad(renderer, bpm, duration_sec, progression):
+    # The original pad loop: three sines per beat read off one song-long time axis
+    beats_per_sec = bpm / 60
+    total_measures = max(1, int(duration_sec / (4 / beats_per_sec)))
+    final_duration_sec = total_measures * 4 / beats_per_sec
+    t = np.linspace(0, final_duration_sec, int(renderer.sample_rate * final_duration_sec), endpoint=False)
+    beat_samples = int(renderer.sample_rate / beats_per_sec)
+    pad = np.zeros_like(t)
+    for i in range(total_measures * 4):
+        start, end = i * beat_samples, min((i + 1) * beat_samples, len(t))
+        for f in renderer._chord_to_frequencies(progression[i % len(progression)]):
+            pad[start:end] += 0.1 * np.sin(2 * np.pi * f * t[start:end])
+    return pad
+
+
+@pytest.mark.parametrize("bpm", [60, 90, 128])
+def test_default_pad_matches_sine_pad(c4_samples, bpm):
+    renderer = AudioRenderer(sample_folder=c4_samples)
+    random.seed(3)
+    arrangement = renderer._compile_arrangement(bpm, None, 30)
+    random.seed(3)
+    expected = reference_pad(renderer, bpm, 30, renderer._select_progression("Moderate"))
+    pad = render_stem(arrangement, "pad", np.zeros(arrangement.num_samples, dtype=np.float32))
+    assert len(pad) == len(expected)
+    # Wavetable lookup without interpolation is within 2 pi / 16384 of the sine for each of the three voices
+    np.testing.assert_allclose(pad, expected, atol=5e-4)
+
+
+def test_pad_matches_sine_pad_in_later_windows(c4_samples):
+    renderer = AudioRenderer(sample_folder=c4_samples)
+    random.seed(3)
+    arrangement = renderer._compile_arrangement(100, None, 30)
+    random.seed(3)
+    expected = reference_pad(renderer, 100, 30, renderer._select_progression("Moderate"))
+    start = 1_000_003
+    window = render_stem(arrangement, "pad", np.zeros(5000, dtype=np.float32), start)
+    np.testing.assert_allclose(window, expected[start:start + 5000], atol=5e-4)
+
+
+def test_block_bank_never_exceeds_max_blocks():
+    bank = OscillatorBank(phase_lock=True, max_blocks=4)
+    for chord in range(10):
+        keys = np.array([[220.0 + chord, 0.1, 100], [330.0 + chord, 0.1, 100]])
+        blocks, ids = bank.block_bank(keys, 1)
+        assert len(bank.blocks.buffers) <= 4
+        assert [blocks.ids[tuple(key)] for key in keys] == ids.tolist()
+
+    oversized = np.array([[100.0 + i, 0.1, 50] for i in range(6)])
+    blocks, ids = bank.block_bank(oversized, 1)
+    assert len(ids) == 6 and len(blocks.buffers) == 6
+    assert len(bank.blocks.buffers) <= 4
@@ -0,0 +1,50 @@
+import time
+
+import numpy as np
+
+from audio_renderer import AudioRenderer
+from realtime import NullSink, RealtimePlayer, RingBuffer
+
+
+def test_ring_buffer_wraps_around():
+    ring = RingBuffer(8, channels=2)
+    out = np.zeros((5, 2), dtype=np.float32)
+    for start in range(0, 30, 5):
+        block = np.arange(start, start + 5, dtype=np.float32)[:, None].repeat(2, axis=1)
+        assert ring.write(block) == 5
+        assert ring.read(out) == 5
+        np.testing.assert_array_equal(out, block)
+    assert ring.write(np.zeros((10, 2))) == 8 and ring.space() == 0
+
+
+def test_hour_changes_switch_at_measure_boundaries_without_underruns(c4_samples):
+    renderer = AudioRenderer(sample_folder=c4_samples)
+    sink = None
+
+    def clock():
+        # The hour advances every 1.5 s of audio played
+        played = sink.frames if sink is not None else 0
+        return (8 + int(played / renderer.sample_rate / 1.5)) % 24
+
+    player = RealtimePlayer(renderer, clock=clock, block_size=1024, buffer_sec=1.0, song_sec=300)
+    sink = NullSink(player, 512)
+    # Imports, sample loading and melody generation are one-off costs, not part of a switch
+    renderer.generate_song_audio(120, melody_notes=[60, 64, 67], duration_sec=2)
+    for hour in (8, 9, 10):
+        player.plan(hour)
+    with player:
+        while player.ring.space() >= player.block_size and player.error is None:
+            time.sleep(0.01)
+        sink.run(5.0)
+    stats = player.stats()
+
+    assert stats["error"] is None
+    assert stats["underruns"] == 0
+    # The NullSink shares the GIL with the producer, so a stall can hide from the underrun count; a block
+    # that took longer than the ring holds would have starved a real device
+    assert stats["max_render_sec"] < stats["capacity_frames"] / stats["sample_rate"] / 4
+    hours = [song["hour"] for song in player.songs]
+    assert hours[:3] == [8, 9, 10]
+    for song, following in zip(player.songs, player.songs[1:]):
+        measure = 4 * int(renderer.sample_rate / (song["bpm"] / 60))
+        assert (following["frame"] - song["frame"]) % measure == 0
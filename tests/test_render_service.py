@@ -0,0 +1,17 @@
+from render_cache import RenderCache, make_cache_key
+from render_service import RenderService
+
+
+def test_stream_cache_key_differs_from_app_key(tmp_path):
+    # Streams are headroom-normalized, so they must never be served for the app's peak-normalized renders
+    service = RenderService(workers=1, cache=RenderCache(cache_dir=str(tmp_path)))
+    try:
+        key, renderer_name, program, song_params = service.parse_request("hour=9&duration=20&seed=3")
+    finally:
+        service.executor.shutdown()
+    # The seed travels with the song parameters, so the renderer draws its jitter from the keyed seed
+    assert song_params["seed"] == 3
+    app_key = make_cache_key(kind="wav", renderer=renderer_name, program=program, **song_params)
+    assert key != app_key
+    assert key == make_cache_key(kind="wav", normalize="headroom", renderer=renderer_name, program=program,
+                                 **song_params)
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from mood_schedule import DEFAULT_SCHEDULE, allowed_activities, plan_hour
+from schedule_planner import encode_activities, plan_schedules
+
+
+def activity_mixes():
+    rng = np.random.default_rng(0)
+    mixes = [list(DEFAULT_SCHEDULE)]
+    mixes += [[activity] * 24 for activity in allowed_activities]
+    # Rotations put every activity at every hour
+    mixes += [[allowed_activities[(hour + shift) % len(allowed_activities)] for hour in range(24)]
+              for shift in range(len(allowed_activities))]
+    mixes += [list(rng.choice(allowed_activities, 24)) for _ in range(20)]
+    return mixes
+
+
+def test_plan_matches_the_per_hour_rules():
+    schedules = activity_mixes()
+    plan = plan_schedules(schedules)
+    assert len(plan) == len(schedules)
+    for user, schedule in enumerate(schedules):
+        expected = [plan_hour(hour, activity) for hour, activity in enumerate(schedule)]
+        assert plan.rows(user) == expected
+        assert plan.bpm[user].tolist() == [row["bpm"] for row in expected]
+        assert plan.key_root[user].tolist() == [row["key_root"] for row in expected]
+        assert plan.scale_type[user].tolist() == [row["scale_type"] for row in expected]
+
+
+def test_single_schedule_and_codes_plan_alike():
+    codes = encode_activities(DEFAULT_SCHEDULE)
+    assert codes.shape == (1, 24)
+    assert [allowed_activities[code] for code in codes[0]] == DEFAULT_SCHEDULE
+    assert plan_schedules(codes).rows() == plan_schedules(DEFAULT_SCHEDULE).rows()
+
+
+@pytest.mark.parametrize("schedule", [
+    DEFAULT_SCHEDULE[:23],
+    DEFAULT_SCHEDULE[:23] + ["nap"],
+    [len(allowed_activities)] * 24,
+])
+def test_bad_schedules_are_rejected(schedule):
+    with pytest.raises(ValueError):
+        encode_activities(schedule)
+
+
+def test_render_jobs_cover_every_user_hour():
+    schedules = activity_mixes()
+    plan = plan_schedules(schedules)
+    jobs, job_index = plan.render_jobs(melody_length=8, duration_sec=10)
+    assert job_index.shape == (len(schedules), 24)
+    for user, schedule in enumerate(schedules):
+        for hour, activity in enumerate(schedule):
+            job, expected = jobs[job_index[user, hour]], plan_hour(hour, activity)
+            assert {key: job[key] for key in ("bpm", "key_root", "scale_type", "energy")} == \
+                {key: expected[key] for key in ("bpm", "key_root", "scale_type", "energy")}
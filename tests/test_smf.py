@@ -0,0 +1,89 @@
+import io
+
+import numpy as np
+import pytest
+
+import smf_writer
+from midi_generator import MidiGenerator
+from smf_reader import SmfError, parse_track, read_smf, read_vlq
+from smf_writer import NOTE_OFF, NOTE_ON, PROGRAM_CHANGE, encode_track, encode_vlq, make_track_events
+
+MELODY = [60, 62, 64, 65, 67, 69, 71, 72]
+VLQ_CASES = [
+    (0, b"\x00"),
+    (0x7F, b"\x7f"),
+    (0x80, b"\x81\x00"),
+    (0x3FFF, b"\xff\x7f"),
+    (0x4000, b"\x81\x80\x00"),
+    (0x1FFFFF, b"\xff\xff\x7f"),
+    (0x200000, b"\x81\x80\x80\x00"),
+    (0x0FFFFFFF, b"\xff\xff\xff\x7f"),
+]
+
+
+@pytest.mark.parametrize("value, encoded", VLQ_CASES)
+def test_vlq_boundaries(value, encoded):
+    groups, used = encode_vlq([value])
+    assert groups[used].tobytes() == encoded
+    assert read_vlq(encoded + b"\x42", 0) == (value, len(encoded))
+
+
+def test_vlq_column_encodes_every_row():
+    # A whole column at once, as encode_track uses it: the masked bytes are the encodings back to back
+    groups, used = encode_vlq([value for value, _ in VLQ_CASES])
+    assert groups[used].tobytes() == b"".join(encoded for _, encoded in VLQ_CASES)
+
+
+def test_truncated_vlq_is_an_smf_error():
+    with pytest.raises(SmfError):
+        read_vlq(b"\x81\x80", 0)
+
+
+def test_running_status_drops_repeated_status_bytes():
+    events = np.concatenate([
+        make_track_events([0], PROGRAM_CHANGE | 1, 89),
+        make_track_events([0, 0, 0x80], NOTE_ON | 1, [60, 64, 67], 100),
+        make_track_events([0x80 + 0x4000], NOTE_OFF | 1, 60),
+        make_track_events([0x80 + 0x4000], NOTE_ON | 1, 72, 90),
+    ])
+    chunk = encode_track(events)
+    body = chunk[8:]
+    assert body == (b"\x00\xc1\x59"                      # program change: one data byte
+                    b"\x00\x91\x3c\x64" b"\x00\x40\x64"  # second note-on reuses the status
+                    b"\x81\x00\x43\x64"                  # delta 0x80, still running
+                    b"\x81\x80\x00\x81\x3c\x00"          # note-off (sorted first) changes the status
+                    b"\x00\x91\x48\x5a"                  # and the note-on has to send it again
+                    b"\x00\xff\x2f\x00")
+    parsed = parse_track(memoryview(body), [])
+    order = np.lexsort((smf_writer._TICK_PRIORITY[events["status"] >> 4], events["tick"]))
+    np.testing.assert_array_equal(parsed, events[order])
+
+
+def test_export_arrangement_round_trip():
+    generator = MidiGenerator(bpm=96, seed=0)
+    data = generator.export_arrangement(MELODY, duration_sec=20, energy="High").getvalue()
+    smf = read_smf(data)
+    assert smf.ticks_per_beat == generator.ticks_per_beat
+    expected = generator.arrangement_tracks(MELODY, duration_sec=20, energy="High")
+    # The conductor track has no channel messages; the rest come back sorted as written
+    assert len(smf.tracks) == 1 + len(expected)
+    assert len(smf.tracks[0]) == 0
+    for track, events in zip(smf.tracks[1:], expected.values()):
+        order = np.lexsort((smf_writer._TICK_PRIORITY[events["status"] >> 4], events["tick"]))
+        np.testing.assert_array_equal(track, events[order])
+
+
+def test_export_arrangement_reads_back_in_mido():
+    mido = pytest.importorskip("mido")
+    generator = MidiGenerator(bpm=96, seed=0)
+    data = generator.export_arrangement(MELODY, duration_sec=20).getvalue()
+    midi = mido.MidiFile(file=io.BytesIO(data))
+    tempo = [message.tempo for message in midi.tracks[0] if message.type == "set_tempo"]
+    assert tempo == [round(60_000_000 / 96)]
+    smf = read_smf(data)
+    for mido_track, track in zip(midi.tracks[1:], smf.tracks[1:]):
+        messages = [message for message in mido_track if not message.is_meta]
+        assert len(messages) == len(track)
+        ticks = np.cumsum([message.time for message in mido_track])[[not m.is_meta for m in mido_track]]
+        np.testing.assert_array_equal(ticks, track["tick"])
+        assert [message.bytes()[0] for message in messages] == track["status"].tolist()
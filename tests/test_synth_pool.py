@@ -0,0 +1,93 @@
+import queue
+import threading
+
+import pytest
+
+import synth_pool
+from synth_pool import SynthPool
+
+
+class FakeSynth:
+    # Stands in for PooledSynth; reset fails while fail_resets is positive
+    created = []
+    fail_resets = 0
+
+    def __init__(self, soundfont_path, sample_rate):
+        self.deleted = False
+        FakeSynth.created.append(self)
+
+    def reset(self, bank, program):
+        if FakeSynth.fail_resets:
+            FakeSynth.fail_resets -= 1
+            raise RuntimeError("synth did not reset")
+
+    def delete(self):
+        self.deleted = True
+
+
+@pytest.fixture
+def fake_synths(monkeypatch):
+    monkeypatch.setattr(synth_pool, "PooledSynth", FakeSynth)
+    FakeSynth.created, FakeSynth.fail_resets = [], 0
+    return FakeSynth
+
+
+def test_checkout_reuses_idle_synths(fake_synths):
+    pool = SynthPool(size=2)
+    with pool.synth() as first:
+        pass
+    with pool.synth() as second:
+        assert second is first
+    assert len(fake_synths.created) == 1
+
+
+def test_failed_reset_of_a_new_synth_keeps_the_pool_size(fake_synths):
+    pool = SynthPool(size=1)
+    fake_synths.fail_resets = 1
+    with pytest.raises(RuntimeError):
+        pool.checkout()
+    assert fake_synths.created[0].deleted
+    # The replacement is ready at once; without it a size-1 pool would block here for good
+    synth = pool.checkout(timeout=0.1)
+    assert synth is fake_synths.created[1] and not synth.deleted
+
+
+def test_failed_reset_of_an_idle_synth_wakes_a_waiting_session(fake_synths):
+    pool = SynthPool(size=1)
+    held = pool.checkout()
+    results = []
+
+    def wait_for_synth():
+        try:
+            results.append(pool.checkout(timeout=5))
+        except Exception as exc:
+            results.append(exc)
+
+    waiters = [threading.Thread(target=wait_for_synth) for _ in range(2)]
+    for waiter in waiters:
+        waiter.start()
+    # Whichever session gets the returned synth sees its reset fail; the other gets the replacement
+    fake_synths.fail_resets = 1
+    pool.checkin(held)
+    for waiter in waiters:
+        waiter.join(5)
+    assert held.deleted and len(fake_synths.created) == 2
+    assert sorted(type(result).__name__ for result in results) == ["FakeSynth", "RuntimeError"]
+
+
+def test_slot_is_freed_when_no_replacement_can_be_built(fake_synths, monkeypatch):
+    pool = SynthPool(size=1)
+    fake_synths.fail_resets = 1
+
+    def broken(soundfont_path, sample_rate):
+        raise OSError("SoundFont went away")
+
+    synth = FakeSynth("sf2", 44100)
+    pool._created = 1
+    pool._idle.put(synth)
+    monkeypatch.setattr(synth_pool, "PooledSynth", broken)
+    with pytest.raises(RuntimeError):
+        pool.checkout()
+    assert synth.deleted and pool._created == 0
+    with pytest.raises(queue.Empty):
+        pool._idle.get_nowait()
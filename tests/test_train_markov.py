@@ -0,0 +1,102 @@
+import json
+import os
+
+import numpy as np
+
+import train_markov
+from markov_melody import count_transitions
+from midi_generator import MidiGenerator
+from train_markov import NUM_DEGREES, SCALE_TYPES, extract_degrees, load_trained_model, train
+
+MELODIES = [
+    [60, 62, 64, 65, 67, 65, 64, 62],
+    [67, 65, 64, 62, 60, 62, 64, 67, 69, 67],
+    [60, 64, 67, 72, 67, 64, 60, 62, 64, 65],
+]
+
+
+def write_song(path, melody, seed=0):
+    with open(path, "wb") as f:
+        f.write(MidiGenerator(bpm=120, seed=seed).export_arrangement(melody, duration_sec=8).getvalue())
+
+
+def expected_counts(paths, order=1):
+    # Counts of every file parsed on its own, summed per scale type
+    counts = {scale_type: np.zeros(NUM_DEGREES ** (order + 1), dtype=np.int64) for scale_type in SCALE_TYPES}
+    for path in paths:
+        with open(path, "rb") as f:
+            sequences, _, scale_type = extract_degrees(f.read())
+        if scale_type is not None:
+            counts[scale_type] += count_transitions(sequences, NUM_DEGREES, order)
+    return counts
+
+
+def index_counts(model_dir):
+    with open(os.path.join(model_dir, "index.json"), encoding="utf-8") as f:
+        index = json.load(f)
+    return index, {scale_type: np.array(index["counts"][scale_type]) for scale_type in SCALE_TYPES}
+
+
+def assert_counts_equal(actual, expected):
+    for scale_type in SCALE_TYPES:
+        np.testing.assert_array_equal(actual[scale_type], expected[scale_type])
+
+
+def test_rerun_skips_unchanged_files_and_recounts_changed_ones(tmp_path):
+    corpus, model_dir = tmp_path / "corpus", str(tmp_path / "models")
+    corpus.mkdir()
+    paths = [str(corpus / f"song{i}.mid") for i in range(len(MELODIES))]
+    for path, melody in zip(paths, MELODIES):
+        write_song(path, melody)
+
+    first = train(str(corpus), model_dir, order=1, workers=1)
+    assert first["new_files"] == 3 and first["failed_files"] == 0
+    index, counts = index_counts(model_dir)
+    assert_counts_equal(counts, expected_counts(paths))
+    assert sorted(record["path"] for record in index["files"].values()) == paths
+
+    second = train(str(corpus), model_dir, order=1, workers=1)
+    assert second["new_files"] == 0 and second["indexed_files"] == 3
+    assert_counts_equal(index_counts(model_dir)[1], counts)
+
+    # New content is counted on top; counts of the old content stay until a rebuild. The new file is longer,
+    # so the stat cache notices it even where mtimes are coarse
+    old_counts = expected_counts(paths[:1])
+    write_song(paths[0], list(reversed(MELODIES[0])) + [69, 71])
+    third = train(str(corpus), model_dir, order=1, workers=1)
+    assert third["new_files"] == 1 and third["indexed_files"] == 4
+    expected = expected_counts(paths)
+    for scale_type in SCALE_TYPES:
+        expected[scale_type] += old_counts[scale_type]
+    assert_counts_equal(index_counts(model_dir)[1], expected)
+
+    rebuilt = train(str(corpus), model_dir, order=1, workers=1, rebuild=True)
+    assert rebuilt["new_files"] == 3 and rebuilt["indexed_files"] == 3
+    assert_counts_equal(index_counts(model_dir)[1], expected_counts(paths))
+
+    for scale_type, transitions in rebuilt["transitions"].items():
+        assert transitions == int(expected_counts(paths)[scale_type].sum())
+        assert load_trained_model(model_dir, scale_type).order == 1
+
+
+def test_any_parse_failure_is_recorded_per_file(tmp_path, monkeypatch):
+    corpus, model_dir = tmp_path / "corpus", str(tmp_path / "models")
+    corpus.mkdir()
+    good, bad = str(corpus / "good.mid"), str(corpus / "bad.mid")
+    write_song(good, MELODIES[0])
+    write_song(bad, MELODIES[1])
+    with open(bad, "rb") as f:
+        bad_data = f.read()
+
+    def extract(data):
+        if data == bad_data:
+            raise IndexError("track chunk ends inside an event")
+        return extract_degrees(data)
+
+    monkeypatch.setattr(train_markov, "extract_degrees", extract)
+    summary = train(str(corpus), model_dir, order=1, workers=1)
+    assert summary["new_files"] == 2 and summary["failed_files"] == 1
+    index, counts = index_counts(model_dir)
+    errors = [record["error"] for record in index["files"].values() if "error" in record]
+    assert errors == ["IndexError: track chunk ends inside an event"]
+    assert_counts_equal(counts, expected_counts([good]))
@@ -0,0 +1,244 @@
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from markov_melody import MarkovModel, count_transitions
+from midi_generator import MidiGenerator
+from smf_reader import read_smf
+
+INDEX_VERSION = 2
+DRUM_CHANNEL = 9
+MIN_LINE_NOTES = 8
+MIDI_EXTENSIONS = (".mid", ".midi", ".smf")
+SCALE_TYPES = tuple(MidiGenerator.SCALES)
+NUM_DEGREES = len(MidiGenerator.SCALES["major"])
+
+
+def _degree_table(intervals):
+    # Scale degree for each semitone above the root; notes outside the scale take the degree below them
+    table = np.zeros(12, dtype=np.int64)
+    for degree, interval in enumerate(intervals):
+        table[interval:] = degree
+    return table
+
+
+DEGREE_TABLES = {scale_type: _degree_table(intervals) for scale_type, intervals in MidiGenerator.SCALES.items()}
+# Pitch-class membership of every (root, scale type), used to guess the key of files without a key signature
+SCALE_MASKS = {
+    scale_type: np.array([np.isin(np.arange(12), (root + np.array(intervals)) % 12) for root in range(12)])
+    for scale_type, intervals in MidiGenerator.SCALES.items()
+}
+
+
+def melody_lines(smf):
+    # Skyline of every pitched track: the highest note starting at each tick
+    lines = []
+    for track in range(len(smf.tracks)):
+        notes = smf.note_ons(track)
+        notes = notes[(notes["status"] & 0x0F) != DRUM_CHANNEL]
+        if len(notes) < MIN_LINE_NOTES:
+            continue
+        order = np.lexsort((-notes["data1"].astype(np.int64), notes["tick"]))
+        notes = notes[order]
+        first_at_tick = np.concatenate(([True], notes["tick"][1:] != notes["tick"][:-1]))
+        line = notes["data1"][first_at_tick].astype(np.int64)
+        if len(line) >= MIN_LINE_NOTES:
+            lines.append(line)
+    return lines
+
+
+def detect_key(smf, lines):
+    # (root pitch class, scale type): the file's first key signature, else the best-fitting scale
+    if smf.key_signatures:
+        _, sharps, minor = smf.key_signatures[0]
+        major_root = (7 * sharps) % 12
+        return ((major_root + 9) % 12, "minor") if minor else (major_root, "major")
+    histogram = np.bincount(np.concatenate(lines) % 12, minlength=12)
+    # Ties (e.g. relative major and minor) go to the first scale type, then the lowest root
+    scores = [(int(SCALE_MASKS[scale_type][root] @ histogram), -i, -root, scale_type)
+              for i, scale_type in enumerate(SCALE_TYPES) for root in range(12)]
+    _, _, negative_root, scale_type = max(scores)
+    return -negative_root, scale_type
+
+
+def extract_degrees(data):
+    # Scale-degree sequences of one MIDI file and its key; ([], None, None) when there is no melody
+    smf = read_smf(data)
+    lines = melody_lines(smf)
+    if not lines:
+        return [], None, None
+    root, scale_type = detect_key(smf, lines)
+    table = DEGREE_TABLES[scale_type]
+    return [table[(line - root) % 12] for line in lines], root, scale_type
+
+
+def count_batch(batch, order):
+    # Worker: parse a batch of files and return summed counts per scale type plus one record per file
+    counts = {scale_type: np.zeros(NUM_DEGREES ** (order + 1), dtype=np.int64) for scale_type in SCALE_TYPES}
+    records = []
+    for path, digest in batch:
+        try:
+            with open(path, "rb") as f:
+                sequences, root, scale_type = extract_degrees(f.read())
+        except Exception as exc:
+            # Corrupt files fail in more ways than SmfError (struct, index and value errors from odd chunks);
+            # one bad file is recorded and skipped rather than ending the whole pool run
+            records.append((digest, {"path": path, "error": f"{type(exc).__name__}: {exc}"}))
+            continue
+        record = {"path": path, "notes": int(sum(len(sequence) for sequence in sequences))}
+        if scale_type is not None:
+            counts[scale_type] += count_transitions(sequences, NUM_DEGREES, order)
+            record.update(root=root, scale_type=scale_type)
+        records.append((digest, record))
+    return counts, records
+
+
+def scan_midi_files(corpus_dir):
+    for root, _, files in os.walk(corpus_dir):
+        for filename in sorted(files):
+            if filename.lower().endswith(MIDI_EXTENSIONS):
+                yield os.path.join(root, filename)
+
+
+def file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def model_path(model_dir, scale_type):
+    return os.path.join(model_dir, f"{scale_type}.mrmk")
+
+
+def load_trained_model(model_dir, scale_type):
+    # None when no model has been trained for this scale type
+    path = model_path(model_dir, scale_type)
+    return MarkovModel.load_binary(path) if os.path.exists(path) else None
+
+
+class TrainingIndex:
+    # What has been counted so far: file records by content hash, a stat cache so unchanged files are not
+    # re-hashed, and the raw transition counts per scale type that new files are added to. Counts only
+    # grow: every distinct file content ever seen stays in the model until a rebuild
+    def __init__(self, model_dir, order, rebuild=False):
+        self.model_dir = model_dir
+        self.order = order
+        self.files = {}
+        self.stats = {}
+        self.counts = {scale_type: np.zeros(NUM_DEGREES ** (order + 1), dtype=np.int64) for scale_type in SCALE_TYPES}
+        if not rebuild:
+            self._load()
+
+    def _index_path(self):
+        return os.path.join(self.model_dir, "index.json")
+
+    def _load(self):
+        if not os.path.exists(self._index_path()):
+            return
+        with open(self._index_path(), encoding="utf-8") as f:
+            index = json.load(f)
+        # A different order or format means different counts; start over rather than mixing them
+        if index.get("version") != INDEX_VERSION or index.get("order") != self.order:
+            return
+        self.counts = {scale_type: np.array(index["counts"][scale_type], dtype=np.int64) for scale_type in SCALE_TYPES}
+        self.files = index["files"]
+        self.stats = index["stats"]
+
+    def digest(self, path):
+        stat = os.stat(path)
+        cached = self.stats.get(path)
+        if cached and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return cached[2]
+        digest = file_digest(path)
+        self.stats[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def save(self):
+        os.makedirs(self.model_dir, exist_ok=True)
+        # Counts live in the index itself and the file is replaced in one step, so an interrupted run never
+        # leaves counts that disagree with the files they were counted from
+        counts = {scale_type: self.counts[scale_type].tolist() for scale_type in SCALE_TYPES}
+        fd, tmp_path = tempfile.mkstemp(dir=self.model_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"version": INDEX_VERSION, "order": self.order, "files": self.files, "stats": self.stats,
+                           "counts": counts}, f)
+            os.replace(tmp_path, self._index_path())
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+
+def train(corpus_dir, model_dir, order=2, smoothing=0.0, workers=None, batch_size=64, rebuild=False):
+    start = time.perf_counter()
+    index = TrainingIndex(model_dir, order, rebuild)
+
+    pending, queued = [], set()
+    paths = list(scan_midi_files(corpus_dir))
+    # Stat entries of files under this corpus that are gone would otherwise pile up across runs
+    prefix, present = os.path.join(corpus_dir, ""), set(paths)
+    for path in [path for path in index.stats if path.startswith(prefix) and path not in present]:
+        del index.stats[path]
+    for path in paths:
+        digest = index.digest(path)
+        if digest not in index.files and digest not in queued:
+            queued.add(digest)
+            pending.append((path, digest))
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+
+    if workers == 1:
+        for batch in batches:
+            _merge(index, *count_batch(batch, order))
+    elif batches:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for counts, records in pool.map(count_batch, batches, [order] * len(batches)):
+                _merge(index, counts, records)
+
+    index.save()
+    trained = {}
+    for scale_type in SCALE_TYPES:
+        if index.counts[scale_type].any():
+            model = MarkovModel.from_counts(index.counts[scale_type], NUM_DEGREES, order, smoothing)
+            model.save_binary(model_path(model_dir, scale_type))
+            trained[scale_type] = int(index.counts[scale_type].sum())
+    return {
+        "new_files": len(pending),
+        "indexed_files": len(index.files),
+        "failed_files": sum("error" in record for record in index.files.values()),
+        "transitions": trained,
+        "wall_sec": round(time.perf_counter() - start, 4),
+    }
+
+
+def _merge(index, counts, records):
+    for scale_type in SCALE_TYPES:
+        index.counts[scale_type] += counts[scale_type]
+    index.files.update(records)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Learn Markov melody models from a directory of MIDI files.")
+    parser.add_argument("corpus_dir")
+    parser.add_argument("--model-dir", default="models")
+    parser.add_argument("--order", type=int, default=2)
+    parser.add_argument("--smoothing", type=float, default=0.0, help="Added to every transition count")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Files parsed per worker task")
+    parser.add_argument("--rebuild", action="store_true", help="Discard the index and recount every file")
+    args = parser.parse_args(argv)
+
+    summary = train(args.corpus_dir, args.model_dir, args.order, args.smoothing, args.workers, args.batch_size,
+                    args.rebuild)
+    print(f"Parsed {summary['new_files']} new files ({summary['indexed_files']} indexed, "
+          f"{summary['failed_files']} unreadable) in {summary['wall_sec']:.2f}s")
+    for scale_type, transitions in summary["transitions"].items():
+        print(f"  {scale_type}: {transitions} transitions -> {model_path(args.model_dir, scale_type)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import struct
+
+import numpy as np
+
+HEADER_BYTES = 44
+# Data size used when the length is not known and the output cannot be seeked back to patch it
+UNKNOWN_SIZE = 0xFFFFFFFF
+PCM_DTYPE = np.dtype("<i2")
+
+
+def wav_header(sample_rate, channels=1, num_frames=None):
+    # 16-bit PCM RIFF header, laid out as scipy.io.wavfile writes it
+    block_align = channels * PCM_DTYPE.itemsize
+    if num_frames is None:
+        data_bytes = riff_bytes = UNKNOWN_SIZE
+    else:
+        data_bytes = num_frames * block_align
+        riff_bytes = min(UNKNOWN_SIZE, HEADER_BYTES - 8 + data_bytes)
+    return (b"RIFF" + struct.pack("<I", riff_bytes) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, sample_rate * block_align,
+                                    block_align, 8 * PCM_DTYPE.itemsize)
+            + b"data" + struct.pack("<I", min(UNKNOWN_SIZE, data_bytes)))
+
+
+class PcmEncoder:
+    # Turns audio blocks into little-endian int16 memoryviews. Float blocks (full scale +-1.0) are
+    # scaled and truncated like (block * 32767).astype(np.int16), but into scratch buffers that are
+    # reused from block to block, so a returned view is only valid until the next encode() call
+    def __init__(self):
+        self._scaled = {}
+        self._pcm = np.empty(0, dtype=PCM_DTYPE)
+
+    def _scratch(self, buffers, dtype, size):
+        buffer = buffers.get(dtype)
+        if buffer is None or len(buffer) < size:
+            buffer = buffers[dtype] = np.empty(size, dtype=dtype)
+        return buffer[:size]
+
+    def encode(self, block):
+        block = np.asarray(block)
+        if block.dtype == PCM_DTYPE:
+            return memoryview(np.ascontiguousarray(block)).cast("B")
+
+        flat = block.reshape(-1)
+        if len(self._pcm) < len(flat):
+            self._pcm = np.empty(len(flat), dtype=PCM_DTYPE)
+        pcm = self._pcm[:len(flat)]
+        if block.dtype.kind == "f":
+            scaled = self._scratch(self._scaled, block.dtype, len(flat))
+            np.multiply(flat, 32767, out=scaled)
+            np.copyto(pcm, scaled, casting="unsafe")
+        else:
+            np.copyto(pcm, flat, casting="unsafe")
+        return memoryview(pcm).cast("B")
+
+
+class WavWriter:
+    # Streams 16-bit PCM to a binary file-like object. The header goes out first; when num_frames is not
+    # given, its sizes are patched on close() if the output is seekable and left as UNKNOWN_SIZE otherwise
+    def __init__(self, fileobj, sample_rate, channels=1, num_frames=None):
+        self.fileobj = fileobj
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.num_frames = num_frames
+        self.frames_written = 0
+        self.encoder = PcmEncoder()
+        self._start = fileobj.tell() if self._seekable() else None
+        fileobj.write(wav_header(sample_rate, channels, num_frames))
+
+    def _seekable(self):
+        seekable = getattr(self.fileobj, "seekable", None)
+        return bool(seekable and seekable())
+
+    def write(self, block):
+        data = self.encoder.encode(block)
+        self.fileobj.write(data)
+        self.frames_written += len(data) // (self.channels * PCM_DTYPE.itemsize)
+
+    def close(self):
+        if self.num_frames is None and self._start is not None:
+            end = self.fileobj.tell()
+            self.fileobj.seek(self._start)
+            self.fileobj.write(wav_header(self.sample_rate, self.channels, self.frames_written))
+            self.fileobj.seek(end)
+        elif self.num_frames is not None and self.frames_written != self.num_frames:
+            raise ValueError(f"WAV header promised {self.num_frames} frames but {self.frames_written} were written")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+
+def write_wav(fileobj, blocks, sample_rate, channels=1, num_frames=None):
+    with WavWriter(fileobj, sample_rate, channels, num_frames) as writer:
+        for block in blocks:
+            writer.write(block)
+    return writer.frames_written
+
+
+def iter_wav_chunks(blocks, sample_rate, channels=1, num_frames=None):
+    # Header bytes, then one memoryview per block; each view is only valid until the next one is requested
+    yield wav_header(sample_rate, channels, num_frames)
+    encoder = PcmEncoder()
+    for block in blocks:
+        yield encoder.encode(block)